@@ -1,6 +1,7 @@
 import logging
 import argparse
 import os
+import sys
 import time
 
 import cv2
@@ -9,15 +10,22 @@ import threading
 from networktables import NetworkTables
 
 from cv2capture import Cv2Capture
-from cv2display import Cv2Display
-from angryprocesses import AngryProcesses
+from processimage import ProcessImage
+from angryprocesses import find_targets, publish_results
+from schedpolicy import policy, apply_policy
 from class_mux import ClassMux
 from mux1n import Mux1N
 from resizesource import ResizeSource
 from overlaysource import OverlaySource
+from stereodepth import StereoDepth
+from framesync import FrameSync
 
 from configs import configs
 
+# runtime.py is one directory up; appended, so the modules here come first
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from runtime import Runtime, CaptureStage, ProcessStage, OutputStage
+
 logging.basicConfig(level=logging.DEBUG)
 
 # used to wait till network tables is initalized
@@ -42,15 +50,28 @@ if __name__ == '__main__':
 						help='First camera index to instantiate', type=int, choices=range(0, 10))
 						
 	parser.add_argument('-proc', '--num-processors', required=False, default=4,
-						help='Number of processors to instantiate', type=int, choices=range(0, 10))
+						help='Number of processors to start with (adjusted at run time if proc_adaptive is configured)',
+						type=int, choices=range(0, 10))
+
+	parser.add_argument('-stereo', '--stereo', help='Publish stereo depth from the first two cameras', action='store_true')
 
 	args = vars(parser.parse_args())
 
+	if args['stereo'] and not os.path.isfile(configs['stereo_calibration']):
+		logging.getLogger("BucketVision").error(
+			"Stereo disabled: no calibration file {} (write one with stereocalibrate.py)".format(
+				configs['stereo_calibration']))
+		args['stereo'] = False
+
 	# don't run in test mode if not specified
 	if not args['test']:
-		from csdisplay import CSDisplay
+		from cscore import CameraServer
 	
 
+	# threads started from here (NetworkTables, cscore) inherit this role;
+	# capture, processing and display threads apply their own
+	policy.apply('other')
+
 	cond = threading.Condition()
 	notified = [False]
 	# init networktables
@@ -75,43 +96,89 @@ if __name__ == '__main__':
 		cap.start()
 		cap.exposure = 10
 
-	source_mux = ClassMux(*source_list)
+	# cameras that are not shown are kept grabbing without decoding, unless
+	# stereo needs them all
+	source_mux = ClassMux(*source_list, standby=not args['stereo'])
 	output_mux = Mux1N(source_mux)
 	process_output = output_mux.create_output()
 	display_output = OverlaySource(ResizeSource(output_mux.create_output(), res=configs['output_res']))
 
 	VisionTable.putString("BucketVisionState", "Started Capture")
 
-	proc_list = list()
-
-	for i in range(args['num_processors']):
-		proc = AngryProcesses(process_output, network_table=VisionTable, debug_label="Proc{}".format(i))
-		proc_list.append(proc)
-		proc.start()
-
+	def publish(frame):
+		publish_results(VisionTable, frame.results, frame.time, frame.seq)
+		VisionTable.putNumber("FrameLatency", time.time() - frame.time)
+
+	# every frame goes to exactly one of the processors (a ProcessImage
+	# each, sized at run time if proc_adaptive is configured), results are
+	# published in frame order
+	proc_runtime = Runtime(CaptureStage(process_output, name="Capture"),
+							ProcessStage(ProcessImage, name="Proc", workers=args['num_processors'],
+										call=find_targets, copy=False, maxAge=configs['proc_max_age'],
+										adaptive=configs['proc_adaptive'], minWorkers=configs['proc_min'],
+										maxWorkers=configs['proc_max'], networkTable=VisionTable),
+							OutputStage(name="Results", callback=publish),
+							threadSetup=apply_policy)
+	proc_runtime.start()
 
 	VisionTable.putString("BucketVisionState", "Started Process")
 
-	if args['test']:
-		window_display = Cv2Display(source=display_output)
-		window_display.start()
-		VisionTable.putString("BucketVisionState", "Started CV2 Display")
-	else:
-		cs_display = CSDisplay(source=display_output, network_table=VisionTable)
-		cs_display.start()
-		VisionTable.putString("BucketVisionState", "Started CS Display")
+	stereo_depth = None
+	if args['stereo'] and len(source_list) >= 2:
+		stereo_sync = FrameSync(source_list[0], source_list[1],
+								tolerance=configs['stereo_sync_tolerance'],
+								network_table=VisionTable)
+		stereo_sync.start()
+		stereo_depth = StereoDepth(stereo_sync, configs['stereo_calibration'],
+									network_table=VisionTable,
+									scale=configs['stereo_scale'],
+									roi=configs['stereo_roi'],
+									num_disparities=configs['stereo_num_disparities'],
+									mode=configs['stereo_mode'],
+									epipolar_tol=configs['stereo_epipolar_tol'],
+									max_age=configs['stereo_max_age'])
+		stereo_depth.start()
+		VisionTable.putString("BucketVisionState", "Started Stereo")
+
+	# the display frames go out through cscore, or in test mode to a cv2
+	# window drawn from the main loop (imshow wants the main thread)
+	display_callback = None
+	if not args['test']:
+		outstream = CameraServer.getInstance().putVideo("Camera0", configs['output_res'][0], configs['output_res'][1])
+		display_callback = lambda frame: outstream.putFrame(frame.image)
+	display_capture = CaptureStage(display_output, name="DisplayCapture")
+	display_capture.role = 'streaming'	# it only resizes and draws for the display
+	display_runtime = Runtime(display_capture,
+								OutputStage(name="Display", callback=display_callback),
+								threadSetup=apply_policy)
+	display_runtime.start()
+	VisionTable.putString("BucketVisionState", "Started CV2 Display" if args['test'] else "Started CS Display")
+
+	policy.report(VisionTable)
 
 	try:
 		VisionTable.putValue("CameraNum", 0)
+		display_seq = 0
+		next_report = time.time() + 1.0
 		while True:
 			source_mux.source_num = int(VisionTable.getEntry("CameraNum").value)
+			if time.time() > next_report:
+				next_report += 1.0
+				proc_runtime.report(VisionTable)
+			if args['test']:
+				seq, frame = display_runtime['Display'].read(display_seq, 0.1)
+				if frame is not None and seq != display_seq:
+					display_seq = seq
+					cv2.imshow("Camera0", frame.image)
+				cv2.waitKey(1)
 
 	except KeyboardInterrupt:
+		display_runtime.stop()
+		proc_runtime.stop()
 		if args['test']:
-			window_display.stop()
-		else:
-			cs_display.stop()
-		for proc in proc_list:
-			proc.stop()
+			cv2.destroyAllWindows()
+		if stereo_depth is not None:
+			stereo_depth.stop()
+			stereo_sync.stop()
 		for cap in source_list:
 			cap.stop()
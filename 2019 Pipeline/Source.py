@@ -1,5 +1,16 @@
+import threading
+
+import numpy as np
+
+
 class Source(object):
-	"""Generic Vision Pipeline Source"""
+	"""Generic Vision Pipeline Source
+
+	Consumers poll new_frame and then read frame. Sources that are part of a
+	source graph (Mux1N outputs and DerivedSource nodes) also have frame_seq,
+	which changes exactly when frame does, and read_seq(), which returns
+	(frame, frame_seq) as one consistent pair.
+	"""
 	def __init__(self):
 		"""Generic Init"""
 
@@ -10,4 +21,88 @@ class Source(object):
 		"""Stop Source"""
 
 	@property
-	def output(self):
\ No newline at end of file
+	def output(self):
+		"""Current output of Source"""
+
+
+class DerivedSource(Source):
+	"""
+	Node of a source graph whose frame is computed from base_source's frame
+
+	compute() runs at most once per upstream frame: the result is cached
+	against the upstream frame_seq (or, for a base source without one, the
+	upstream frame object itself), so reading frame again, or any number of
+	consumers sharing the node, costs nothing until the next frame.
+	compute() must not modify its input, which other nodes share.
+
+	Nodes that produce an image of their own take it from output_buffer(),
+	which alternates between two buffers owned by the node: the output for
+	the previous frame stays intact while the next one is written, and
+	nothing is allocated once the size is settled.
+	"""
+	def __init__(self, base_source):
+		self._base_source = base_source
+		self._lock = threading.Lock()
+		self._key = None
+		self._output = None
+		self._buffers = [None, None]
+		self._next_buffer = 0
+		self.computed = 0	# compute() calls, for checking the sharing works
+
+	def output_buffer(self, shape, dtype):
+		"""The next of the node's two output buffers, allocated only when shape or dtype changes"""
+		buffer = self._buffers[self._next_buffer]
+		if buffer is None or buffer.shape != shape or buffer.dtype != dtype:
+			buffer = np.empty(shape, dtype=dtype)
+			self._buffers[self._next_buffer] = buffer
+		self._next_buffer = 1 - self._next_buffer
+		return buffer
+
+	def compute(self, frame):
+		"""Output for one upstream frame"""
+		return frame
+
+	def read_seq(self):
+		"""(frame, frame_seq) as one consistent pair, computing frame if needed"""
+		if hasattr(self._base_source, 'read_seq'):
+			frame, seq = self._base_source.read_seq()
+			key = seq
+		else:
+			# frames are compared by identity; holding on to the last one in
+			# self._key keeps its id from being reused
+			frame = self._base_source.frame
+			seq = None
+			key = frame
+		with self._lock:
+			if frame is None:
+				return None, seq
+			stale = (key is not self._key) if seq is None else (key != self._key)
+			if self._output is None or stale:
+				self._output = self.compute(frame)
+				self._key = key
+				self.computed += 1
+			return self._output, seq
+
+	@property
+	def frame(self):
+		return self.read_seq()[0]
+
+	@property
+	def frame_seq(self):
+		return getattr(self._base_source, 'frame_seq', None)
+
+	@property
+	def frame_time(self):
+		return getattr(self._base_source, 'frame_time', None)
+
+	@property
+	def exposure(self):
+		return self._base_source.exposure
+
+	@exposure.setter
+	def exposure(self, val):
+		self._base_source.exposure = val
+
+	@property
+	def new_frame(self):
+		return self._base_source.new_frame
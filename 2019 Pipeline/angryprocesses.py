@@ -7,6 +7,34 @@ import time
 
 from processimage import ProcessImage
 from configs import configs
+from schedpolicy import apply_policy
+
+
+def dict_zip(*dicts):
+	all_keys = {k for d in dicts for k in d.keys()}
+	return {k: [d[k] for d in dicts if k in d] for k in all_keys}
+
+
+def find_targets(processor, frame):
+	"""FindTarget on the configured crop band of a camera_res frame"""
+	crop_top = int(configs['camera_res'][1]*configs['crop_top'])
+	crop_bot = int(configs['camera_res'][1]*configs['crop_bot'])
+	return processor.FindTarget(frame[crop_top:crop_bot, :, :])
+
+
+def publish_results(net_table, results, frame_time, frame_seq=None):
+	"""Puts one frame's targets in the table; frame_seq is published too
+	when the frame went through a ProcessorPool"""
+	net_table.putNumber("LastFrameTime", frame_time)
+	net_table.putNumber("CurrFrameTime", time.time())
+	if frame_seq is not None:
+		net_table.putNumber("FrameSeq", frame_seq)
+	result_data = dict_zip(*[r.dict() for r in results])
+	net_table.putNumber("NumTargets", len(results))
+	for key, value in result_data.items():
+		# Here we assume that every param is a number of some kind
+		net_table.putNumberArray(key, value)
+
 
 class AngryProcesses(threading.Thread):
 	def __init__(self, source=None, network_table=None, debug_label=""):
@@ -41,10 +69,7 @@ class AngryProcesses(threading.Thread):
 		self._frame = img
 		self._new_frame = True
 
-	@staticmethod
-	def dict_zip(*dicts):
-		all_keys = {k for d in dicts for k in d.keys()}
-		return {k: [d[k] for d in dicts if k in d] for k in all_keys}
+	dict_zip = staticmethod(dict_zip)
 
 	def update_results(self):
 		if self.net_table is not None:
@@ -52,13 +77,7 @@ class AngryProcesses(threading.Thread):
 			#if last_net_time >= self.last_frame_time:
 				#print("\nAP: {}: net table ahead!".format(self.debug_label))
 			#	return
-			self.net_table.putNumber("LastFrameTime", self.last_frame_time)
-			self.net_table.putNumber("CurrFrameTime", time.time())
-			result_data = self.dict_zip(*[r.dict() for r in self.results])
-			self.net_table.putNumber("NumTargets", len(self.results))
-			for key, value in result_data.items():
-				# Here we assume that every param is a number of some kind
-				self.net_table.putNumberArray(key, value)
+			publish_results(self.net_table, self.results, self.last_frame_time)
 
 	def draw_trgt(self):
 		if self.source is None:
@@ -76,6 +95,7 @@ class AngryProcesses(threading.Thread):
 		threading.Thread.start(self)
 
 	def run(self):
+		apply_policy('processing')
 		frame_hist = list()
 		while not self.stopped:
 			if self.source is not None:
@@ -92,9 +112,7 @@ class AngryProcesses(threading.Thread):
 					frame = self.source.frame
 				else:
 					frame = self.frame
-				crop_top = int(self.camera_res[1]*configs['crop_top'])
-				crop_bot = int(self.camera_res[1]*configs['crop_bot'])
-				self.results = self.processor.FindTarget(frame[crop_top:crop_bot, :, :])
+				self.results = find_targets(self.processor, frame)
 				if self.net_table is not None:
 					pass
 					# self.frame = self.draw_trgt()
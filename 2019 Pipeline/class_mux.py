@@ -1,7 +1,36 @@
+import threading
+import logging
+import time
+
+
 class ClassMux(object):
-	def __init__(self, *sources):
+	"""
+	Presents one of several sources as the source
+
+	Attributes not defined here fall through to the active source. Switching
+	is explicit, through switch() (or setting source_num). With standby=True
+	the inactive sources are put in standby, where a Cv2Capture only grabs
+	frames without decoding them; they keep streaming, so the first frame of
+	a camera switched to is a single frame period away.
+
+	After a switch new_frame stays False until the new source has a frame
+	captured after the switch, so neither the old camera's last frame nor one
+	the new camera held from before its standby gets through, and frame_seq,
+	counted by the mux, keeps going up across switches.
+	"""
+	def __init__(self, *sources, standby=False):
+		self.__dict__['logger'] = logging.getLogger("ClassMux")
 		self.__dict__['sources'] = sources
-		self.__dict__['source_num'] = 0
+		self.__dict__['standby'] = standby
+		self.__dict__['_lock'] = threading.RLock()
+		self.__dict__['_source_num'] = 0
+		self.__dict__['_switch_time'] = float('-inf')
+		self.__dict__['_last_stamp'] = None
+		self.__dict__['_frame_seq'] = 0
+		self.__dict__['switches'] = 0
+		if standby:
+			for source in sources[1:]:
+				source.standby = True
 
 	def __getattr__(self, name):
 		if name in self.__dict__:
@@ -10,7 +39,79 @@ class ClassMux(object):
 			return getattr(self.sources[self.source_num], name)
 	
 	def __setattr__(self, name, value):
-		if name in self.__dict__:
-			self.__dict__[name] = value
+		if name in self.__dict__ or hasattr(type(self), name):
+			object.__setattr__(self, name, value)
 		else:
 			setattr(self.sources[self.source_num], name, value)
+
+	@property
+	def source_num(self):
+		return self._source_num
+
+	@source_num.setter
+	def source_num(self, val):
+		self.switch(val)
+
+	def switch(self, source_num):
+		"""Makes sources[source_num] the active source; does nothing if it already is"""
+		if source_num == self._source_num:
+			return
+		if not 0 <= source_num < len(self.sources):
+			self.logger.warning("No source {} to switch to".format(source_num))
+			return
+		with self._lock:
+			old = self.sources[self._source_num]
+			new = self.sources[source_num]
+			if self.standby:
+				new.standby = False
+			self.__dict__['_switch_time'] = time.monotonic()
+			self.__dict__['_source_num'] = source_num
+			self.__dict__['switches'] += 1
+			if self.standby:
+				old.standby = True
+
+	@property
+	def new_frame(self):
+		source = self.sources[self._source_num]
+		if not source.new_frame:
+			return False
+		stamp = getattr(source, 'frame_time', None)
+		# a frame from before the switch is not new to the consumers of the mux
+		return stamp is None or stamp >= self._switch_time
+
+	@new_frame.setter
+	def new_frame(self, val):
+		self.sources[self._source_num].new_frame = val
+
+	@property
+	def frame(self):
+		return self.read_stamped()[0]
+
+	@property
+	def frame_seq(self):
+		"""Number of the last frame read through the mux, monotonic across switches"""
+		return self._frame_seq
+
+	def read_stamped(self, consume=True):
+		"""(frame, frame_time) of the active source; frame_time is None for unstamped sources"""
+		with self._lock:
+			source = self.sources[self._source_num]
+			if hasattr(source, 'read_stamped'):
+				frame, stamp = source.read_stamped(consume=consume)
+				changed = stamp != self._last_stamp
+				key = stamp
+			else:
+				# unstamped frames are told apart by identity
+				frame, stamp = source.frame, None
+				changed = frame is not self._last_stamp
+				key = frame
+			if changed:
+				self.__dict__['_last_stamp'] = key
+				self.__dict__['_frame_seq'] += 1
+			return frame, stamp
+
+	def read_seq(self):
+		"""(frame, frame_seq) as one consistent pair"""
+		with self._lock:
+			frame = self.read_stamped()[0]
+			return frame, self._frame_seq
@@ -2,7 +2,31 @@ configs = {
 	'camera_res': (320, 240),
 	'crop_top': 0,
 	'crop_bot': 0.5,
-	'brigtness': 3
+	'brigtness': 3,
+	# stereo depth (see stereodepth.py), used when launched with -stereo
+	'stereo_calibration': 'stereo_calibration.npz',
+	'stereo_scale': 0.5,
+	'stereo_roi': None,
+	'stereo_num_disparities': 64,
+	'stereo_mode': 'dense',		# 'sparse' triangulates target keypoints only
+	'stereo_epipolar_tol': 2.0,
+	'stereo_sync_tolerance': 0.010,
+	# age budgets (seconds since capture) after which a consumer skips a frame
+	'proc_max_age': 0.100,
+	'stereo_max_age': 0.100,
+	# grow/shrink the processor pool from -proc workers at run time (PoolSizer)
+	'proc_adaptive': True,
+	'proc_min': 1,
+	'proc_max': None,		# None: one per CPU
+	# cores and priority per thread role (see schedpolicy); 'fifo': n asks
+	# for SCHED_FIFO priority n instead of nice, cores not present are skipped
+	'sched_enabled': True,
+	'sched_policy': {
+		'capture': {'cpus': [0], 'nice': -10},
+		'processing': {'cpus': [1, 2, 3], 'nice': 0},
+		'streaming': {'cpus': [1, 2, 3], 'nice': 5},
+		'other': {'cpus': [1, 2, 3], 'nice': 5}	# cscore and NetworkTables threads
+	}
 }
 
 configs['output_res'] = configs['camera_res']
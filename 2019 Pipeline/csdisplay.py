@@ -5,6 +5,8 @@ import cv2
 
 from cscore import CameraServer
 
+from schedpolicy import apply_policy
+
 
 class CSDisplay(threading.Thread):
 	colors = [
@@ -98,6 +100,7 @@ class CSDisplay(threading.Thread):
 		return image
 
 	def run(self):
+		apply_policy('streaming')
 		while not self.stopped:
 			if self.source is None:
 				if self._new_frame:
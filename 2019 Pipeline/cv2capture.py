@@ -6,6 +6,7 @@ import os
 import cv2
 
 from configs import configs
+from schedpolicy import apply_policy
 
 try:
 	import networktables
@@ -42,7 +43,11 @@ class Cv2Capture(threading.Thread):
 		self.frame_lock = threading.Lock()
 
 		self._frame = None
+		self._frame_time = 0.0
 		self._new_frame = False
+		self.dropped = 0	# frames overwritten before anyone consumed them
+		self.standby = False	# grab only, no decode (see ClassMux)
+		self.grabbed = 0	# frames skipped in standby
 
 		self.stopped = True
 		self.exposure = exposure
@@ -68,6 +73,19 @@ class Cv2Capture(threading.Thread):
 		# For maximum thread (or process) safety, you should copy the frame, but this is very expensive
 		return self._frame
 
+	@property
+	def frame_time(self):
+		"""time.monotonic() at which the current frame was read from the camera"""
+		return self._frame_time
+
+	def read_stamped(self, consume=True):
+		"""Returns (frame, frame_time) as one consistent pair
+		consume=False leaves new_frame alone for the other consumers of this camera"""
+		with self.frame_lock:
+			if consume:
+				self._new_frame = False
+			return self._frame, self._frame_time
+
 	@property
 	def width(self):
 		if self.cap_open:
@@ -157,6 +175,7 @@ class Cv2Capture(threading.Thread):
 		threading.Thread.start(self)
 
 	def run(self):
+		apply_policy('capture')
 		first_frame = True
 		frame_hist = list()
 		last_frame_time = time.time()
@@ -164,6 +183,7 @@ class Cv2Capture(threading.Thread):
 		while not self.stopped:
 			if len(frame_hist) == 100:
 				print("Capture{}: {}fps".format(self.camera_num, 1/(sum(frame_hist)/len(frame_hist))))
+				self.write_table_value("Camera{}Dropped".format(self.camera_num), self.dropped)
 				frame_hist = list()
 			start_time = time.time()
 			# TODO: MAke this less crust, I would like to setup a callback
@@ -173,10 +193,21 @@ class Cv2Capture(threading.Thread):
 				pass
 			except:
 				pass
+			if self.standby:
+				# keeps the camera streaming and its queue drained, so the
+				# first read() after standby returns a current frame
+				with self.capture_lock:
+					self.cap.grab()
+				self.grabbed += 1
+				continue
 			with self.capture_lock:
 				_, img = self.cap.read()
+				img_time = time.monotonic()
 			with self.frame_lock:
 				self._frame = img
+				self._frame_time = img_time
+				if self._new_frame:
+					self.dropped += 1
 				if first_frame:
 					first_frame = False
 					print(img.shape, self._frame.shape)
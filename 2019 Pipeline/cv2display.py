@@ -3,6 +3,8 @@ import logging
 
 import cv2
 
+from schedpolicy import apply_policy
+
 
 class Cv2Display(threading.Thread):
 	def __init__(self, source=None, window_name="Camera0"):
@@ -33,6 +35,7 @@ class Cv2Display(threading.Thread):
 		threading.Thread.start(self)
 
 	def run(self):
+		apply_policy('streaming')
 		while not self.stopped:
 			if self.source is not None:
 				if self.source.new_frame:
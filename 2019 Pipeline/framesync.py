@@ -0,0 +1,286 @@
+import threading
+import logging
+import collections
+import time
+
+
+class FrameSync(threading.Thread):
+	"""
+	Synchronizer source for N free running capture sources
+
+	Every frame is stamped with its monotonic capture time (Cv2Capture.read_stamped,
+	or the time it was first seen for sources without one). Stamped sources are
+	polled by timestamp without consuming their new_frame flag, so a camera can
+	feed the synchronizer and the usual Mux1N chain at once. Whenever each source
+	has a frame, the source whose newest frame is oldest sets the pivot time
+	and every other source contributes the frame closest to it. If they are all
+	within tolerance seconds of the pivot the tuple is emitted and everything
+	up to it is consumed.
+
+	policy decides what happens when a source has nothing close enough:
+		'drop' - no tuple, the frames older than the window are discarded
+		'hold' - once the pivot frame is more than wait seconds old, a source
+		         with nothing close enough reuses its last matched frame as long
+		         as that is no more than hold_time seconds from the pivot. While
+		         a source has no frame at all (it stalled) the pivot is the
+		         oldest frame the others have waiting, so their frames still go
+		         out in order, each wait seconds after capture
+
+	Consumers read it like any other source: new_frame, then frame (a tuple
+	of frames in source order) and frame_time (a tuple of their timestamps).
+
+	python framesync.py stall checks the 'hold' policy with a stalled source.
+	"""
+	def __init__(self, *sources, tolerance=0.010, policy='drop', hold_time=0.1, wait=0.020, depth=4,
+				network_table=None):
+		self.logger = logging.getLogger("FrameSync")
+		if policy not in ('drop', 'hold'):
+			raise ValueError("Unknown FrameSync policy {}".format(policy))
+		self.sources = sources
+		self.tolerance = tolerance
+		self.policy = policy
+		self.hold_time = hold_time
+		self.wait = wait
+		self.net_table = network_table
+
+		self._pending = [collections.deque(maxlen=depth) for _ in sources]
+		self._held = [None for _ in sources]
+		self._last_stamp = [None for _ in sources]
+		self._last_pivot = float('-inf')
+
+		self.frame_lock = threading.Lock()
+		self._frame = None
+		self._frame_time = None
+		self._new_frame = False
+
+		# Statistics
+		self.emitted = 0
+		self.dropped = [0 for _ in sources]
+		self.held = [0 for _ in sources]
+		self.max_skew = 0.0
+		self._skew_sum = 0.0
+
+		self.stopped = True
+		threading.Thread.__init__(self)
+
+	@property
+	def new_frame(self):
+		with self.frame_lock:
+			return self._new_frame
+
+	@new_frame.setter
+	def new_frame(self, val):
+		with self.frame_lock:
+			self._new_frame = val
+
+	@property
+	def frame(self):
+		with self.frame_lock:
+			self._new_frame = False
+			return self._frame
+
+	@property
+	def frame_time(self):
+		with self.frame_lock:
+			return self._frame_time
+
+	def read_stamped(self, consume=True):
+		with self.frame_lock:
+			if consume:
+				self._new_frame = False
+			return self._frame, self._frame_time
+
+	@property
+	def width(self):
+		return self.sources[0].width
+
+	@property
+	def height(self):
+		return self.sources[0].height
+
+	def stats(self):
+		"""Counters and skew (seconds) of the emitted tuples"""
+		mean_skew = self._skew_sum / self.emitted if self.emitted > 0 else 0.0
+		return {
+			'emitted': self.emitted,
+			'dropped': list(self.dropped),
+			'held': list(self.held),
+			'mean_skew': mean_skew,
+			'max_skew': self.max_skew
+		}
+
+	def poll(self):
+		"""Moves any new source frames into the pending queues"""
+		got = False
+		for index, source in enumerate(self.sources):
+			if hasattr(source, 'read_stamped'):
+				frame, stamp = source.read_stamped(consume=False)
+				if stamp == self._last_stamp[index]:
+					continue
+				self._last_stamp[index] = stamp
+			elif source.new_frame:
+				stamp = time.monotonic()
+				frame = source.frame
+			else:
+				continue
+			if frame is None:
+				continue
+			pending = self._pending[index]
+			if stamp < self._last_pivot - self.tolerance:
+				# arrived after a tuple it belonged to was emitted without it
+				self.dropped[index] += 1
+				continue
+			if len(pending) == pending.maxlen:
+				self.dropped[index] += 1
+			pending.append((stamp, frame))
+			got = True
+		return got
+
+	def match(self):
+		"""Emits at most one synchronized tuple from the pending queues"""
+		hold = (self.policy == 'hold')
+		waiting = [len(p) == 0 for p in self._pending]
+		if all(waiting) or (any(waiting) and not hold):
+			return False
+
+		if any(waiting):
+			# a stalled source: the frame that has waited longest for it
+			pivot = min(p[0][0] for p in self._pending if len(p) > 0)
+		else:
+			pivot = min(p[-1][0] for p in self._pending if len(p) > 0)
+		overdue = (time.monotonic() - pivot) > self.wait
+		chosen = list()
+		for index, pending in enumerate(self._pending):
+			if len(pending) > 0:
+				best = min(pending, key=lambda entry: abs(entry[0] - pivot))
+				if abs(best[0] - pivot) <= self.tolerance:
+					chosen.append(best)
+					continue
+			if (hold and overdue and self._held[index] is not None and
+					abs(self._held[index][0] - pivot) <= self.hold_time):
+				chosen.append(None)
+				continue
+			# Nothing usable near the pivot: discard what is too old to
+			# ever match and wait for more frames
+			while len(pending) > 0 and pending[0][0] < pivot - self.tolerance:
+				pending.popleft()
+				self.dropped[index] += 1
+			return False
+
+		for index, entry in enumerate(chosen):
+			pending = self._pending[index]
+			if entry is None:
+				self.held[index] += 1
+				chosen[index] = self._held[index]
+				continue
+			# consume the chosen frame and everything older
+			while len(pending) > 0 and pending[0][0] <= entry[0]:
+				skipped = pending.popleft()
+				if skipped is not entry:
+					self.dropped[index] += 1
+			self._held[index] = entry
+		self._last_pivot = pivot
+
+		stamps = tuple(entry[0] for entry in chosen)
+		skew = max(stamps) - min(stamps)
+		self.emitted += 1
+		self._skew_sum += skew
+		self.max_skew = max(self.max_skew, skew)
+
+		with self.frame_lock:
+			self._frame = tuple(entry[1] for entry in chosen)
+			self._frame_time = stamps
+			self._new_frame = True
+		return True
+
+	def update_stats(self):
+		if self.net_table is not None:
+			stats = self.stats()
+			self.net_table.putNumber("SyncEmitted", stats['emitted'])
+			self.net_table.putNumberArray("SyncDropped", stats['dropped'])
+			self.net_table.putNumberArray("SyncHeld", stats['held'])
+			self.net_table.putNumber("SyncMeanSkew", stats['mean_skew'])
+			self.net_table.putNumber("SyncMaxSkew", stats['max_skew'])
+
+	def stop(self):
+		self.stopped = True
+
+	def start(self):
+		self.stopped = False
+		threading.Thread.start(self)
+
+	def run(self):
+		next_stats = time.monotonic() + 1.0
+		while not self.stopped:
+			got = self.poll()
+			# also without new frames: waiting ones may have become overdue
+			while self.match():
+				pass
+			if not got:
+				time.sleep(0.001)
+			if time.monotonic() > next_stats:
+				next_stats += 1.0
+				self.update_stats()
+
+
+class _FakeSource(object):
+	"""Stamped source for stall_check: a frame every period seconds until stalled"""
+	def __init__(self, period):
+		self.period = period
+		self.start = time.monotonic()
+		self.stall_at = None
+
+	def read_stamped(self, consume=True):
+		now = time.monotonic()
+		if self.stall_at is not None:
+			now = min(now, self.stall_at)
+		count = int((now - self.start) / self.period)
+		return count, self.start + count * self.period
+
+
+def stall_check(hold_time=0.5, wait=0.02):
+	"""Stops one of two sources and checks that 'hold' keeps emitting tuples
+	with its last frame, and 'drop' does not"""
+	for policy in ('hold', 'drop'):
+		sources = (_FakeSource(1.0 / 30), _FakeSource(1.0 / 30))
+		sync = FrameSync(*sources, tolerance=0.010, policy=policy, hold_time=hold_time, wait=wait)
+		sync.start()
+		time.sleep(0.3)
+		sources[1].stall_at = time.monotonic()
+		emitted = sync.emitted
+		time.sleep(0.3)
+		sync.stop()
+		sync.join()
+		stats = sync.stats()
+		print("{}: {} tuples during the stall, held {}".format(policy, stats['emitted'] - emitted, stats['held']))
+		if policy == 'hold':
+			assert stats['held'][1] > 0 and stats['emitted'] > emitted, "hold emitted nothing for a stalled source"
+		else:
+			assert stats['held'] == [0, 0]
+
+
+if __name__ == '__main__':
+	import sys
+	if sys.argv[1:] == ['stall']:
+		stall_check()
+		sys.exit(0)
+
+	from cv2capture import Cv2Capture
+	from configs import configs
+	logging.basicConfig(level=logging.DEBUG)
+
+	cams = [Cv2Capture(camera_num=i, res=configs['camera_res']) for i in range(2)]
+	for cam in cams:
+		cam.start()
+
+	sync = FrameSync(*cams, tolerance=0.010)
+	sync.start()
+
+	try:
+		while True:
+			time.sleep(1)
+			print(sync.stats())
+	except KeyboardInterrupt:
+		sync.stop()
+		for cam in cams:
+			cam.stop()
@@ -1,12 +1,40 @@
+import threading
+
+
 class DelegatedSource(object):
 	def __init__(self, controller):
 		self._controller = controller
 		self._new_frame = False
+		self.dropped = 0	# frames replaced before this output read them
 
 	@property
 	def frame(self):
+		return self.read_seq()[0]
+
+	@property
+	def frame_seq(self):
+		"""Number of the current frame, shared by all outputs of the Mux1N"""
+		return self._controller._latest[2]
+
+	@property
+	def frame_time(self):
+		"""Capture time (time.monotonic()) of the current frame, if the base source stamps its frames"""
+		return self._controller._latest[1]
+
+	def read_seq(self):
+		"""(frame, frame_seq) as one consistent pair"""
+		self._controller.check_new_frame()
 		self._new_frame = False
-		return self._controller._base_source.frame
+		frame, _, seq = self._controller._latest
+		return frame, seq
+
+	def read_stamped(self, consume=True):
+		"""(frame, frame_time) as one consistent pair; frame_time is None for unstamped sources"""
+		self._controller.check_new_frame()
+		if consume:
+			self._new_frame = False
+		frame, stamp, _ = self._controller._latest
+		return frame, stamp
 
 	@property
 	def width(self):
@@ -27,14 +55,32 @@ class DelegatedSource(object):
 
 
 class Mux1N:
+	"""
+	Fans one source out to any number of outputs
+
+	Whenever the base source has a new frame it is taken once and latched,
+	with its capture time and a sequence number, so every output sees the
+	same frame under the same frame_seq until the next one arrives.
+	"""
 	def __init__(self, source):
 		self._base_source = source
 		self._sources = []
+		self._lock = threading.Lock()
+		self._latest = (None, None, 0)	# (frame, frame_time, frame_seq)
 
 	def check_new_frame(self):
-		if self._base_source.new_frame:
-			self._base_source.new_frame = False
+		with self._lock:
+			if not self._base_source.new_frame:
+				return
+			if hasattr(self._base_source, 'read_stamped'):
+				frame, stamp = self._base_source.read_stamped()
+			else:
+				self._base_source.new_frame = False
+				frame, stamp = self._base_source.frame, None
+			self._latest = (frame, stamp, self._latest[2] + 1)
 			for source in self._sources:
+				if source._new_frame:
+					source.dropped += 1
 				source._new_frame = True
 	
 	def create_output(self):
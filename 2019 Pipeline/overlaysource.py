@@ -1,8 +1,14 @@
+import numpy as np
 import cv2
 
-class OverlaySource(object):
+from Source import DerivedSource
+
+
+class OverlaySource(DerivedSource):
+	"""Draws the center line on a copy of the frame, in the node's own output
+	buffers, so the frame shared with the other consumers is left alone"""
 	def __init__(self, base_source, res=None):
-		self._base_source = base_source
+		DerivedSource.__init__(self, base_source)
 		if res is not None:
 			self.width = res[0]
 			self.height = res[1]
@@ -10,17 +16,10 @@ class OverlaySource(object):
 			self.width = int(self._base_source.width)
 			self.height = int(self._base_source.height)
 
-	@property
-	def frame(self):
-		return cv2.line(self._base_source.frame, (self.width//2, self.height), (self.width//2, 0), (0, 255, 0), 2)
-
-	@property
-	def exposure(self):
-		return self._base_source.exposure
-
-	@exposure.setter
-	def exposure(self, val):
-		self._base_source.exposure = val
+	def compute(self, frame):
+		out = self.output_buffer(frame.shape, frame.dtype)
+		np.copyto(out, frame)
+		return cv2.line(out, (self.width//2, self.height), (self.width//2, 0), (0, 255, 0), 2)
 
 	@property
 	def width(self):
@@ -37,7 +36,3 @@ class OverlaySource(object):
 	@height.setter
 	def height(self, val):
 		self._base_source.height = val
-
-	@property
-	def new_frame(self):
-		return self._base_source.new_frame
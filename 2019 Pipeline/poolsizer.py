@@ -0,0 +1,131 @@
+import threading
+import logging
+import time
+import os
+
+
+class PoolSizer(threading.Thread):
+	"""
+	Grows or shrinks a ProcessorPool to what its frames cost
+
+	Every interval seconds it measures, from the pool's counters:
+	utilization (time workers spent on frames over the worker time there
+	was), the rate frames come in at, and how many of them went unprocessed
+	(skipped while every worker was busy, expired, or dropped by the source
+	before the pool could take them).
+
+	A worker is added when utilization is above grow_at while frames go
+	unprocessed, unless the CPUs are already saturated (load average at or
+	above the CPU count), where another worker would only thrash the cores
+	capture and cscore need. A worker is removed when one less would still
+	stay below shrink_at. The same verdict has to come patience intervals in
+	a row before the pool changes, except that a pool below min_workers (one
+	started with no workers, say) grows right away. Every interval's numbers
+	and decision are published (PoolWorkers, PoolUtilization, PoolInputFps,
+	PoolUnprocessed, PoolSizerDecision).
+	"""
+	def __init__(self, pool, network_table=None, min_workers=1, max_workers=None,
+				interval=1.0, grow_at=0.85, shrink_at=0.6, patience=3):
+		self.logger = logging.getLogger("PoolSizer")
+		self.pool = pool
+		self.net_table = network_table
+		self.min_workers = min_workers
+		if max_workers is None:
+			max_workers = os.cpu_count() or 1
+		self.max_workers = max_workers
+		self.interval = interval
+		self.grow_at = grow_at
+		self.shrink_at = shrink_at
+		self.patience = patience
+
+		self.utilization = 0.0
+		self.input_fps = 0.0
+		self.unprocessed = 0
+		self.decision = "starting"
+		self._verdict = 0
+		self._streak = 0
+
+		self.stopped = True
+		threading.Thread.__init__(self)
+
+	@staticmethod
+	def cpu_saturated():
+		"""True when the 1 minute load average reaches the CPU count (never
+		where there is no load average)"""
+		try:
+			return os.getloadavg()[0] >= (os.cpu_count() or 1)
+		except (AttributeError, OSError):
+			return False
+
+	def sample(self):
+		"""Counters the decisions are made from"""
+		stats = self.pool.stats()
+		return (time.time(), self.pool.busy_time, stats['workers'],
+				stats['dispatched'] + stats['skipped'] + stats['expired'],
+				stats['skipped'] + stats['expired'] + stats['source_dropped'])
+
+	def decide(self, utilization, unprocessed, workers):
+		"""(+1, -1 or 0, reason) for the measured interval"""
+		if workers < self.min_workers:
+			# nothing is dispatched to no workers, so utilization cannot tell
+			return 1, "below min_workers"
+		if utilization >= self.grow_at and unprocessed > 0:
+			if workers >= self.max_workers:
+				return 0, "at max_workers"
+			if self.cpu_saturated():
+				return 0, "cpu saturated"
+			return 1, "grow"
+		if workers > self.min_workers and utilization * workers / (workers - 1) < self.shrink_at:
+			return -1, "shrink"
+		return 0, "steady"
+
+	def update(self, before, after):
+		"""Measures the interval between two samples and resizes the pool"""
+		t0, busy0, _, arrived0, unprocessed0 = before
+		t1, busy1, workers, arrived1, unprocessed1 = after
+		elapsed = max(t1 - t0, 1e-6)
+		self.utilization = (busy1 - busy0) / (elapsed * max(workers, 1))
+		self.input_fps = (arrived1 - arrived0) / elapsed
+		self.unprocessed = unprocessed1 - unprocessed0
+
+		verdict, reason = self.decide(self.utilization, self.unprocessed, workers)
+		if verdict != 0 and verdict == self._verdict:
+			self._streak += 1
+		else:
+			self._streak = 1 if verdict != 0 else 0
+		self._verdict = verdict
+
+		if verdict != 0 and (self._streak >= self.patience or workers < self.min_workers):
+			self._streak = 0
+			if verdict > 0:
+				self.pool.add_worker()
+			else:
+				self.pool.remove_worker()
+			reason = "{} to {}".format(reason, workers + verdict)
+			self.logger.info("{} workers: {} (utilization {:.2f}, {:.1f} fps in, {} unprocessed)".format(
+				workers, reason, self.utilization, self.input_fps, self.unprocessed))
+		elif verdict != 0:
+			reason = "{} ({}/{})".format(reason, self._streak, self.patience)
+		self.decision = reason
+
+		if self.net_table is not None:
+			self.net_table.putNumber("PoolWorkers", self.pool.stats()['workers'])
+			self.net_table.putNumber("PoolUtilization", self.utilization)
+			self.net_table.putNumber("PoolInputFps", self.input_fps)
+			self.net_table.putNumber("PoolUnprocessed", self.unprocessed)
+			self.net_table.putString("PoolSizerDecision", self.decision)
+
+	def stop(self):
+		self.stopped = True
+
+	def start(self):
+		self.stopped = False
+		threading.Thread.start(self)
+
+	def run(self):
+		before = self.sample()
+		while not self.stopped:
+			time.sleep(self.interval)
+			after = self.sample()
+			self.update(before, after)
+			before = after
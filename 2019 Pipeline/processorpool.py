@@ -0,0 +1,300 @@
+import threading
+import logging
+import time
+
+from processimage import ProcessImage
+from frameduration import FrameDuration
+from angryprocesses import find_targets, publish_results
+from schedpolicy import apply_policy
+
+
+class PoolWorker(threading.Thread):
+	"""One worker of a ProcessorPool, with its own pipeline; runs whatever frame it is handed"""
+	def __init__(self, pool, debug_label=""):
+		self.logger = logging.getLogger("PoolWorker")
+		self.pool = pool
+		self.debug_label = debug_label
+		self.processor = pool.pipeline()
+		self.duration = FrameDuration()
+
+		self._job = None
+		self._job_ready = threading.Event()
+
+		self.stopped = True
+		threading.Thread.__init__(self)
+
+	def submit(self, seq, frame, frame_time):
+		self._job = (seq, frame, frame_time)
+		self._job_ready.set()
+
+	def stop(self):
+		self.stopped = True
+		self._job_ready.set()
+
+	def start(self):
+		self.stopped = False
+		threading.Thread.start(self)
+
+	def run(self):
+		self.pool.thread_setup('processing')
+		while not self.stopped:
+			if not self._job_ready.wait(0.1):
+				continue
+			self._job_ready.clear()
+			if self._job is None:
+				continue
+			seq, frame, frame_time = self._job
+			self._job = None
+			self.duration.start()
+			failed = False
+			try:
+				results = self.pool.process(self.processor, frame)
+			except Exception:
+				self.logger.exception("{}: frame {} failed".format(self.debug_label, seq))
+				results = None
+				failed = True
+			self.duration.update()
+			self.pool.done(self, seq, frame, frame_time, results, failed)
+
+
+class ProcessorPool(threading.Thread):
+	"""
+	Hands every new frame of source to exactly one idle worker
+
+	Frames are numbered in the order they are dispatched. While every worker
+	is busy only the newest frame is kept; the ones it replaces are counted
+	as skipped. Results are published in sequence order through a reorder
+	buffer: when several consecutive frames are done only the newest of them
+	is published (the older ones are superseded), a finished frame waits
+	for older frames still in flight for at most reorder_timeout seconds,
+	and a result older than what was already published is dropped as stale.
+	So LastFrameTime/FrameSeq never go backwards, and every worker added
+	takes its own frames instead of repeating the same one.
+
+	Frames carry their capture time (read_stamped, or the time they were
+	taken from a source that does not stamp them). A frame older than
+	max_age seconds when a worker becomes free for it is expired instead of
+	processed, so under load latency stays bounded rather than a backlog
+	building up. FrameLatency is the capture-to-publish time of the last
+	published frame.
+
+	Workers can be added and removed while running (see PoolSizer); a busy
+	worker that is removed finishes its frame first. busy_time adds up the
+	time workers spent on frames.
+
+	Each worker runs process(its pipeline, frame), by default find_targets
+	on a ProcessImage of its own; thread_setup(role) runs on every pool
+	thread as it starts. callback(seq, frame, results, latency), if given,
+	gets every published result, outside the pool's lock (the runtime's
+	ProcessStage passes results on this way).
+	"""
+	def __init__(self, source, num_workers=4, network_table=None, reorder_timeout=0.1, max_age=None,
+				pipeline=ProcessImage, process=find_targets, callback=None, thread_setup=apply_policy):
+		self.logger = logging.getLogger("ProcessorPool")
+		self.source = source
+		self.net_table = network_table
+		self.reorder_timeout = reorder_timeout
+		self.max_age = max_age
+		self.pipeline = pipeline
+		self.process = process
+		self.callback = callback
+		self.thread_setup = thread_setup
+
+		self.lock = threading.Condition()
+		self.workers = [PoolWorker(self, debug_label="Proc{}".format(i)) for i in range(num_workers)]
+		self._idle = list(self.workers)
+		self._worker_ids = num_workers
+		self._retire = 0            # busy workers to stop when they are done
+		self._latest = None         # newest frame not dispatched yet
+		self._in_flight = dict()    # seq -> dispatch time
+		self._finished = dict()     # seq -> (frame, frame_time, results)
+		self._captured = dict()     # seq -> capture time (time.monotonic())
+		self._next_seq = 0
+		self.published_seq = -1
+
+		self.results = list()
+		self.last_frame_time = 0.0
+		self.latency = 0.0
+
+		# Statistics
+		self.dispatched = 0
+		self.skipped = 0
+		self.expired = 0
+		self.superseded = 0
+		self.stale = 0
+		self.failed = 0
+		self.published = 0
+		self.busy_time = 0.0
+
+		if self.net_table is not None:
+			self.net_table.putNumber("LastFrameTime", 0.0)
+
+		self.stopped = True
+		threading.Thread.__init__(self)
+
+	def stats(self):
+		return {
+			'dispatched': self.dispatched,
+			'skipped': self.skipped,
+			'expired': self.expired,
+			'superseded': self.superseded,
+			'stale': self.stale,
+			'failed': self.failed,
+			'published': self.published,
+			'busy': len(self.workers) - len(self._idle),
+			'workers': len(self.workers) - self._retire,
+			'source_dropped': getattr(self.source, 'dropped', 0)
+		}
+
+	def update_stats(self):
+		if self.net_table is not None:
+			for key, value in self.stats().items():
+				self.net_table.putNumber("Pool" + key.title().replace('_', ''), value)
+
+	def poll(self):
+		"""Takes the source's new frame, if any, as the next one to dispatch"""
+		if not self.source.new_frame:
+			return False
+		stamp = None
+		if hasattr(self.source, 'read_stamped'):
+			frame, stamp = self.source.read_stamped()
+		else:
+			frame = self.source.frame
+		if frame is None:
+			return False
+		if stamp is None:
+			stamp = time.monotonic()
+		with self.lock:
+			if self._latest is not None:
+				self.skipped += 1
+			self._latest = (frame, time.time(), stamp)
+		return True
+
+	def dispatch(self):
+		"""Gives the pending frame to an idle worker"""
+		with self.lock:
+			if self._latest is None or len(self._idle) == 0:
+				return False
+			frame, frame_time, stamp = self._latest
+			self._latest = None
+			if self.max_age is not None and time.monotonic() - stamp > self.max_age:
+				self.expired += 1
+				return False
+			worker = self._idle.pop()
+			seq = self._next_seq
+			self._next_seq += 1
+			self._in_flight[seq] = time.time()
+			self._captured[seq] = stamp
+			self.dispatched += 1
+		worker.submit(seq, frame, frame_time)
+		return True
+
+	def add_worker(self):
+		with self.lock:
+			if self._retire > 0:
+				# a busy worker about to be retired can simply stay
+				self._retire -= 1
+				return
+			worker = PoolWorker(self, debug_label="Proc{}".format(self._worker_ids))
+			self._worker_ids += 1
+			self.workers.append(worker)
+			self._idle.append(worker)
+		if not self.stopped:
+			worker.start()
+
+	def remove_worker(self):
+		"""Removes a worker, an idle one if there is one; never the last one"""
+		with self.lock:
+			if len(self.workers) - self._retire <= 1:
+				return False
+			if len(self._idle) == 0:
+				self._retire += 1
+				return True
+			worker = self._idle.pop()
+			self.workers.remove(worker)
+		worker.stop()
+		return True
+
+	def done(self, worker, seq, frame, frame_time, results, failed=False):
+		"""Called by a worker with the result of frame seq"""
+		with self.lock:
+			self._in_flight.pop(seq, None)
+			self.busy_time += worker.duration.elapsed()
+			if self._retire > 0:
+				self._retire -= 1
+				self.workers.remove(worker)
+				worker.stop()
+			else:
+				self._idle.append(worker)
+			if failed:
+				self.failed += 1
+				self._captured.pop(seq, None)
+			elif seq <= self.published_seq:
+				self.stale += 1
+				self._captured.pop(seq, None)
+			else:
+				self._finished[seq] = (frame, frame_time, results)
+			published = self.flush()
+			self.lock.notify_all()
+		self.notify(published)
+
+	def flush(self):
+		"""Publishes the newest finished result that no older in-flight
+		frame is still allowed to precede (called with lock held); returns
+		(seq, frame, results, latency) of what it published, for notify()"""
+		if len(self._finished) == 0:
+			return None
+		now = time.time()
+		# frames in flight for longer than reorder_timeout are not waited for
+		waiting = [s for s, t in self._in_flight.items() if now - t <= self.reorder_timeout]
+		limit = min(waiting) if len(waiting) > 0 else float('inf')
+		ready = [s for s in self._finished if s < limit]
+		if len(ready) == 0:
+			return None
+		newest = max(ready)
+		frame, frame_time, results = self._finished.pop(newest)
+		for s in ready:
+			if s != newest:
+				del self._finished[s]
+				del self._captured[s]
+				self.superseded += 1
+		self.published_seq = newest
+		self.published += 1
+		self.results = results
+		self.last_frame_time = frame_time
+		self.latency = time.monotonic() - self._captured.pop(newest)
+		if self.net_table is not None:
+			publish_results(self.net_table, results, frame_time, newest)
+			self.net_table.putNumber("FrameLatency", self.latency)
+		return (newest, frame, results, self.latency)
+
+	def notify(self, published):
+		"""Hands what flush() published to the callback (called without the lock)"""
+		if published is not None and self.callback is not None:
+			self.callback(*published)
+
+	def stop(self):
+		self.stopped = True
+		for worker in self.workers:
+			worker.stop()
+
+	def start(self):
+		self.stopped = False
+		for worker in self.workers:
+			worker.start()
+		threading.Thread.start(self)
+
+	def run(self):
+		self.thread_setup('processing')
+		next_stats = time.time() + 1.0
+		while not self.stopped:
+			self.poll()
+			if not self.dispatch():
+				with self.lock:
+					# also releases results held for a frame that timed out
+					published = self.flush()
+					self.lock.wait(0.001)
+				self.notify(published)
+			if time.time() > next_stats:
+				next_stats += 1.0
+				self.update_stats()
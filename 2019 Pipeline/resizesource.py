@@ -1,27 +1,31 @@
 import cv2
 
-class ResizeSource(object):
-	def __init__(self, base_source, res=None):
-		self._base_source = base_source
+from Source import DerivedSource
+
+
+class ResizeSource(DerivedSource):
+	"""Scales frames to res for display, into double-buffered outputs
+
+	interpolation defaults to INTER_AREA when shrinking and INTER_NEAREST
+	when enlarging, which look right on a driver station and cost the least.
+	"""
+	def __init__(self, base_source, res=None, interpolation=None):
+		DerivedSource.__init__(self, base_source)
 		if res is not None:
 			self.width = res[0]
 			self.height = res[1]
 		else:
 			self.width = int(self._base_source.width)
 			self.height = int(self._base_source.height)
+		self.interpolation = interpolation
 	
-	@property
-	def frame(self):
-		return cv2.resize(self._base_source.frame, (self.width, self.height))
-
-	@property
-	def exposure(self):
-		return self._base_source.exposure
-
-	@exposure.setter
-	def exposure(self, val):
-		self._base_source.exposure = val
-
-	@property
-	def new_frame(self):
-		return self._base_source.new_frame
+	def compute(self, frame):
+		interpolation = self.interpolation
+		if interpolation is None:
+			if self.width <= frame.shape[1] and self.height <= frame.shape[0]:
+				interpolation = cv2.INTER_AREA
+			else:
+				interpolation = cv2.INTER_NEAREST
+		out = self.output_buffer((self.height, self.width) + frame.shape[2:], frame.dtype)
+		cv2.resize(frame, (self.width, self.height), dst=out, interpolation=interpolation)
+		return out
@@ -0,0 +1,151 @@
+import threading
+import logging
+import time
+import os
+
+from configs import configs
+
+
+class SchedPolicy(object):
+	"""
+	CPU affinity and priority per thread role
+
+	roles maps a role ('capture', 'processing', 'streaming', 'other') to its
+	settings: cpus (cores to pin to; cores the machine does not have are
+	left out), nice, and fifo (a SCHED_FIFO priority, used instead of nice
+	where permitted). A thread calls apply() with its role when it starts.
+	New threads inherit the cores and nice value of the thread that creates
+	them, so the main thread takes the 'other' role before it starts
+	NetworkTables and cscore, whose own threads (the stream encoder among
+	them) then stay off the capture cores. Linux only; elsewhere, or with enabled
+	False, nothing is changed. What could not be applied (negative nice or
+	SCHED_FIFO without the privileges, say) is noted rather than raised, and
+	report() logs and publishes the policy actually in effect.
+
+	python schedpolicy.py measures the wake-up jitter of a periodic capture
+	thread under full CPU load with and without the policy.
+	"""
+	def __init__(self, roles, enabled=True):
+		self.logger = logging.getLogger("SchedPolicy")
+		self.roles = roles
+		self.enabled = enabled and hasattr(os, 'sched_setaffinity')
+		self.lock = threading.Lock()
+		self.applied = list()   # (role, thread name, native id, what was done)
+
+	def apply(self, role, tid=None, name=None):
+		"""Applies role's policy to thread tid (the calling thread by default)"""
+		settings = self.roles.get(role)
+		if not self.enabled or settings is None:
+			return None
+		if tid is None:
+			tid = threading.get_native_id()
+			name = threading.current_thread().name
+		done = list()
+
+		cpus = settings.get('cpus')
+		if cpus is not None:
+			present = [cpu for cpu in cpus if cpu < os.cpu_count()]
+			if len(present) == 0:
+				done.append("cpus {} not present".format(list(cpus)))
+			else:
+				try:
+					os.sched_setaffinity(tid, present)
+					done.append("cpus {}".format(present))
+				except OSError as e:
+					done.append("cpus {} failed ({})".format(present, e.strerror))
+
+		fifo = settings.get('fifo')
+		if fifo is not None:
+			try:
+				os.sched_setscheduler(tid, os.SCHED_FIFO, os.sched_param(fifo))
+				done.append("fifo {}".format(fifo))
+				fifo_set = True
+			except OSError:
+				done.append("fifo {} not permitted".format(fifo))
+				fifo_set = False
+		nice = settings.get('nice')
+		if nice is not None and (fifo is None or not fifo_set):
+			try:
+				os.setpriority(os.PRIO_PROCESS, tid, nice)
+				done.append("nice {}".format(nice))
+			except OSError:
+				done.append("nice {} not permitted".format(nice))
+
+		description = ", ".join(done)
+		with self.lock:
+			self.applied.append((role, name, tid, description))
+		self.logger.debug("{} {} ({}): {}".format(role, name, tid, description))
+		return description
+
+	def report(self, net_table=None):
+		"""Logs the applied policy per role and publishes it as Sched<Role>"""
+		if not self.enabled:
+			self.logger.info("Scheduling policy not applied")
+			return
+		with self.lock:
+			applied = list(self.applied)
+		for role in sorted({entry[0] for entry in applied}):
+			entries = [entry for entry in applied if entry[0] == role]
+			descriptions = sorted({entry[3] for entry in entries})
+			summary = "{} threads: {}".format(len(entries), "; ".join(descriptions))
+			self.logger.info("{}: {}".format(role, summary))
+			if net_table is not None:
+				net_table.putString("Sched" + role.capitalize(), summary)
+
+
+policy = SchedPolicy(configs['sched_policy'], configs['sched_enabled'])
+
+
+def apply_policy(role):
+	"""Applies the configured policy for role to the calling thread"""
+	return policy.apply(role)
+
+
+def _burn(stop):
+	while not stop.is_set():
+		pass
+
+
+def bench(period=0.005, samples=600):
+	"""Wake-up lateness of a periodic thread while every core is busy, first
+	with no policy, then with the capture role for it and the processing
+	role for the load"""
+	import multiprocessing
+
+	def measure(capture_role, load_role):
+		stop = multiprocessing.Event()
+		load = [multiprocessing.Process(target=_burn, args=(stop,)) for _ in range(os.cpu_count())]
+		for proc in load:
+			proc.start()
+			if load_role is not None:
+				policy.apply(load_role, proc.pid, "load")
+		late = list()
+
+		def capture():
+			if capture_role is not None:
+				policy.apply(capture_role)
+			deadline = time.monotonic()
+			for _ in range(samples):
+				deadline += period
+				time.sleep(max(0.0, deadline - time.monotonic()))
+				late.append(time.monotonic() - deadline)
+
+		thread = threading.Thread(target=capture)
+		thread.start()
+		thread.join()
+		stop.set()
+		for proc in load:
+			proc.join()
+		late.sort()
+		return (1000.0 * sum(late) / len(late), 1000.0 * late[int(0.99 * len(late))], 1000.0 * late[-1])
+
+	print("{} cpus, period {} ms, {} wake-ups".format(os.cpu_count(), 1000 * period, samples))
+	for label, roles in (("no policy", (None, None)), ("policy", ('capture', 'processing'))):
+		mean, p99, worst = measure(*roles)
+		print("{:10} late by mean {:.3f} ms, p99 {:.3f} ms, max {:.3f} ms".format(label, mean, p99, worst))
+	policy.report()
+
+
+if __name__ == '__main__':
+	logging.basicConfig(level=logging.INFO)
+	bench()
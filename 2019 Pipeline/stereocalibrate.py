@@ -0,0 +1,136 @@
+import argparse
+import logging
+import glob
+import os
+import time
+
+import numpy as np
+import cv2
+
+from configs import configs
+
+
+class StereoCalibrator(object):
+	"""
+	Writes the stereo calibration StereoDepth loads (configs['stereo_calibration'])
+
+	Chessboard views are taken as (left, right) image pairs, from two cameras
+	or from saved left*.png/right*.png files. Pairs where the board is not
+	found in both views are skipped. Each camera is calibrated on its own,
+	then cv2.stereoCalibrate finds the pose of the right camera with the
+	intrinsics fixed. The .npz holds K1, D1, K2, D2, R, T (meters, from
+	square_size) and size (width, height), which is what StereoRectifier
+	reads.
+
+	python stereocalibrate.py -l 0 -r 1 grabs a pair every second from
+	cameras 0 and 1 until it has -n of them (show the board in different
+	positions and angles); -images dir calibrates from saved pairs instead.
+	"""
+	def __init__(self, board=(9, 6), square_size=0.025):
+		self.logger = logging.getLogger("StereoCalibrator")
+		self.board = board
+		self.square_size = square_size
+		self.size = None
+
+		# board corners in board coordinates (meters), the same for every view
+		self.board_points = np.zeros((board[0] * board[1], 3), np.float32)
+		self.board_points[:, :2] = np.mgrid[0:board[0], 0:board[1]].T.reshape(-1, 2) * square_size
+
+		self.left_points = list()
+		self.right_points = list()
+
+	def find_corners(self, image):
+		"""Sub-pixel chessboard corners of image, or None"""
+		gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+		found, corners = cv2.findChessboardCorners(gray, self.board,
+												cv2.CALIB_CB_ADAPTIVE_THRESH | cv2.CALIB_CB_NORMALIZE_IMAGE)
+		if not found:
+			return None
+		criteria = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 30, 0.001)
+		return cv2.cornerSubPix(gray, corners, (11, 11), (-1, -1), criteria)
+
+	def add_pair(self, left, right):
+		"""Adds a view of the board; False if it was not found in both images"""
+		size = (left.shape[1], left.shape[0])
+		if self.size is not None and size != self.size:
+			raise ValueError("pair size {} differs from {}".format(size, self.size))
+		left_corners = self.find_corners(left)
+		right_corners = self.find_corners(right) if left_corners is not None else None
+		if right_corners is None:
+			return False
+		self.size = size
+		self.left_points.append(left_corners)
+		self.right_points.append(right_corners)
+		return True
+
+	def calibrate(self):
+		"""The calibration as a dict of arrays, and the RMS reprojection error"""
+		if len(self.left_points) < 3:
+			raise ValueError("need at least 3 board views, have {}".format(len(self.left_points)))
+		object_points = [self.board_points] * len(self.left_points)
+		_, k1, d1, _, _ = cv2.calibrateCamera(object_points, self.left_points, self.size, None, None)
+		_, k2, d2, _, _ = cv2.calibrateCamera(object_points, self.right_points, self.size, None, None)
+		criteria = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 100, 1e-5)
+		rms, k1, d1, k2, d2, r, t, _, _ = cv2.stereoCalibrate(object_points, self.left_points, self.right_points,
+															k1, d1, k2, d2, self.size,
+															criteria=criteria, flags=cv2.CALIB_FIX_INTRINSIC)
+		self.logger.info("{} views, RMS error {:.3f} px, baseline {:.3f} m".format(
+			len(self.left_points), rms, float(np.linalg.norm(t))))
+		return dict(K1=k1, D1=d1, K2=k2, D2=d2, R=r, T=t, size=np.array(self.size)), rms
+
+	def save(self, path):
+		calib, rms = self.calibrate()
+		np.savez(path, **calib)
+		self.logger.info("Wrote {}".format(path))
+		return rms
+
+
+def from_images(calibrator, directory):
+	"""Adds every left*.png/right*.png pair (matched by sorted name) in directory"""
+	lefts = sorted(glob.glob(os.path.join(directory, 'left*.png')))
+	rights = sorted(glob.glob(os.path.join(directory, 'right*.png')))
+	for left, right in zip(lefts, rights):
+		if not calibrator.add_pair(cv2.imread(left), cv2.imread(right)):
+			calibrator.logger.info("Board not found in {} / {}".format(left, right))
+
+
+def from_cameras(calibrator, left_num, right_num, count, interval=1.0):
+	"""Grabs a pair from both cameras every interval seconds until count have the board"""
+	width, height = configs['camera_res']
+	cams = [cv2.VideoCapture(left_num), cv2.VideoCapture(right_num)]
+	for cam in cams:
+		cam.set(cv2.CAP_PROP_FRAME_WIDTH, width)
+		cam.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
+	try:
+		while len(calibrator.left_points) < count:
+			# grab both before decoding either, so the views are close in time
+			if not (cams[0].grab() and cams[1].grab()):
+				raise IOError("camera {} or {} did not deliver a frame".format(left_num, right_num))
+			_, left = cams[0].retrieve()
+			_, right = cams[1].retrieve()
+			if calibrator.add_pair(left, right):
+				calibrator.logger.info("View {}/{}".format(len(calibrator.left_points), count))
+			time.sleep(interval)
+	finally:
+		for cam in cams:
+			cam.release()
+
+
+if __name__ == '__main__':
+	logging.basicConfig(level=logging.INFO)
+	parser = argparse.ArgumentParser()
+	parser.add_argument('-l', '--left', type=int, default=0, help='Left camera index')
+	parser.add_argument('-r', '--right', type=int, default=1, help='Right camera index')
+	parser.add_argument('-n', '--views', type=int, default=20, help='Board views to collect')
+	parser.add_argument('-images', '--images', help='Directory of left*.png/right*.png pairs instead of cameras')
+	parser.add_argument('-board', '--board', type=int, nargs=2, default=(9, 6), help='Inner corners per row and column')
+	parser.add_argument('-square', '--square', type=float, default=0.025, help='Square size in meters')
+	parser.add_argument('-o', '--output', default=configs['stereo_calibration'], help='Calibration file to write')
+	args = vars(parser.parse_args())
+
+	calibrator = StereoCalibrator(tuple(args['board']), args['square'])
+	if args['images'] is not None:
+		from_images(calibrator, args['images'])
+	else:
+		from_cameras(calibrator, args['left'], args['right'], args['views'])
+	calibrator.save(args['output'])
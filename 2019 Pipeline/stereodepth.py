@@ -0,0 +1,301 @@
+import threading
+import logging
+import time
+
+import numpy as np
+import cv2
+
+from processimage import ProcessImage
+from configs import configs
+from schedpolicy import apply_policy
+
+
+class StereoRectifier(object):
+	"""
+	Rectification maps for a stereo pair, built once from a stored calibration
+
+	The calibration is an .npz with K1, D1, K2, D2 (intrinsics and distortion),
+	R, T (right camera pose, T in meters) and size (width, height the
+	calibration was done at). The maps are built directly at
+	scale * size so that remap rectifies and downscales in a single pass,
+	and are converted to the fixed point format cv2.remap is fastest with.
+	rectify_points maps raw pixel coordinates to the same rectified views
+	without touching any image.
+	"""
+	def __init__(self, calibration_file, scale=1.0):
+		calib = np.load(calibration_file)
+		width, height = [int(v) for v in calib['size']]
+		self.size = (int(width * scale), int(height * scale))
+
+		scale_mat = np.diag([scale, scale, 1.0])
+		k1 = scale_mat.dot(calib['K1'])
+		k2 = scale_mat.dot(calib['K2'])
+
+		r1, r2, p1, p2, self.Q, _, _ = cv2.stereoRectify(k1, calib['D1'], k2, calib['D2'], self.size,
+														calib['R'], calib['T'], alpha=0)
+		# raw camera model and rectified projection per side, for points
+		self.cameras = ((calib['K1'], calib['D1'], r1, p1), (calib['K2'], calib['D2'], r2, p2))
+		self.P1 = p1
+		self.P2 = p2
+		self.left_maps = cv2.convertMaps(*cv2.initUndistortRectifyMap(k1, calib['D1'], r1, p1, self.size, cv2.CV_32FC1),
+										dstmap1type=cv2.CV_16SC2)
+		self.right_maps = cv2.convertMaps(*cv2.initUndistortRectifyMap(k2, calib['D2'], r2, p2, self.size, cv2.CV_32FC1),
+										dstmap1type=cv2.CV_16SC2)
+		self.Q = self.Q.astype(np.float64)
+
+		self._left = None
+		self._right = None
+
+	def rectify_points(self, points, side):
+		"""Nx2 raw pixel points of camera side (0 left, 1 right) to rectified
+		pixels at the rectifier's scale"""
+		k, d, r, p = self.cameras[side]
+		points = np.asarray(points, dtype=np.float64).reshape(-1, 1, 2)
+		return cv2.undistortPoints(points, k, d, R=r, P=p).reshape(-1, 2)
+
+	def rectify(self, left, right):
+		"""Rectifies a pair into buffers owned by the rectifier (reused every frame)"""
+		if self._left is None or self._left.shape[:2] != (self.size[1], self.size[0]) or self._left.shape[2:] != left.shape[2:]:
+			self._left = np.empty((self.size[1], self.size[0]) + left.shape[2:], dtype=left.dtype)
+			self._right = np.empty_like(self._left)
+		cv2.remap(left, self.left_maps[0], self.left_maps[1], cv2.INTER_LINEAR, dst=self._left)
+		cv2.remap(right, self.right_maps[0], self.right_maps[1], cv2.INTER_LINEAR, dst=self._right)
+		return self._left, self._right
+
+
+class StereoDepth(threading.Thread):
+	"""
+	Streaming stereo depth for vision target centroids
+
+	Takes (left, right) frame pairs from a synchronized source (FrameSync over
+	two Cv2Capture), rectifies them with cached maps, runs one reused StereoSGBM
+	matcher only inside roi (x, y, w, h in rectified pixels, None for the whole
+	frame) and publishes
+	the 3D position (meters, left camera frame) of every target that
+	ProcessImage.FindTarget finds in the rectified left view.
+
+	mode='sparse' skips images and disparity altogether: FindTarget runs on
+	both raw views, only the target keypoints (strip centers and corners) are
+	rectified, targets are paired along the epipolar lines (same rectified row
+	within epipolar_tol pixels, positive disparity below num_disparities) and
+	their keypoints are triangulated. keypoints holds the 3D keypoints of each
+	target (10x3: two strip centers, then four corners per strip).
+
+	A pair whose older frame was captured more than max_age seconds ago is
+	expired instead of processed; StereoLatency is the capture-to-publish
+	time of the last pair.
+	"""
+	def __init__(self, source, calibration_file, network_table=None,
+				scale=0.5, roi=None, num_disparities=64, block_size=5,
+				mode='dense', epipolar_tol=2.0, max_age=None):
+		self.logger = logging.getLogger("StereoDepth")
+		if mode not in ('dense', 'sparse'):
+			raise ValueError("Unknown StereoDepth mode {}".format(mode))
+		self.source = source
+		self.net_table = network_table
+		self.mode = mode
+		self.epipolar_tol = epipolar_tol
+		self.max_age = max_age
+
+		self.rectifier = StereoRectifier(calibration_file, scale)
+		self.num_disparities = num_disparities
+		if roi is None:
+			roi = (0, 0, self.rectifier.size[0], self.rectifier.size[1])
+		self.roi = roi
+
+		# Created once, reused for every frame
+		self.stereo = None
+		if mode == 'dense':
+			self.stereo = cv2.StereoSGBM_create(minDisparity=0,
+												numDisparities=num_disparities,
+												blockSize=block_size,
+												P1=8 * block_size ** 2,
+												P2=32 * block_size ** 2,
+												disp12MaxDiff=1,
+												uniquenessRatio=10,
+												speckleWindowSize=100,
+												speckleRange=2,
+												mode=cv2.STEREO_SGBM_MODE_SGBM_3WAY)
+		self.processor = ProcessImage()
+
+		self._gray_left = None
+		self._gray_right = None
+		self._disparity = None
+
+		self.results = list()   # (x, y, z) per target
+		self.keypoints = list() # sparse mode only, see above
+		self.last_frame_time = 0.0
+		self.latency = 0.0
+		self.expired = 0
+
+		self.stopped = True
+		threading.Thread.__init__(self)
+
+	def band(self):
+		"""Rows and columns handed to SGBM: the roi plus num_disparities columns
+		to its left, which the search needs to see"""
+		x, y, w, h = self.roi
+		x0 = max(0, x - self.num_disparities)
+		return x0, y, x + w, y + h
+
+	def disparity(self, left, right):
+		"""Disparity (in pixels, float32) over band(), into reused buffers"""
+		x0, y0, x1, y1 = self.band()
+		if self._gray_left is None or self._gray_left.shape != (y1 - y0, x1 - x0):
+			self._gray_left = np.empty((y1 - y0, x1 - x0), dtype=np.uint8)
+			self._gray_right = np.empty_like(self._gray_left)
+			self._disparity = np.empty((y1 - y0, x1 - x0), dtype=np.int16)
+		cv2.cvtColor(left[y0:y1, x0:x1], cv2.COLOR_BGR2GRAY, dst=self._gray_left)
+		cv2.cvtColor(right[y0:y1, x0:x1], cv2.COLOR_BGR2GRAY, dst=self._gray_right)
+		self.stereo.compute(self._gray_left, self._gray_right, self._disparity)
+		return self._disparity
+
+	def locate(self, disparity, x, y, radius=2):
+		"""3D point for pixel (x, y) of the rectified left view from the median
+		of the valid disparities around it, or None"""
+		x0, y0, x1, y1 = self.band()
+		rx, ry, rw, rh = self.roi
+		if not (rx <= x < rx + rw and ry <= y < ry + rh):
+			return None
+		px = int(x) - x0
+		py = int(y) - y0
+		window = disparity[max(0, py - radius):py + radius + 1, max(0, px - radius):px + radius + 1]
+		valid = window[window > 0]
+		if len(valid) == 0:
+			return None
+		d = np.median(valid) / 16.0     # SGBM disparities are fixed point x16
+		point = self.rectifier.Q.dot([x, y, d, 1.0])
+		return tuple(point[0:3] / point[3])
+
+	def update_results(self):
+		if self.net_table is not None:
+			self.net_table.putNumber("StereoFrameTime", self.last_frame_time)
+			self.net_table.putNumber("StereoNumTargets", len(self.results))
+			self.net_table.putNumber("StereoLatency", self.latency)
+			self.net_table.putNumber("StereoExpired", self.expired)
+			self.net_table.putNumberArray("stereo_x", [p[0] for p in self.results])
+			self.net_table.putNumberArray("stereo_y", [p[1] for p in self.results])
+			self.net_table.putNumberArray("stereo_z", [p[2] for p in self.results])
+
+	@staticmethod
+	def target_keypoints(target):
+		"""Strip centers then each strip's corners (top two, then bottom two,
+		left to right) so that the same index means the same point in both views"""
+		points = [target.l_rect.raw_rect[0], target.r_rect.raw_rect[0]]
+		for rect in (target.l_rect.raw_rect, target.r_rect.raw_rect):
+			corners = sorted(cv2.boxPoints(rect).tolist(), key=lambda p: p[1])
+			points.extend(sorted(corners[0:2]) + sorted(corners[2:4]))
+		return np.array(points, dtype=np.float64)
+
+	def process_sparse(self, left, right):
+		"""Depth for the targets in one raw left/right pair from their keypoints only"""
+		left_points = [self.rectifier.rectify_points(self.target_keypoints(t), 0)
+						for t in self.processor.FindTarget(left)]
+		right_points = [self.rectifier.rectify_points(self.target_keypoints(t), 1)
+						for t in self.processor.FindTarget(right)]
+
+		# greedy pairing on the strip centers, closest row first
+		pairs = list()
+		for li, lp in enumerate(left_points):
+			for ri, rp in enumerate(right_points):
+				dy = np.abs(lp[0:2, 1] - rp[0:2, 1]).max()
+				disparity = (lp[0:2, 0] - rp[0:2, 0]).mean()
+				if dy <= self.epipolar_tol and 0 < disparity < self.num_disparities:
+					pairs.append((dy, li, ri))
+		pairs.sort()
+
+		results = list()
+		self.keypoints = list()
+		used_left = set()
+		used_right = set()
+		for _, li, ri in pairs:
+			if li in used_left or ri in used_right:
+				continue
+			used_left.add(li)
+			used_right.add(ri)
+			points = cv2.triangulatePoints(self.rectifier.P1, self.rectifier.P2,
+											left_points[li].T, right_points[ri].T)
+			points = (points[0:3] / points[3]).T
+			self.keypoints.append(points)
+			results.append(tuple(points[0:2].mean(axis=0)))
+		return results
+
+	def process(self, left, right):
+		"""Depth for the targets in one (unrectified) left/right pair"""
+		if self.mode == 'sparse':
+			return self.process_sparse(left, right)
+
+		left, right = self.rectifier.rectify(left, right)
+		x0, y0, x1, y1 = self.band()
+		targets = self.processor.FindTarget(left[y0:y1, x0:x1])
+		if len(targets) == 0:
+			return list()
+
+		disparity = self.disparity(left, right)
+		results = list()
+		for target in targets:
+			cx = x0 + (target.l_rect.center_pos.x + target.r_rect.center_pos.x) / 2.0
+			cy = y0 + (target.l_rect.center_pos.y + target.r_rect.center_pos.y) / 2.0
+			point = self.locate(disparity, cx, cy)
+			if point is not None:
+				results.append(point)
+		return results
+
+	def stop(self):
+		self.stopped = True
+
+	def start(self):
+		self.stopped = False
+		threading.Thread.start(self)
+
+	def run(self):
+		apply_policy('processing')
+		frame_hist = list()
+		while not self.stopped:
+			if not self.source.new_frame:
+				time.sleep(0.001)
+				continue
+			if len(frame_hist) == 10:
+				print("stereo:{}".format(1/(sum(frame_hist)/len(frame_hist))))
+				frame_hist = list()
+			self.last_frame_time = time.time()
+			if hasattr(self.source, 'read_stamped'):
+				(left, right), stamps = self.source.read_stamped()
+				captured = min(stamps)
+			else:
+				left, right = self.source.frame
+				captured = time.monotonic()
+			if self.max_age is not None and time.monotonic() - captured > self.max_age:
+				self.expired += 1
+				continue
+			self.results = self.process(left, right)
+			self.latency = time.monotonic() - captured
+			self.update_results()
+			frame_hist.append(time.time() - self.last_frame_time)
+
+
+if __name__ == '__main__':
+	from cv2capture import Cv2Capture
+	from framesync import FrameSync
+	logging.basicConfig(level=logging.DEBUG)
+
+	left = Cv2Capture(camera_num=0, res=configs['camera_res'])
+	right = Cv2Capture(camera_num=1, res=configs['camera_res'])
+	left.start()
+	right.start()
+
+	sync = FrameSync(left, right)
+	sync.start()
+
+	depth = StereoDepth(sync, configs['stereo_calibration'])
+	depth.start()
+
+	try:
+		while True:
+			time.sleep(1)
+			print(depth.results)
+	except KeyboardInterrupt:
+		depth.stop()
+		sync.stop()
+		left.stop()
+		right.stop()
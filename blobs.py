@@ -0,0 +1,203 @@
+'''
+blobs
+
+Blob extraction with a choice of backend
+
+    - 'contours' is what the GRIP pipelines always did: findContours, then
+      boundingRect, contourArea, ... called from Python once per contour
+    - 'components' labels the mask with connectedComponentsWithStats,
+      which hands back box, area and centroid of every blob as one NumPy
+      array; filters on those are whole-array operations and a blob's
+      contour is only traced (inside its own box) when something asks
+      for it, i.e. for the few blobs that survive the filtering
+
+Both backends give a Blobs object with the same interface, and
+findFilteredBlobs runs the GRIP find + filter contours steps on either. Two
+differences to keep in mind when switching: the components area is the
+pixel count (contourArea of the outline is smaller by about half the
+perimeter), and blobs inside the holes of other blobs are only dropped
+by the contours backend with external_only.
+
+python blobs.py runs a benchmark over the number of blobs in a frame and
+prints where the components backend starts to win.
+'''
+import cv2
+import numpy as np
+
+BACKENDS = ('contours', 'components')
+
+# Columns of Blobs.stats
+X = 0
+Y = 1
+WIDTH = 2
+HEIGHT = 3
+AREA = 4
+
+
+def findContours(image, mode, method=cv2.CHAIN_APPROX_SIMPLE):
+    """cv2.findContours contours for both the 3.x and the 4.x return value"""
+    return cv2.findContours(image, mode=mode, method=method)[-2]
+
+
+class Blobs:
+    """
+    Blobs of one binary mask: stats (Nx5 int32 x, y, width, height, area),
+    centroids (Nx2 float64) and contours that are built on demand
+    """
+
+    def __init__(self, stats, centroids, contours=None, labels=None, ids=None):
+        """initializes all values to presets or None if need to be set
+
+        contours is the full list for the contours backend; labels and ids
+        (label of each blob) are what the components backend traces them from
+        """
+        self.stats = stats
+        self.centroids = centroids
+        self._contours = contours
+        self._labels = labels
+        self._ids = ids
+
+    def __len__(self):
+        return len(self.stats)
+
+    def contour(self, i):
+        """Outer contour of blob i (in image coordinates)"""
+        if (self._contours[i] is None):
+            x, y, w, h = self.stats[i, 0:4]
+            # one pixel of margin so the blob never touches the image edge
+            roi = np.zeros((h + 2, w + 2), dtype=np.uint8)
+            np.equal(self._labels[y:y+h, x:x+w], self._ids[i], out=roi[1:-1, 1:-1].view(bool))
+            contours = findContours(roi, cv2.RETR_EXTERNAL)
+            self._contours[i] = max(contours, key=len) + np.array([x - 1, y - 1], dtype=np.int32)
+        return self._contours[i]
+
+    def contours(self):
+        return [self.contour(i) for i in range(len(self))]
+
+    def select(self, keep):
+        """Blobs for a boolean mask or index array over these blobs"""
+        index = np.arange(len(self))[keep]
+        ids = None if self._ids is None else self._ids[index]
+        return Blobs(self.stats[index], self.centroids[index],
+                     [self._contours[i] for i in index], self._labels, ids)
+
+    def filter(self, min_area=0.0, min_perimeter=0.0, min_width=0.0, max_width=1e9,
+               min_height=0.0, max_height=1e9, solidity=(0, 100),
+               max_vertex_count=1e9, min_vertex_count=0.0, min_ratio=0.0, max_ratio=1e9):
+        """The GRIP contour filter: box, area and ratio tests run on the
+        stats array; perimeter, solidity and vertex tests, which need the
+        contour, only run when set and only on the blobs still left
+        """
+        stats = self.stats
+        w = stats[:, WIDTH]
+        h = stats[:, HEIGHT]
+        keep = ((w >= min_width) & (w <= max_width) &
+                (h >= min_height) & (h <= max_height) &
+                (stats[:, AREA] >= min_area))
+        ratio = w / np.maximum(h, 1).astype(np.float64)
+        keep &= (ratio >= min_ratio) & (ratio <= max_ratio)
+        blobs = self.select(keep)
+
+        if ((min_perimeter <= 0) and (tuple(solidity) == (0, 100)) and
+                (min_vertex_count <= 0) and (max_vertex_count >= 1e6)):
+            return blobs
+
+        keep = np.zeros(len(blobs), dtype=bool)
+        for i in range(len(blobs)):
+            contour = blobs.contour(i)
+            if (cv2.arcLength(contour, True) < min_perimeter):
+                continue
+            area = cv2.contourArea(contour)
+            hullArea = cv2.contourArea(cv2.convexHull(contour))
+            solid = 100 * area / hullArea if hullArea > 0 else 0.0
+            if (solid < solidity[0] or solid > solidity[1]):
+                continue
+            if (len(contour) < min_vertex_count or len(contour) > max_vertex_count):
+                continue
+            keep[i] = True
+        return blobs.select(keep)
+
+
+def fromContours(mask, external_only=True):
+    """Blobs through findContours; mask may be modified (OpenCV 3.x)"""
+    mode = cv2.RETR_EXTERNAL if external_only else cv2.RETR_LIST
+    contours = findContours(mask, mode)
+    stats = np.empty((len(contours), 5), dtype=np.int32)
+    centroids = np.empty((len(contours), 2), dtype=np.float64)
+    for i, contour in enumerate(contours):
+        stats[i, 0:4] = cv2.boundingRect(contour)
+        stats[i, AREA] = cv2.contourArea(contour)
+        m = cv2.moments(contour)
+        if (m['m00'] != 0):
+            centroids[i] = (m['m10'] / m['m00'], m['m01'] / m['m00'])
+        else:
+            centroids[i] = stats[i, 0:2] + stats[i, 2:4] / 2.0
+    return Blobs(stats, centroids, list(contours))
+
+
+def fromComponents(mask, connectivity=8):
+    """Blobs through connectedComponentsWithStats, contours traced lazily"""
+    count, labels, stats, centroids = cv2.connectedComponentsWithStats(mask, connectivity=connectivity)
+    # label 0 is the background
+    return Blobs(stats[1:, 0:5].astype(np.int32), centroids[1:], [None] * (count - 1),
+                 labels, np.arange(1, count, dtype=labels.dtype))
+
+
+def findBlobs(mask, backend='contours', external_only=True):
+    """Blobs of mask through backend ('contours' or 'components')"""
+    if (backend == 'contours'):
+        return fromContours(mask, external_only)
+    if (backend == 'components'):
+        return fromComponents(mask)
+    raise ValueError("Unknown blob backend %s" % backend)
+
+
+def findFilteredBlobs(mask, backend, filterArgs, external_only=True):
+    """The find and filter contours steps of the GRIP pipelines in one call
+
+    filterArgs are the GRIP filter contours settings in their order
+    (min_area, min_perimeter, min_width, max_width, min_height, max_height,
+    solidity, max_vertex_count, min_vertex_count, min_ratio, max_ratio).
+    Returns (all blobs, filtered blobs, contours of the filtered blobs);
+    with the components backend only those contours are ever traced
+    """
+    blobs = findBlobs(mask, backend, external_only)
+    filtered = blobs.filter(*filterArgs)
+    return (blobs, filtered, filtered.contours())
+
+
+def bench(size=(240, 320), counts=(1, 4, 16, 64, 256, 1024), repeat=20):
+    """Times both backends for area, box and centroid of every blob over
+    masks with more and more (random, non touching) discs
+    """
+    import time
+    rng = np.random.RandomState(0)
+    (height, width) = size
+    crossover = None
+    print('%8s %12s %12s' % ('blobs', 'contours ms', 'components ms'))
+    for count in counts:
+        mask = np.zeros(size, dtype=np.uint8)
+        cells = int(np.ceil(np.sqrt(count)))
+        (ch, cw) = (height // cells, width // cells)
+        for i in range(count):
+            (r, c) = divmod(i, cells)
+            radius = max(1, min(ch, cw) // 2 - 2)
+            cy = r * ch + ch // 2 + rng.randint(-1, 2)
+            cx = c * cw + cw // 2 + rng.randint(-1, 2)
+            cv2.circle(mask, (int(cx), int(cy)), int(rng.randint(max(1, radius // 2), radius + 1)), 255, -1)
+
+        times = []
+        for backend in BACKENDS:
+            start = time.time()
+            for _ in range(repeat):
+                blobs = findBlobs(mask.copy(), backend)
+                blobs.filter(min_area=2)
+            times.append(1000.0 * (time.time() - start) / repeat)
+        print('%8d %12.3f %12.3f' % (count, times[0], times[1]))
+        if ((crossover is None) and (times[1] < times[0])):
+            crossover = count
+    print('components faster from %s blobs' % crossover)
+
+
+if __name__ == '__main__':
+    bench()
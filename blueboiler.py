@@ -1,19 +1,28 @@
 import cv2
 import numpy as np
 import math
+from resizer import interpolationFor
+
+from blobs import findFilteredBlobs, BACKENDS
 
 class BlueBoiler:
     """
     An OpenCV pipeline generated by GRIP.
     """
     
-    def __init__(self):
+    def __init__(self, blob_backend='contours'):
         """initializes all values to presets or None if need to be set
+
+        blob_backend 'components' finds and filters blobs on connected
+        component stats and traces contours only for the ones kept (see blobs)
         """
+        if (blob_backend not in BACKENDS):
+            raise ValueError("Unknown blob backend %s" % blob_backend)
+        self.blob_backend = blob_backend
 
         self.__resize_image_width = 320.0
         self.__resize_image_height = 240.0
-        self.__resize_image_interpolation = cv2.INTER_CUBIC
+        self.__resize_image_interpolation = None    # by resizer.interpolationFor
 
         self.resize_image_output = None
 
@@ -43,6 +52,7 @@ class BlueBoiler:
         self.__filter_contours_max_ratio = 1000.0
 
         self.filter_contours_output = None
+        self.filter_blobs_output = None
 
 
     def process(self, source0):
@@ -59,11 +69,16 @@ class BlueBoiler:
 
         # Step Find_Contours0:
         self.__find_contours_input = self.rgb_threshold_output
-        (self.find_contours_output) = self.__find_contours(self.__find_contours_input, self.__find_contours_external_only)
+        if (self.blob_backend == 'components'):
+            # Blobs instead of a contour list; the filter works on their stats
+            # and only the surviving contours are traced
+            (self.find_contours_output, self.filter_blobs_output, self.filter_contours_output) = findFilteredBlobs(self.__find_contours_input, 'components', (self.__filter_contours_min_area, self.__filter_contours_min_perimeter, self.__filter_contours_min_width, self.__filter_contours_max_width, self.__filter_contours_min_height, self.__filter_contours_max_height, self.__filter_contours_solidity, self.__filter_contours_max_vertices, self.__filter_contours_min_vertices, self.__filter_contours_min_ratio, self.__filter_contours_max_ratio))
+        else:
+            (self.find_contours_output) = self.__find_contours(self.__find_contours_input, self.__find_contours_external_only)
 
-        # Step Filter_Contours0:
-        self.__filter_contours_contours = self.find_contours_output
-        (self.filter_contours_output) = self.__filter_contours(self.__filter_contours_contours, self.__filter_contours_min_area, self.__filter_contours_min_perimeter, self.__filter_contours_min_width, self.__filter_contours_max_width, self.__filter_contours_min_height, self.__filter_contours_max_height, self.__filter_contours_solidity, self.__filter_contours_max_vertices, self.__filter_contours_min_vertices, self.__filter_contours_min_ratio, self.__filter_contours_max_ratio)
+            # Step Filter_Contours0:
+            self.__filter_contours_contours = self.find_contours_output
+            (self.filter_contours_output) = self.__filter_contours(self.__filter_contours_contours, self.__filter_contours_min_area, self.__filter_contours_min_perimeter, self.__filter_contours_min_width, self.__filter_contours_max_width, self.__filter_contours_min_height, self.__filter_contours_max_height, self.__filter_contours_solidity, self.__filter_contours_max_vertices, self.__filter_contours_min_vertices, self.__filter_contours_min_ratio, self.__filter_contours_max_ratio)
 
         # TODO: Optionally draw the contours for debug
         # For now, just uncomment as needed
@@ -92,17 +107,23 @@ class BlueBoiler:
         return (self.find_contours_output, self.filter_contours_output)
 
     @staticmethod
-    def __resize_image(input, width, height, interpolation):
+    def __resize_image(input, width, height, interpolation, resizer=None):
         """Scales and image to an exact size.
         Args:
             input: A numpy.ndarray.
             Width: The desired width in pixels.
             Height: The desired height in pixels.
-            interpolation: Opencv enum for the type fo interpolation.
+            interpolation: Opencv enum for the type fo interpolation, or None
+                for resizer.interpolationFor('process', ...) (INTER_AREA to shrink).
+            resizer: A resizer.Resizer to resize into its reused buffers, or None.
         Returns:
             A numpy.ndarray of the new size.
         """
-        return cv2.resize(input, ((int)(width), (int)(height)), 0, 0, interpolation)
+        if (interpolation is None):
+            interpolation = interpolationFor('process', (input.shape[1], input.shape[0]), (width, height))
+        if (resizer is not None):
+            return resizer.resize(input, width, height, interpolation)
+        return cv2.resize(input, ((int)(width), (int)(height)), interpolation=interpolation)
 
     @staticmethod
     def __rgb_threshold(input, red, green, blue):
@@ -2,99 +2,118 @@ import cv2
 import numpy as np
 import math
 
+from featurematcher import FeatureMatcher
+from templatelibrary import TemplateLibrary, FEET_TO_METERS
+from targetdata import TargetData
+from homographyverifier import HomographyVerifier
+
 class Boiler:
     """
     An OpenCV pipeline generated by GRIP.
     """
     
-    def __init__(self):
+    def __init__(self, templateDir=None, fps=30, detectSize=240, maxFeatures=200):
         """initializes all values to presets or None if need to be set
+
+        When templateDir (e.g., 'redBoiler') is given the frame is matched
+        against every labelled reference in it and targetData.distance_m is
+        taken from the label of the reference that matched
+
+        fps is the capture rate; a frame gets one capture period from its
+        arrival, detection included, so detectSize and maxFeatures keep
+        detection to part of it
         """
         self.MIN_MATCH_COUNT = 10
+        self.targetData = TargetData()
+        self.label = None
 
-        # load the image, convert it to grayscale, and detect edges
-        self.trainingImage = cv2.imread("redBoilerTrainWhole.jpg",cv2.IMREAD_GRAYSCALE)
-        print(self.trainingImage.shape)        
+        # Bounds the whole frame (detection, matching and homography
+        # search) to one capture period
+        self.verifier = HomographyVerifier(budget=1.0/fps)
 
-        # Initiate a detector
-        #self.detector = cv2.xfeatures2d.SIFT_create()
-        self.detector = cv2.xfeatures2d.SURF_create()
-        self.norm = cv2.NORM_L2       
-        # find the keypoints and descriptors with SIFT
-        self.kp1, self.des1 = self.detector.detectAndCompute(self.trainingImage,None)
+        self.library = None
+        if (templateDir is not None):
+            self.library = TemplateLibrary('surf', minMatchCount=self.MIN_MATCH_COUNT,
+                                           detectSize=detectSize, maxFeatures=maxFeatures)
+            self.library.verifier = self.verifier
+            self.library.train(templateDir)
+            print(self.library.names)
+            return
 
-        # create BFMatcher object
-        self.crossCheck = False
-        self.bf = cv2.BFMatcher(self.norm, self.crossCheck)
+        # Training keypoints, descriptors and FLANN index are computed on the
+        # first run and loaded from disk next to the training image after that
+        #self.matcher = FeatureMatcher('sift')
+        #self.matcher = FeatureMatcher('orb')      # free, faster, binary descriptors
+        self.matcher = FeatureMatcher('surf', detectSize=detectSize, maxFeatures=maxFeatures)
+        self.matcher.train("redBoilerTrainWhole.jpg")
+        print(self.matcher.shape)
 
 
     def process(self, source0):
         """
         Runs the pipeline and sets all outputs to new values.
         """
-        
+        if (self.library is not None):
+            # find() starts the frame's budget itself
+            self.processLibrary(source0, cv2.cvtColor(source0, cv2.COLOR_BGR2GRAY))
+            return
+
+        self.verifier.startFrame()
         img2 = cv2.cvtColor(source0, cv2.COLOR_BGR2GRAY)
-        kp2, des2 = self.detector.detectAndCompute(img2,None)
 
-        # Match descriptors.
-        if (self.crossCheck == True):
-            matches = self.bf.match(self.des1,des2)
-            # Sort them in the order of their distance.
-            matches = sorted(matches, key = lambda x:x.distance)
+        # Match frame descriptors against the training index; the result
+        # already holds only the good matches as per Lowe's ratio test
+        src_pts, dst_pts, distance, kp2 = self.matcher.matchPoints(img2)
+
+        goodCount = len(distance)
+        if (goodCount>self.MIN_MATCH_COUNT):
+            M, mask = self.verifier.verify(src_pts, dst_pts)
+            if (mask is not None):
+                matchesMask = mask.ravel().tolist()
+                h,w = self.matcher.shape
+                pts = np.float32([ [0,0],[0,h-1],[w-1,h-1],[w-1,0] ]).reshape(-1,1,2)
+                dst = cv2.perspectiveTransform(pts,M)
+
+
+                angle = (goodCount-self.MIN_MATCH_COUNT-1)
+                if (angle > 50):
+                    angle = 50
+
+                angle = math.pi/2 * (angle / 50)
+                r = int(math.cos(angle)*255)
+                g = int(math.sin(angle)*255)
+
+                cv2.polylines(source0,[np.int32(dst)],True,(0,g,r),2, cv2.LINE_AA)
+
+            # The above polygon should be a quadralateral and should
+            # represent the extent of the boiler (even beyond the image)
+            # With some calibration we should be able to estimate the
+            # distance and angle, as well as estimate where the high
+            # goal should be.
+
         else:
-            if (des2 == None):
-                matches = None
-            else:
-                matches = self.bf.knnMatch(self.des1,des2,k=2)
-            
-        if ((self.crossCheck == False) and (matches != None) and (len(matches) > 1)):
-            # store all the good matches as per Lowe's ratio test.
-            good = []
-            for m,n in matches:
-                if m.distance < 0.7*n.distance:
-                    good.append(m)
-            
-            goodCount= len(good)
-            if (goodCount>self.MIN_MATCH_COUNT):
-                src_pts = np.float32([ self.kp1[m.queryIdx].pt for m in good ]).reshape(-1,1,2)
-                dst_pts = np.float32([ kp2[m.trainIdx].pt for m in good ]).reshape(-1,1,2)
-                M, mask = cv2.findHomography(src_pts, dst_pts, cv2.RANSAC,5.0)
-                if (mask != None):
-                    matchesMask = mask.ravel().tolist()
-                    h,w = self.trainingImage.shape
-                    pts = np.float32([ [0,0],[0,h-1],[w-1,h-1],[w-1,0] ]).reshape(-1,1,2)
-                    dst = cv2.perspectiveTransform(pts,M)
-                    
-                    
-                    angle = (goodCount-self.MIN_MATCH_COUNT-1)
-                    if (angle > 50):
-                        angle = 50
-                    
-                    angle = math.pi/2 * (angle / 50)
-                    r = int(math.cos(angle)*255)
-                    g = int(math.sin(angle)*255)
-                    
-                    cv2.polylines(source0,[np.int32(dst)],True,(0,g,r),2, cv2.LINE_AA)
-                
-                # The above polygon should be a quadralateral and should
-                # represent the extent of the boiler (even beyond the image)
-                # With some calibration we should be able to estimate the
-                # distance and angle, as well as estimate where the high
-                # goal should be.
-                
-            else:
-                
-                #print("Not enough matches are found - %d/%d" % (len(good),self.MIN_MATCH_COUNT))
-                matchesMask = None
-            
-            
-#            draw_params = dict(matchColor = (0,255,0), # draw matches in green color
-#                               singlePointColor = None,
-#                               matchesMask = matchesMask, # draw only inliers
-#                               flags = 2)
-            
-            #img3 = cv2.drawMatches(self.trainingImage,self.kp1,img2,kp2,good,None,**draw_params)
-                
-#        else:
-#            ## Draw first 10 matches.
-#            img3 = cv2.drawMatches(self.trainingImage,self.kp1,img2,kp2,matches[:10], None, flags=2)        
\ No newline at end of file
+
+            #print("Not enough matches are found - %d/%d" % (goodCount,self.MIN_MATCH_COUNT))
+            matchesMask = None
+
+    def processLibrary(self, source0, img2):
+        """
+        Matches the frame against the template library and records the
+        nearest-distance label of the reference that matched
+        """
+        found = self.library.find(img2)
+        if (found is None):
+            self.label = None
+            self.targetData.confidenceFactor = 0.0
+            return
+
+        (template, M, mask, goodCount) = found
+        self.label = self.library.label(template)
+        self.targetData.distance_m = self.library.distances[template] * FEET_TO_METERS
+        self.targetData.confidenceFactor = float(mask.sum()) / len(mask)
+
+        h,w = self.library.shapes[template]
+        pts = np.float32([ [0,0],[0,h-1],[w-1,h-1],[w-1,0] ]).reshape(-1,1,2)
+        dst = cv2.perspectiveTransform(pts,M)
+        cv2.polylines(source0,[np.int32(dst)],True,(0,255,0),2, cv2.LINE_AA)
+        cv2.putText(source0,self.label,(0,220),cv2.FONT_HERSHEY_PLAIN,1,(0,255,0),1)
@@ -0,0 +1,61 @@
+'''
+boxstats
+
+Summed-area table (integral image) box statistics in NumPy.
+
+Every box sum costs four lookups no matter how large the window is, so the
+local means and variances that stereo_matching.pre_proc needs take a few
+whole-array operations instead of a Python loop per pixel.
+'''
+from __future__ import division
+import numpy as np
+
+
+def integral_image(a):
+    """Returns the (H+1)x(W+1) summed-area table of a, with a zero first row
+    and column so that box sums need no edge special cases
+    """
+    ii = np.zeros((a.shape[0]+1, a.shape[1]+1), dtype=np.float64)
+    np.cumsum(a, axis=0, dtype=np.float64, out=ii[1:,1:])
+    np.cumsum(ii[1:,1:], axis=1, out=ii[1:,1:])
+    return ii
+
+
+def box_sum(ii, n):
+    """Sums of the (2n+1)x(2n+1) box around every pixel from the integral
+    image ii; the parts of a box outside the image count as zero
+    """
+    h = ii.shape[0] - 1
+    w = ii.shape[1] - 1
+    r0 = np.clip(np.arange(h) - n, 0, h)
+    r1 = np.clip(np.arange(h) + n + 1, 0, h)
+    c0 = np.clip(np.arange(w) - n, 0, w)
+    c1 = np.clip(np.arange(w) + n + 1, 0, w)
+    return (ii[np.ix_(r1, c1)] - ii[np.ix_(r0, c1)]
+            - ii[np.ix_(r1, c0)] + ii[np.ix_(r0, c0)])
+
+
+def masked_box_stats(im, n, mask=None):
+    """Local means and variances over (2n+1)x(2n+1) windows
+
+    Only the pixels where mask is set are counted (by default the nonzero
+    pixels, so zero pixels and the area outside the image do not dilute the
+    mean), but the variance sums x**2 - mean**2 over every window position,
+    exactly as stereo_matching.pre_proc always has. Windows without a single
+    counted pixel give NaN.
+
+    Returns (means, variances) as float64 arrays the shape of im
+    """
+    im = np.asarray(im, dtype=np.float64)
+    if mask is None:
+        mask = (im != 0)
+    window = (2*n+1)**2
+
+    sums = box_sum(integral_image(im * mask), n)
+    squares = box_sum(integral_image(im * im * mask), n)
+    counts = box_sum(integral_image(mask), n)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        means = sums / counts
+        variances = (squares - window * means**2) / counts
+    return (means, variances)
@@ -16,9 +16,9 @@ from cscore import CameraServer
 from cscore import VideoMode
 
 from subprocess import call
-from threading import Lock
 from threading import Thread
-from threading import Condition
+
+from cubbyhole import BroadcastSlot
 
 import numpy as np
 
@@ -36,8 +36,7 @@ class BucketCapture:
 
         print("Creating BucketCapture for " + name)
         
-        self._lock = Lock()
-        self._condition = Condition()
+        self.slot = BroadcastSlot()
         self.fps = FrameRate()
         self.set_fps = set_fps
         self.duration = FrameDuration()
@@ -54,9 +53,7 @@ class BucketCapture:
 
         self.grabbed = False
         self.frame = None
-        self.outFrame = None
         self.count = 0
-        self.outCount = self.count
 
         print("BucketCapture created for " + self.name)
 
@@ -130,39 +127,29 @@ class BucketCapture:
             self.fps.update()
             
             
-            # if something was grabbed and retreived then lock
-            # the outboundw buffer for the update
-            # This limits the blocking to just the copy operations
-            # later we may consider a queue or double buffer to
-            # minimize blocking
+            # if something was grabbed and retreived then publish a copy
+            # (img is grabbed into again); readers that are not waiting
+            # cost nothing and nothing is locked unless someone waits
             if (self._grabbed == True):
-                self._condition.acquire()
-                self._lock.acquire()
                 self.count = self.count + 1
                 self.grabbed = self._grabbed
                 self.frame = img.copy()
-                self._lock.release()
-                self._condition.notifyAll()
-                self._condition.release()
+                self.slot.put(self.frame)
 
             self.duration.update()
 
                 
         print("BucketCapture for " + self.name + " STOPPING")
 
-    def read(self):
-        # return the frame most recently read if the frame
-        # is not being updated at this exact moment
-        self._condition.acquire()
-        self._condition.wait()
-        self._condition.release()
-        if (self._lock.acquire() == True):
-            self.outFrame = self.frame
-            self.outCount = self.count
-            self._lock.release()
-            return (self.outFrame, self.outCount, True)
-        else:
-            return (self.outFrame, self.outCount, False)
+    def read(self, after=None):
+        # wait for a frame newer than count after (by default newer than the
+        # current one) and return (frame, count, isNew); isNew is False only
+        # once stopped. Passing the count of the last frame read means a
+        # frame published while the caller was busy is returned right away
+        if (after is None):
+            after = self.slot.seq
+        (count, frame) = self.slot.get(after)
+        return (frame, count, count != after)
 
 ##    def processUserCommand(self, key):
 ##        if key == ord('x'):
@@ -218,9 +205,7 @@ class BucketCapture:
     def stop(self):
         # indicate that the thread should be stopped
         self._stop = True
-        self._condition.acquire()
-        self._condition.notifyAll()
-        self._condition.release()
+        self.slot.close()
 
     def isStopped(self):
         return self.stopped
@@ -38,7 +38,8 @@ class BucketDisplay:
         # keep looping infinitely until the thread is stopped
         self.stopped = False
         self.fps.start()
-        
+
+        count = 0       # of the last frame shown
         while True:
             # if the thread indicator variable is set, stop the thread
             if (self._stop == True):
@@ -58,7 +59,7 @@ class BucketDisplay:
             # otherwise, read the next frame from the stream
             # grab the frame from the threaded video stream
             
-            (img, count, isNew) = processorSelection.read()
+            (img, count, isNew) = processorSelection.read(count)
             self.duration.start()
             self.fps.update()
 
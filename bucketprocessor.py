@@ -1,16 +1,14 @@
 
-from threading import Lock
 from threading import Thread
-from threading import Condition
 
 from framerate import FrameRate
 from frameduration import FrameDuration
+from cubbyhole import BroadcastSlot
 
 class BucketProcessor:
     def __init__(self,stream,ipdictionary, ipselection):
         print("Creating BucketProcessor for " + stream.name)
-        self._lock = Lock()
-        self._condition = Condition()
+        self.slot = BroadcastSlot()
         self.fps = FrameRate()
         self.duration = FrameDuration()
         self.stream = stream
@@ -22,6 +20,7 @@ class BucketProcessor:
         self._frame = None
         self.frame = None
         self.count = 0
+        self.inCount = 0        # count of the last stream frame read
         self.isNew = False
         
         # initialize the variable used to indicate if the thread should
@@ -46,6 +45,7 @@ class BucketProcessor:
 
         lastIpSelection = self.ipselection
         
+        inCount = self.inCount
         while True:
             # if the thread indicator variable is set, stop the thread
             if (self._stop == True):
@@ -55,7 +55,7 @@ class BucketProcessor:
 
             # otherwise, read the next frame from the stream
             # grab the frame from the threaded video stream
-            (self._frame, count, isNew) = self.stream.read()
+            (self._frame, inCount, isNew) = self.stream.read(inCount)
             self.duration.start()
             self.fps.update()
 
@@ -70,14 +70,10 @@ class BucketProcessor:
                 # Now that image processing is complete, place results
                 # into an outgoing buffer to be grabbed at the convenience
                 # of the reader
-                self._condition.acquire()
-                self._lock.acquire()
                 self.count = self.count + 1
                 self.isNew = isNew
                 self.frame = self._frame
-                self._lock.release()
-                self._condition.notifyAll()
-                self._condition.release()
+                self.slot.put(self.frame)
 
             self.duration.update()
                 
@@ -86,26 +82,20 @@ class BucketProcessor:
     def updateSelection(self, ipselection):
         self.ipselection = ipselection
 
-    def read(self):
-        # return the frame most recently processed if the frame
-        # is not being updated at this exact moment
-        self._condition.acquire()
-        self._condition.wait()
-        self._condition.release()
-        if (self._lock.acquire() == True):
-            self.outFrame = self.frame
-            self.outCount = self.count
-            self._lock.release()
-            return (self.outFrame, self.outCount, True)
-        else:
-            return (self.outFrame, self.outCount, False)
+    def read(self, after=None):
+        # wait for a frame newer than count after (by default newer than the
+        # current one) and return (frame, count, isNew); isNew is False only
+        # once stopped. Passing the count of the last frame read means a
+        # frame published while the caller was busy is returned right away
+        if (after is None):
+            after = self.slot.seq
+        (count, frame) = self.slot.get(after)
+        return (frame, count, count != after)
           
     def stop(self):
         # indicate that the thread should be stopped
         self._stop = True
-        self._condition.acquire()
-        self._condition.notifyAll()
-        self._condition.release()
+        self.slot.close()
 
     def isStopped(self):
         return self.stopped
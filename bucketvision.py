@@ -130,9 +130,13 @@ location = bvTable.getAutoUpdateValue('allianceLocation',1)
 # are desired (e.g., look for faces AND pink elephants at the same time), and place
 # the exclusive options into a single processor (e.g., look for faces OR pink elephants)
 
+# Frame rate the front camera is set to; also the per-frame time budget of
+# the feature matching pipelines
+FRONT_CAM_FPS = 30
+
 redBoiler = RedBoiler()
 blueBoiler = BlueBoiler()
-boiler = Boiler()
+boiler = Boiler(fps=FRONT_CAM_FPS)
 gearLift = GearLift(bvTable)
 
 rope = Rope()
@@ -149,7 +153,7 @@ nada = Nada()
 FRONT_CAM_GEAR_EXPOSURE = 0
 FRONT_CAM_NORMAL_EXPOSURE = -1   # Camera default
 
-frontCam = BucketCapture(name="FrontCam",src=0,width=320,height=240,exposure=FRONT_CAM_GEAR_EXPOSURE).start()    # start low for gears
+frontCam = BucketCapture(name="FrontCam",src=0,width=320,height=240,exposure=FRONT_CAM_GEAR_EXPOSURE,set_fps=FRONT_CAM_FPS).start()    # start low for gears
 
 print("Waiting for BucketCapture to start...")
 while ((frontCam.isStopped() == True)):
@@ -214,6 +218,7 @@ class CamHTTPHandler(BaseHTTPRequestHandler):
             self.send_header('Content-type','multipart/x-mixed-replace; boundary=--jpgboundary')
             self.end_headers()
             
+            count = 0       # of the last frame sent on this connection
             while (frontProcessor.isStopped() == False):
                 try:
 
@@ -228,7 +233,7 @@ class CamHTTPHandler(BaseHTTPRequestHandler):
                         processorSelection = processor[camModeValue]
                         
                     
-                    (img, count, isNew) = processorSelection.read()
+                    (img, count, isNew) = processorSelection.read(count)
                     
                     if (isNew == False):
                             continue
@@ -3,7 +3,8 @@
 Created on Tue Jan 24 20:46:25 2017
 
 Thread that gets frames from a camera
-It *is* OK to use one Camera in multiple Processors
+It *is* OK to use one Camera in multiple Processors: every frame is
+published once, uncopied, to all of them (see cubbyhole.BroadcastSlot)
 """
 ## NOTE: OpenCV interface to camera controls is sketchy
 ## use v4l2-ctl directly for explicit control
@@ -13,9 +14,8 @@ It *is* OK to use one Camera in multiple Processors
 import cv2
 from subprocess import call
 from threading import Thread
-from threading import Lock
 from framerate import FrameRate
-from cubbyhole import Cubbyhole
+from cubbyhole import BroadcastSlot
 import platform
 
 
@@ -38,9 +38,8 @@ class Camera:
         self.fps = FrameRate()
         self.running = False
         
-        # Dict maps user (client) to the Cubbyhole instance used to pass it frames
-        self.userDict = {}
-        self.userDictLock = Lock() # Protects shared access to userDict
+        # Latest frame for all users; each user remembers the last seq it got
+        self.slot = BroadcastSlot()
         
 
         self.rate = self.stream.get(cv2.CAP_PROP_FPS)
@@ -78,28 +77,17 @@ class Camera:
             # Should probably try to reconnect somehow? Don't know how...
                 
             if grabbed:
-                # Pass a copy of the frame to each user in userDict
-                self.userDictLock.acquire()
-                values = self.userDict.values()
-                self.userDictLock.release()
-                for mb in values:
-                    mb.put(frame.copy())
+                # read() returns a new image every time, so it can be shared
+                frame.flags.writeable = False
+                self.slot.put(frame)
             
             self.fps.stop()
 
                 
-    def read(self, user):
-        # See if this user already registered in userDict.
-        # If not, create a new Cubbyhole instance to pass frames to user.
-        # If so, just get the user's Cubbyhole instance.
-        # Then get the frame from the Cubbyhole & return it.
-        self.userDictLock.acquire()
-        if not user in self.userDict:
-            self.userDict[user] = Cubbyhole()
-        mb = self.userDict[user]
-        self.userDictLock.release()
-        
-        return mb.get()     
+    def read(self, after=0):
+        # Waits for a frame newer than seq after and returns (seq, frame).
+        # The frame is shared by all users and read-only.
+        return self.slot.get(after)
 
     def processUserCommand(self, key):
         if key == ord('w'):
@@ -0,0 +1,134 @@
+'''
+cascaderunner
+
+Configurable wrapper around cv2.CascadeClassifier.detectMultiScale
+
+    - detection can run on a downscaled copy of the grayscale image and the
+      boxes are mapped back to full resolution
+    - minSize/maxSize (given in full resolution pixels) prune the scale
+      pyramid to the sizes that are physically plausible for the camera
+    - detectAll runs the cascade over many ROIs (e.g., eyes in each face)
+      on a thread pool; OpenCV releases the GIL while it works and every
+      worker thread gets its own classifier instance
+'''
+import math
+import threading
+from multiprocessing.pool import ThreadPool
+
+import cv2
+import numpy as np
+
+
+def plausibleSize(objectWidth, hfov, imageWidth, minDistance, maxDistance):
+    """Returns (minPixels, maxPixels), the width in pixels of an object of
+    objectWidth meters seen between minDistance and maxDistance meters by a
+    camera with hfov degrees of horizontal field of view
+    """
+    focal = (imageWidth / 2.0) / math.tan(math.radians(hfov / 2.0))
+    return (int(focal * objectWidth / maxDistance), int(math.ceil(focal * objectWidth / minDistance)))
+
+
+class CascadeRunner:
+    """
+    detectMultiScale with downscaling, size pruning and optional ROI threading
+    """
+
+    def __init__(self, cascadeName, scaleFactor=1.1, minNeighbors=3,
+                 downscale=1.0, minSize=None, maxSize=None,
+                 minFraction=None, maxFraction=None, workers=1):
+        """initializes all values to presets or None if need to be set
+
+        minSize and maxSize are (w, h) in full resolution pixels;
+        minFraction and maxFraction limit ROI detections to a fraction of the
+        ROI width (e.g., eyes are 0.1 to 0.5 of a face) and take precedence
+        """
+        self.cascadeName = cascadeName
+        self.scaleFactor = scaleFactor
+        self.minNeighbors = minNeighbors
+        self.downscale = downscale
+        self.minSize = minSize
+        self.maxSize = maxSize
+        self.minFraction = minFraction
+        self.maxFraction = maxFraction
+
+        self.cascade = cv2.CascadeClassifier(cascadeName)
+        self._local = threading.local()
+
+        self.workers = workers
+        self.pool = None
+        if (workers > 1):
+            self.pool = ThreadPool(workers)
+
+        self._small = None      # reused downscale buffer
+
+    def classifier(self):
+        """Returns the classifier for the calling thread
+        """
+        cascade = getattr(self._local, 'cascade', None)
+        if (cascade is None):
+            cascade = cv2.CascadeClassifier(self.cascadeName)
+            self._local.cascade = cascade
+        return cascade
+
+    def scaledSize(self, size, scale):
+        if (size is None):
+            return None
+        return (max(1, int(size[0] * scale)), max(1, int(size[1] * scale)))
+
+    def run(self, cascade, gray, minSize, maxSize):
+        """detectMultiScale with only the size limits that are set
+        """
+        params = dict(scaleFactor=self.scaleFactor, minNeighbors=self.minNeighbors)
+        if (minSize is not None):
+            params['minSize'] = minSize
+        if (maxSize is not None):
+            params['maxSize'] = maxSize
+        boxes = cascade.detectMultiScale(gray, **params)
+        if (len(boxes) == 0):
+            return np.empty((0,4), dtype=np.int32)
+        return np.asarray(boxes, dtype=np.int32)
+
+    def detect(self, gray):
+        """Detects on the whole image; boxes come back as an Nx4 (x,y,w,h)
+        int32 array in full resolution coordinates
+        """
+        scale = self.downscale
+        if (scale == 1.0):
+            return self.run(self.cascade, gray, self.minSize, self.maxSize)
+
+        height, width = gray.shape[0:2]
+        size = (max(1, int(width * scale)), max(1, int(height * scale)))
+        if ((self._small is None) or (self._small.shape[::-1] != size)):
+            self._small = np.empty((size[1], size[0]), dtype=gray.dtype)
+        cv2.resize(gray, size, dst=self._small, interpolation=cv2.INTER_AREA)
+
+        boxes = self.run(self.cascade, self._small,
+                         self.scaledSize(self.minSize, scale),
+                         self.scaledSize(self.maxSize, scale))
+        if (len(boxes) > 0):
+            boxes = np.round(boxes / scale).astype(np.int32)
+        return boxes
+
+    def detectROI(self, gray, box):
+        """Detects inside box (x,y,w,h); boxes are relative to the ROI
+        """
+        (x,y,w,h) = box
+        minSize = self.minSize
+        maxSize = self.maxSize
+        if (self.minFraction is not None):
+            minSize = self.scaledSize((w,w), self.minFraction)
+        if (self.maxFraction is not None):
+            maxSize = self.scaledSize((w,w), self.maxFraction)
+        return self.run(self.classifier(), gray[y:y+h, x:x+w], minSize, maxSize)
+
+    def detectAll(self, gray, boxes):
+        """Detects inside every box, in parallel when workers > 1
+        """
+        if ((self.pool is None) or (len(boxes) < 2)):
+            return [self.detectROI(gray, box) for box in boxes]
+        return self.pool.map(lambda box: self.detectROI(gray, box), boxes)
+
+    def close(self):
+        if (self.pool is not None):
+            self.pool.close()
+            self.pool = None
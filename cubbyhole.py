@@ -4,9 +4,26 @@ Created on Apr 3, 2017
 @author: twilson
 
 Thread-safe dropbox for passing frames between processing threads
+
+Cubbyhole hands each frame to one reader: get() takes it. BroadcastSlot
+hands every frame to all readers: it holds the latest frame with a sequence
+number and get(after) blocks until there is a frame newer than the one the
+reader saw last, which the reader keeps itself. The frame is shared, not
+copied, so readers must not modify it (Camera makes its frames read-only).
+
+BroadcastSlot is also light on locks: the frame and its number are swapped
+in as one tuple, so put() only takes the lock to wake readers that are
+actually waiting, and get() only takes it to wait. A reader that asks for
+something newer than what it last saw cannot miss a frame published while
+it was busy, which a bare Condition.wait() does.
+
+python cubbyhole.py runs a stress test of one fast writer and many readers,
+then compares the frame handoff of the Condition plus Lock pattern the
+Bucket* classes used with BroadcastSlot.
 '''
 
-from threading import Condition
+import time
+from threading import Condition, Lock
 
 
 class Cubbyhole:
@@ -30,4 +47,207 @@ class Cubbyhole:
         self.avail = False
         self.cond.release()
         return frame
-    
\ No newline at end of file
+
+
+class BroadcastSlot:
+    """Latest frame with a sequence number, for one writer and any number of readers"""
+
+    def __init__(self):
+        self.cond = Condition()
+        self.latest = (0, None)     # (seq, frame), seq 0 before the first frame
+        self.waiting = 0            # readers blocked in get()
+        self.waits = 0              # get() calls that had to block
+        self.closed = False
+
+    @property
+    def seq(self):
+        return self.latest[0]
+
+    @property
+    def frame(self):
+        return self.latest[1]
+
+    def put(self, frame):
+        """Publishes frame to every reader; frame must not be changed afterwards"""
+        self.latest = (self.latest[0] + 1, frame)
+        # a reader registers as waiting before it checks latest, so one
+        # that is not counted yet will see the new frame without waiting
+        if self.waiting > 0:
+            self.cond.acquire()
+            self.cond.notify_all()
+            self.cond.release()
+
+    def close(self):
+        """Makes every get(), now and later, return right away"""
+        self.cond.acquire()
+        self.closed = True
+        self.cond.notify_all()
+        self.cond.release()
+
+    @staticmethod
+    def __newer(seq, after):
+        # a seq lower than after means after did not come from this slot
+        # (the reader switched streams): the current frame is new to it
+        return seq > after or 0 < seq < after
+
+    def get(self, after=0, timeout=None):
+        """Returns (seq, frame) of the latest frame once it is newer than seq
+        after; the seq is still after if timeout seconds pass or the slot is
+        closed first
+        """
+        latest = self.latest
+        if self.__newer(latest[0], after) or self.closed:
+            return latest
+        deadline = None if timeout is None else time.time() + timeout
+        self.cond.acquire()
+        self.waiting += 1
+        self.waits += 1
+        try:
+            while True:
+                latest = self.latest
+                if self.__newer(latest[0], after) or self.closed:
+                    return latest
+                remaining = None if deadline is None else deadline - time.time()
+                if remaining is not None and remaining <= 0:
+                    return latest
+                self.cond.wait(remaining)
+        finally:
+            self.waiting -= 1
+            self.cond.release()
+
+
+def stress(readers=32, frames=2000, period=0.0005):
+    """One writer publishes frames as fast as period allows while readers,
+    some of them slow, follow; every reader must keep up with the latest
+    frame (none starves, all end on the last one) and never see a sequence number go backwards
+    """
+    import random
+    from threading import Thread
+
+    slot = BroadcastSlot()
+    done = [False]
+    counts = [0] * readers
+    last = [0] * readers
+    errors = []
+
+    def reader(index):
+        seq = 0
+        delay = random.choice([0.0, 0.0, 0.001, 0.005])
+        while not done[0]:
+            (newSeq, frame) = slot.get(seq, timeout=0.1)
+            if newSeq == seq:
+                continue
+            if newSeq <= seq or frame != newSeq:
+                errors.append((index, seq, newSeq, frame))
+            seq = newSeq
+            counts[index] += 1
+            last[index] = seq
+            if delay > 0:
+                time.sleep(delay)
+
+    threads = [Thread(target=reader, args=(i,)) for i in range(readers)]
+    for t in threads:
+        t.daemon = True
+        t.start()
+    start = time.time()
+    for i in range(1, frames + 1):
+        slot.put(i)
+        time.sleep(period)
+    elapsed = time.time() - start
+    time.sleep(0.05)
+    done[0] = True
+    for t in threads:
+        t.join()
+
+    print("%d frames to %d readers in %.2fs" % (frames, readers, elapsed))
+    print("frames seen per reader: min %d, max %d" % (min(counts), max(counts)))
+    print("ordering errors: %d" % len(errors))
+    starved = [i for i in range(readers) if last[i] != frames]
+    if starved or errors:
+        raise AssertionError("starved readers %s, errors %s" % (starved, errors[:5]))
+    print("no reader starved")
+
+
+class LegacyDropbox:
+    """The handoff of BucketCapture/BucketProcessor before BroadcastSlot,
+    for comparison: a Condition to wake readers, a Lock around the data"""
+
+    def __init__(self):
+        self._lock = Lock()
+        self._condition = Condition()
+        self.count = 0
+        self.frame = None
+
+    def put(self, frame):
+        self._condition.acquire()
+        self._lock.acquire()
+        self.count = self.count + 1
+        self.frame = frame
+        self._lock.release()
+        self._condition.notify_all()
+        self._condition.release()
+
+    def get(self, after=0, timeout=None):
+        self._condition.acquire()
+        self._condition.wait(timeout)
+        self._condition.release()
+        self._lock.acquire()
+        latest = (self.count, self.frame)
+        self._lock.release()
+        return latest
+
+
+def handoff(frames=300, period=0.005, work=0.007, puts=200000):
+    """Per frame handoff cost of both primitives
+
+    put() cost with no reader waiting, and for a reader that works for a
+    bit longer than the frame period (so a frame is always published while
+    it is busy): how long it stays blocked per frame and how many times it
+    blocked although an unseen frame was already there (a missed wakeup,
+    which costs up to a full period)
+    """
+    from threading import Thread
+
+    for name, kind in (('Condition+Lock', LegacyDropbox), ('BroadcastSlot', BroadcastSlot)):
+        box = kind()
+        start = time.time()
+        for i in range(puts):
+            box.put(i)
+        putCost = 1e6 * (time.time() - start) / puts
+
+        box = kind()
+        done = [False]
+        stats = {'reads': 0, 'missed': 0, 'blocked': 0.0}
+
+        def reader():
+            seq = 0
+            while not done[0]:
+                available = box.count if kind is LegacyDropbox else box.seq
+                start = time.time()
+                (newSeq, frame) = box.get(seq, timeout=0.1)
+                blocked = time.time() - start
+                if newSeq == seq:
+                    continue
+                if available > seq and blocked > period / 2:
+                    stats['missed'] += 1
+                stats['blocked'] += blocked
+                stats['reads'] += 1
+                seq = newSeq
+                time.sleep(work)
+
+        t = Thread(target=reader)
+        t.daemon = True
+        t.start()
+        for i in range(1, frames + 1):
+            box.put(i)
+            time.sleep(period)
+        done[0] = True
+        box.put(0)
+        t.join()
+        print('%-15s put %.2f us, %d reads, blocked %.2f ms per read, %d missed wakeups' %
+              (name, putCost, stats['reads'], 1000.0 * stats['blocked'] / max(1, stats['reads']), stats['missed']))
+
+
+if __name__ == '__main__':
+    stress()
+    handoff()
@@ -3,17 +3,27 @@ import numpy
 import math
 from enum import Enum
 
+from blobs import findFilteredBlobs, BACKENDS
+from resizer import Resizer, interpolationFor
+
 class Cubes:
     """
     An OpenCV pipeline generated by GRIP.
     """
     
-    def __init__(self):
+    def __init__(self, blob_backend='contours'):
         """initializes all values to presets or None if need to be set
+
+        blob_backend 'components' finds and filters blobs on connected
+        component stats and traces contours only for the ones kept (see blobs)
         """
+        if (blob_backend not in BACKENDS):
+            raise ValueError("Unknown blob backend %s" % blob_backend)
+        self.blob_backend = blob_backend
         self.__resize_image_width = 320.0
         self.__resize_image_height = 240.0
-        self.__resize_image_interpolation = cv2.INTER_CUBIC
+        self.__resize_image_interpolation = None    # by resizer.interpolationFor
+        self.__resize_image_resizer = Resizer()
 
         self.resize_image_output = None
 
@@ -49,6 +59,7 @@ class Cubes:
         self.__filter_contours_max_ratio = 1000
 
         self.filter_contours_output = None
+        self.filter_blobs_output = None
 
         self.__convex_hulls_contours = self.filter_contours_output
 
@@ -62,8 +73,12 @@ class Cubes:
             print ("LEFT")
         
     def getCenters(self):
-        for idx, cnt in enumerate(self.convex_hulls_output):
-            x,y,w,h = cv2.boundingRect(cnt)
+        if (self.blob_backend == 'components'):
+            # the box of a hull is the box of its blob
+            boxes = self.filter_blobs_output.stats[:, 0:4].tolist()
+        else:
+            boxes = [cv2.boundingRect(cnt) for cnt in self.convex_hulls_output]
+        for x,y,w,h in boxes:
             self.convertStr(x+w/2,y-h/2)
             #print ("x: "+str(x+w/2))
             #print ("y: "+str(y-h/2))
@@ -72,7 +87,7 @@ class Cubes:
 
     def resize_image(self, source):
         self.__resize_image_input = source
-        (self.resize_image_output) = self.__resize_image(self.__resize_image_input, self.__resize_image_width, self.__resize_image_height, self.__resize_image_interpolation) 
+        (self.resize_image_output) = self.__resize_image(self.__resize_image_input, self.__resize_image_width, self.__resize_image_height, self.__resize_image_interpolation, self.__resize_image_resizer) 
         return self.resize_image_output
     
 
@@ -91,11 +106,16 @@ class Cubes:
 
         # Step Find_Contours0:
         self.__find_contours_input = self.hsv_threshold_output
-        (self.find_contours_output) = self.__find_contours(self.__find_contours_input, self.__find_contours_external_only)
+        if (self.blob_backend == 'components'):
+            # Blobs instead of a contour list; the filter works on their stats
+            # and only the surviving contours are traced
+            (self.find_contours_output, self.filter_blobs_output, self.filter_contours_output) = findFilteredBlobs(self.__find_contours_input, 'components', (self.__filter_contours_min_area, self.__filter_contours_min_perimeter, self.__filter_contours_min_width, self.__filter_contours_max_width, self.__filter_contours_min_height, self.__filter_contours_max_height, self.__filter_contours_solidity, self.__filter_contours_max_vertices, self.__filter_contours_min_vertices, self.__filter_contours_min_ratio, self.__filter_contours_max_ratio))
+        else:
+            (self.find_contours_output) = self.__find_contours(self.__find_contours_input, self.__find_contours_external_only)
 
-        # Step Filter_Contours0:
-        self.__filter_contours_contours = self.find_contours_output
-        (self.filter_contours_output) = self.__filter_contours(self.__filter_contours_contours, self.__filter_contours_min_area, self.__filter_contours_min_perimeter, self.__filter_contours_min_width, self.__filter_contours_max_width, self.__filter_contours_min_height, self.__filter_contours_max_height, self.__filter_contours_solidity, self.__filter_contours_max_vertices, self.__filter_contours_min_vertices, self.__filter_contours_min_ratio, self.__filter_contours_max_ratio)
+            # Step Filter_Contours0:
+            self.__filter_contours_contours = self.find_contours_output
+            (self.filter_contours_output) = self.__filter_contours(self.__filter_contours_contours, self.__filter_contours_min_area, self.__filter_contours_min_perimeter, self.__filter_contours_min_width, self.__filter_contours_max_width, self.__filter_contours_min_height, self.__filter_contours_max_height, self.__filter_contours_solidity, self.__filter_contours_max_vertices, self.__filter_contours_min_vertices, self.__filter_contours_min_ratio, self.__filter_contours_max_ratio)
 
         # Step Convex_Hulls0:
         self.__convex_hulls_contours = self.filter_contours_output
@@ -103,17 +123,23 @@ class Cubes:
 
 
     @staticmethod
-    def __resize_image(input, width, height, interpolation):
+    def __resize_image(input, width, height, interpolation, resizer=None):
         """Scales and image to an exact size.
         Args:
             input: A numpy.ndarray.
             Width: The desired width in pixels.
             Height: The desired height in pixels.
-            interpolation: Opencv enum for the type fo interpolation.
+            interpolation: Opencv enum for the type fo interpolation, or None
+                for resizer.interpolationFor('process', ...) (INTER_AREA to shrink).
+            resizer: A resizer.Resizer to resize into its reused buffers, or None.
         Returns:
             A numpy.ndarray of the new size.
         """
-        return cv2.resize(input, ((int)(width), (int)(height)), 0, 0, interpolation)
+        if (interpolation is None):
+            interpolation = interpolationFor('process', (input.shape[1], input.shape[0]), (width, height))
+        if (resizer is not None):
+            return resizer.resize(input, width, height, interpolation)
+        return cv2.resize(input, ((int)(width), (int)(height)), interpolation=interpolation)
 
     @staticmethod
     def __blur(src, type, radius):
@@ -45,7 +45,7 @@ import time
 from framerate import FrameRate
 
 from bucketcapture import BucketCapture     # Camera capture threads... may rename this
-from imageprocessor import ImageProcessor   # Image processing threads... has same basic structure (may merge classes)
+from runtime import Runtime, CaptureStage, ProcessStage, OutputStage
 
 # Instances of GRIP created pipelines (they usually require some manual manipulation
 # but basically we would pass one or more of these into one or more image processors (threads)
@@ -53,14 +53,9 @@ from imageprocessor import ImageProcessor   # Image processing threads... has sa
 #
 # NOTE: NOTE: NOTE:
 #
-# Still need to work on how unique information from each pipeline is passed around... suspect that it
-# will be some context dependent read that is then streamed out for anonymous consumption...
-#
-#
-# NOTE: NOTE: NOTE:
-#
-# The same pipeline instance should NOT be passed to more than one image processor
-# as the results can be confused and comingled and simply does not make sense.
+# The runtime hosts any pipeline with process(frame) (or FindTarget(frame)); handed the
+# pipeline class instead of an instance it makes one per worker, because the same pipeline
+# instance should NOT be shared between threads (results get comingled)
 
 from faces import Faces             # Useful for basic testing of driverCam/Processor pipeline
 
@@ -82,38 +77,17 @@ while (bucketCam.isStopped() == True):
 
 print("BucketCapture appears online!")
 
-# NOTE: NOTE: NOTE
-#
-# For now just create one image pipeline to share with each image processor
-# LATER we will modify this to allow for a dictionary (switch-like) interface
-# to be injected into the image processors; this will allow the image processors
-# to have a selector for exclusion processor of different pipelines
-#
-# I.e., the idea is to create separate image processors when concurrent pipelines
-# are desired (e.g., look for faces AND pink elephants at the same time), and place
-# the exclusive options into a single processor (e.g., look for faces OR pink elephants)
-
-faces = Faces()
-
-# NOTE: NOTE: NOTE
-#
-# Reminder that each image processor should process exactly one vision pipeline
-# at a time (it can be selectable in the future) and that the same vision
-# pipeline should NOT be sent to different image processors as this is simply
-# confusing and can cause some comingling of data (depending on how the vision
-# pipeline was defined... we can't control the use of object-specific internals
-# being run from multiple threads... so don't do it!)
-
-bucketProcessor = ImageProcessor(bucketCam,faces).start()
-
-print("Waiting for ImageProcessors to start...")
-while (bucketProcessor.isStopped() == True):
-    time.sleep(0.001)
+# Capture -> faces -> output, each stage on its own thread(s) with bounded queues
+# between them; when the pipeline falls behind, the oldest waiting frame is dropped
+runtime = Runtime(CaptureStage(bucketCam, name="bucketCam"),
+                  ProcessStage(Faces(), name="faces"),
+                  OutputStage(name="display")).start()
+output = runtime['display']
 
-print("ImageProcessors appear online!")
+print("Runtime appears online!")
 
 # Continue feeding display or streams in foreground told to stop
-fps = FrameRate()   # Keep track of display rate  TODO: Thread that too!
+fps = FrameRate()   # Keep track of display rate
 fps.start()
 
 # Loop forever displaying the images for initial testing
@@ -123,51 +97,39 @@ fps.start()
 # safe unless you jump through some hoops to tell the interfaces to operate in a multi-threaded
 # environment (i.e., within the same process).
 #
-# For most purposes, here, we don't need to jump through those hoops or create separate processes and
-# can just show the images at the rate of the slowest pipeline plus the speed of the remaining pipelines.
-#
-# LATER we will create display threads that stream the images as requested at their separate rates.
+# So the display stays in the foreground and reads from the runtime's output stage
 #
+seq = 0         # of the last frame shown
 while (True):
-    # grab the frame from the image processor
-    (bucketFrame, count, isNew) = bucketProcessor.read()
-
-    # check to see if the frame should be displayed to our screen
-    # For now, just show every new frame
-    if (isNew == True):
-         camFps = bucketCam.fps.fps()
-         procFps = bucketProcessor.fps.fps()
-         procDuration = bucketProcessor.duration.duration()
-
-         cv2.putText(bucketFrame,"{:.1f}".format(camFps),(0,40),cv2.FONT_HERSHEY_PLAIN,2,(0,255,0),2)
-         if (procFps != 0.0):
-             cv2.putText(bucketFrame,"{:.1f}".format(procFps) + " : {:.0f}".format(100 * procDuration * procFps) + "%",(0,80),cv2.FONT_HERSHEY_PLAIN,2,(0,255,0),2)
+    # wait (a little) for a newer frame than the last one shown
+    (newSeq, frame) = output.read(seq, 0.1)
+
+    if ((frame is not None) and (newSeq != seq)):
+         seq = newSeq
+         capture = runtime['bucketCam'].stats()
+         process = runtime['faces'].stats()
+         bucketFrame = frame.image
+
+         cv2.putText(bucketFrame,"{:.1f}".format(capture['fps']),(0,40),cv2.FONT_HERSHEY_PLAIN,2,(0,255,0),2)
+         if (process['fps'] != 0.0):
+             cv2.putText(bucketFrame,"{:.1f}".format(process['fps']) + " : {:.0f}".format(100 * process['utilization']) + "%",(0,80),cv2.FONT_HERSHEY_PLAIN,2,(0,255,0),2)
          cv2.putText(bucketFrame,"{:.1f}".format(fps.fps()),(0,120),cv2.FONT_HERSHEY_PLAIN,2,(0,255,0),2)
 
          cv2.imshow("bucketCam", bucketFrame)
 
          key = cv2.waitKey(1) & 0xFF
          
-         if (bucketCam.processUserCommand(key) == True):
+         if (key == ord('q')):
              break
             
-    # update the display FPS counter (in this case it will be roughly the rate of the slowest pipeline because
-    # we are displaying both pipelines in the same thread (again because I just don't feel like messing
-    # with the extra steps to make X11 behave
-    fps.update()
+         # update the display FPS counter
+         fps.update()
 
 
-# NOTE: NOTE: NOTE:
-# Sometimes the exit gets messed up, but for now we just don't care
+#stop the runtime, then the camera capture
+runtime.report()
+runtime.stop()
 
-#stop the image processors
-bucketProcessor.stop()
-
-print("Waiting for ImageProcessors to stop...")
-while (bucketProcessor.isStopped() == False):
-    time.sleep(0.001)
-
-#stop the camera capture
 bucketCam.stop()
 
 print("Waiting for BucketCapture to stop...")
@@ -178,4 +140,3 @@ while (bucketCam.isStopped() == False):
 cv2.destroyAllWindows()
 
 print("Goodbye!")
-
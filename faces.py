@@ -1,16 +1,46 @@
 import cv2
 import numpy
 
+from cascaderunner import CascadeRunner
+
 class Faces:
     """
     An OpenCV pipeline created to find faces
+
+    The cascades only run every detectEvery frames; in between, each face is
+    tracked by correlating the patch seen at the last detection inside a
+    small window around its last position. A full cascade pass is forced as
+    soon as any face correlates below minConfidence (or leaves the frame);
+    with no faces tracked, new ones are looked for on the regular schedule.
+
+    Faces are detected on a frame downscaled by downscale, limited to
+    minFace..maxFace pixels wide (full resolution, see
+    cascaderunner.plausibleSize), and eyes in the faces are found on
+    workers threads.
     """
-    
-    def __init__(self):
+
+    def __init__(self, name='Faces', detectEvery=1, minConfidence=0.6, searchMargin=0.25,
+                 downscale=1.0, minFace=None, maxFace=None, workers=1):
         """initializes all values to presets or None if need to be set
         """
-        self.face_cascade = cv2.CascadeClassifier('haarcascade_frontalface_default.xml')
-        self.eye_cascade = cv2.CascadeClassifier('haarcascade_eye.xml')        
+        self.name = name
+        self.face_cascade = CascadeRunner('haarcascade_frontalface_default.xml', 1.3, 5,
+                                          downscale=downscale,
+                                          minSize=None if minFace is None else (minFace, minFace),
+                                          maxSize=None if maxFace is None else (maxFace, maxFace))
+        self.eye_cascade = CascadeRunner('haarcascade_eye.xml',
+                                         minFraction=0.1, maxFraction=0.5,
+                                         workers=workers)
+
+        self.detectEvery = detectEvery          # 1 == detect on every frame
+        self.minConfidence = minConfidence      # TM_CCOEFF_NORMED score
+        self.searchMargin = searchMargin        # fraction of face size
+
+        self.framesSinceDetect = 0
+        self.faces = []         # (x,y,w,h) per face in the current frame
+        self.eyes = []          # eye boxes per face, relative to the face
+        self.templates = []     # gray face patch from the last detection
+        self.confidence = 0.0   # lowest tracking score of the last frame
 
     def process(self, source0):
         """
@@ -18,13 +48,62 @@ class Faces:
         """
         img = source0
         gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-        faces = self.face_cascade.detectMultiScale(gray, 1.3, 5)
-        for (x,y,w,h) in faces:
+
+        self.framesSinceDetect += 1
+        if ((self.framesSinceDetect >= self.detectEvery) or (self.track(gray) == False)):
+            self.detect(gray)
+
+        for (x,y,w,h),eyes in zip(self.faces, self.eyes):
             cv2.rectangle(img,(x,y),(x+w,y+h),(255,0,0),2)
-            roi_gray = gray[y:y+h, x:x+w]
             roi_color = img[y:y+h, x:x+w]
-            eyes = self.eye_cascade.detectMultiScale(roi_gray)
             for (ex,ey,ew,eh) in eyes:
                 cv2.rectangle(roi_color,(ex,ey),(ex+ew,ey+eh),(0,255,0),2)
 
         return img
+
+    def detect(self, gray):
+        """
+        Full cascade pass: faces on the whole frame, then eyes in each face
+        """
+        self.framesSinceDetect = 0
+        self.confidence = 1.0
+        self.faces = [tuple(int(v) for v in box) for box in self.face_cascade.detect(gray)]
+        self.eyes = self.eye_cascade.detectAll(gray, self.faces)
+        self.templates = [gray[y:y+h, x:x+w].copy() for (x,y,w,h) in self.faces]
+
+    def track(self, gray):
+        """
+        Moves every face to the best correlation of its template within a
+        window around the last position
+
+        Returns False when any face cannot be tracked confidently, in which
+        case the caller must run detect()
+        """
+        if (len(self.faces) == 0):
+            # Nothing was lost: new faces wait for the next scheduled cascade
+            # pass, so an empty scene costs one pass per detectEvery frames
+            return True
+
+        frameHeight, frameWidth = gray.shape
+        tracked = []
+        confidence = 1.0
+        for (x,y,w,h),template in zip(self.faces, self.templates):
+            mx = int(self.searchMargin * w)
+            my = int(self.searchMargin * h)
+            x0 = max(0, x - mx)
+            y0 = max(0, y - my)
+            x1 = min(frameWidth, x + w + mx)
+            y1 = min(frameHeight, y + h + my)
+            if (((x1 - x0) < w) or ((y1 - y0) < h)):
+                return False
+
+            result = cv2.matchTemplate(gray[y0:y1, x0:x1], template, cv2.TM_CCOEFF_NORMED)
+            _, maxVal, _, maxLoc = cv2.minMaxLoc(result)
+            if (maxVal < self.minConfidence):
+                return False
+            confidence = min(confidence, maxVal)
+            tracked.append((x0 + maxLoc[0], y0 + maxLoc[1], w, h))
+
+        self.faces = tracked
+        self.confidence = confidence
+        return True
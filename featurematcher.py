@@ -0,0 +1,249 @@
+'''
+featurematcher
+
+Reusable feature matching for the training-image pipelines (Boiler and the
+matchBoiler / matchShirt / leftright experiments).
+
+The training keypoints and descriptors are computed once and kept next to the
+training image in a compact binary .npz, and a FLANN index over the training
+descriptors is built once and saved alongside it (KD-tree only; FLANN cannot
+save LSH tables, so those are rebuilt from the cached descriptors). Startup
+after the first run is just a file load, and each frame is matched by querying
+the index with the frame descriptors (sublinear in the training set) instead
+of a brute force BFMatcher.knnMatch of every training descriptor against
+every frame.
+
+SIFT (cv2, or xfeatures2d before OpenCV 4.4) and SURF (xfeatures2d,
+non-free) use a KD-tree index on float
+descriptors; ORB and AKAZE are the free fast path and use an LSH index on
+binary descriptors.
+
+Frames (not training images) can be detected at a reduced size
+(detectSize, longest side in pixels) and keep only their maxFeatures
+strongest keypoints, which bounds the detection, description and matching
+time of a frame regardless of the camera resolution.
+'''
+import os
+
+import cv2
+import numpy as np
+
+# FLANN algorithm identifiers (not exported by the cv2 bindings)
+FLANN_INDEX_KDTREE = 1
+FLANN_INDEX_LSH = 6
+
+# Descriptors that are bit strings and must be compared with a Hamming norm
+BINARY_DETECTORS = ('orb', 'akaze')
+
+
+def createDetector(name):
+    """Returns a detector/extractor for the named feature type
+    """
+    name = name.lower()
+    if (name == 'sift'):
+        # SIFT is in the main module since OpenCV 4.4, xfeatures2d before
+        if hasattr(cv2, 'SIFT_create'):
+            return cv2.SIFT_create()
+        return cv2.xfeatures2d.SIFT_create()
+    elif (name == 'surf'):
+        return cv2.xfeatures2d.SURF_create()
+    elif (name == 'orb'):
+        return cv2.ORB_create(nfeatures=1000)
+    elif (name == 'akaze'):
+        return cv2.AKAZE_create()
+    else:
+        raise ValueError("Unknown feature detector '" + name + "'")
+
+
+def isFresh(cachePath, sourcePaths):
+    """True when cachePath exists and is no older than every source file
+    """
+    if (os.path.isfile(cachePath) == False):
+        return False
+    cacheTime = os.path.getmtime(cachePath)
+    for source in sourcePaths:
+        if (os.path.getmtime(source) > cacheTime):
+            return False
+    return True
+
+
+def keypointsToArray(keypoints):
+    """Packs cv2.KeyPoint objects into an Nx7 float32 array
+    (x, y, size, angle, response, octave, class_id)
+    """
+    return np.array([(k.pt[0], k.pt[1], k.size, k.angle, k.response, k.octave, k.class_id)
+                     for k in keypoints], dtype=np.float32).reshape(-1, 7)
+
+
+def arrayToKeypoints(array):
+    """Unpacks an array made by keypointsToArray back into cv2.KeyPoint objects
+    """
+    return [cv2.KeyPoint(float(x), float(y), float(size), float(angle), float(response), int(octave), int(classId))
+            for (x, y, size, angle, response, octave, classId) in array]
+
+
+class FeatureMatcher:
+    """
+    Matches frames against one or more training descriptor sets through a
+    persisted FLANN index.
+    """
+
+    def __init__(self, detector='surf', ratio=0.7, checks=50, cacheDir=None,
+                 detectSize=None, maxFeatures=None):
+        """initializes all values to presets or None if need to be set
+
+        detectSize and maxFeatures bound the work per frame (see detectFrame);
+        None leaves frames at full size with every keypoint
+        """
+        self.detectorName = detector.lower()
+        self.detector = createDetector(self.detectorName)
+        self.binary = (self.detectorName in BINARY_DETECTORS)
+        if (self.binary == True):
+            self.norm = cv2.NORM_HAMMING
+            self.indexParams = dict(algorithm = FLANN_INDEX_LSH,
+                                    table_number = 6,
+                                    key_size = 12,
+                                    multi_probe_level = 1)
+        else:
+            self.norm = cv2.NORM_L2
+            self.indexParams = dict(algorithm = FLANN_INDEX_KDTREE, trees = 5)
+        self.searchParams = dict(checks = checks)
+
+        # Lowe's ratio; the KD-tree reports squared L2 distances
+        self.ratio = ratio
+        self.cacheDir = cacheDir
+        self.detectSize = detectSize
+        self.maxFeatures = maxFeatures
+
+        self.keypoints = None       # Nx7 array, see keypointsToArray
+        self.descriptors = None
+        self.shape = None           # training image (h, w)
+        self.index = None
+
+    def cachePath(self, imageName, extension):
+        """Returns the cache file name for a training image
+        """
+        base = imageName
+        if (self.cacheDir is not None):
+            base = os.path.join(self.cacheDir, os.path.basename(imageName))
+        return base + "." + self.detectorName + extension
+
+    def detect(self, image):
+        """Detects and describes an image; returns (keypoint array, descriptors)
+        """
+        kp, des = self.detector.detectAndCompute(image, None)
+        return keypointsToArray(kp), des
+
+    def detectFrame(self, image):
+        """Like detect, but on a frame shrunk to detectSize and describing
+        only the maxFeatures strongest keypoints; keypoints come back in
+        full frame coordinates
+        """
+        factor = 1.0
+        if ((self.detectSize is not None) and (max(image.shape[0:2]) > self.detectSize)):
+            factor = float(self.detectSize) / max(image.shape[0:2])
+            size = (max(1, int(round(image.shape[1] * factor))), max(1, int(round(image.shape[0] * factor))))
+            image = cv2.resize(image, size, interpolation=cv2.INTER_AREA)
+
+        kp = self.detector.detect(image, None)
+        if ((self.maxFeatures is not None) and (len(kp) > self.maxFeatures)):
+            kp = sorted(kp, key=lambda k: -k.response)[:self.maxFeatures]
+        kp, des = self.detector.compute(image, kp)
+
+        kp = keypointsToArray(kp)
+        if (factor != 1.0):
+            kp[:, 0:3] /= factor    # x, y, size
+        return kp, des
+
+    def train(self, imageName):
+        """Loads the training features and index for imageName, computing and
+        persisting them only when the cache is missing or older than the image
+        """
+        featurePath = self.cachePath(imageName, ".npz")
+        indexPath = self.cachePath(imageName, ".flann")
+
+        if (isFresh(featurePath, [imageName])):
+            data = np.load(featurePath)
+            self.keypoints = data['keypoints']
+            self.descriptors = data['descriptors']
+            self.shape = tuple(data['shape'])
+        else:
+            image = cv2.imread(imageName, cv2.IMREAD_GRAYSCALE)
+            if (image is None):
+                raise IOError("Unable to read training image " + imageName)
+            self.keypoints, self.descriptors = self.detect(image)
+            if ((self.descriptors is None) or (len(self.descriptors) == 0)):
+                raise ValueError("No " + self.detectorName + " features in training image " + imageName)
+            self.shape = image.shape
+            np.savez(featurePath,
+                     keypoints=self.keypoints,
+                     descriptors=self.descriptors,
+                     shape=np.array(self.shape))
+
+        self.loadIndex(indexPath, featurePath)
+        return self
+
+    def loadIndex(self, indexPath, featurePath):
+        """Loads the FLANN index over the training descriptors, or builds and
+        saves it if it is missing or stale
+        """
+        if ((self.descriptors is None) or (len(self.descriptors) < 2)):
+            raise ValueError("Need at least 2 training descriptors to build an index")
+        self.descriptors = self.prepare(self.descriptors)
+        self.index = cv2.flann_Index()
+        if (self.binary == True):
+            # FLANN cannot serialize LSH tables (a loaded one crashes on
+            # search); they are cheap to hash again from the cached descriptors
+            self.index.build(self.descriptors, self.indexParams)
+            return
+        if (isFresh(indexPath, [featurePath])):
+            if (self.index.load(self.descriptors, indexPath) == True):
+                return
+        self.index.build(self.descriptors, self.indexParams)
+        self.index.save(indexPath)
+
+    def prepare(self, descriptors):
+        """FLANN wants float32 for the KD-tree and uint8 for LSH
+        """
+        if (self.binary == True):
+            return np.ascontiguousarray(descriptors, dtype=np.uint8)
+        return np.ascontiguousarray(descriptors, dtype=np.float32)
+
+    def match(self, des2):
+        """Matches frame descriptors against the training index
+
+        Returns (trainIdx, queryIdx, distance) arrays for the matches that
+        pass the ratio test, sorted by distance (best first)
+        """
+        empty = (np.empty(0, np.int32), np.empty(0, np.int32), np.empty(0, np.float32))
+        if ((des2 is None) or (len(des2) < 2) or (self.index is None)):
+            return empty
+
+        idx, dist = self.index.knnSearch(self.prepare(des2), 2, params=self.searchParams)
+        dist = dist.astype(np.float32)
+
+        ratio = self.ratio
+        if (self.binary == False):
+            ratio = ratio * ratio   # squared L2
+        good = (idx[:,1] >= 0) & (dist[:,0] < ratio * dist[:,1])
+        queryIdx = np.flatnonzero(good).astype(np.int32)
+        if (len(queryIdx) == 0):
+            return empty
+        trainIdx = idx[queryIdx, 0].astype(np.int32)
+        distance = dist[queryIdx, 0]
+
+        order = np.argsort(distance, kind='mergesort')
+        return trainIdx[order], queryIdx[order], distance[order]
+
+    def matchPoints(self, image):
+        """Detects features in a grayscale frame and matches them
+
+        Returns (src_pts, dst_pts, distance, kp2) where src_pts are training
+        points and dst_pts are frame points, both Nx1x2 float32, ready for
+        cv2.findHomography
+        """
+        kp2, des2 = self.detectFrame(image)
+        trainIdx, queryIdx, distance = self.match(des2)
+        src_pts = self.keypoints[trainIdx, 0:2].reshape(-1,1,2)
+        dst_pts = kp2[queryIdx, 0:2].reshape(-1,1,2)
+        return src_pts, dst_pts, distance, kp2
@@ -1,15 +1,32 @@
+import time
+
 import cv2
 import numpy as np
 
+from blobs import findBlobs, BACKENDS, AREA
+
 
 class FindBalls:
     """
     An OpenCV pipeline generated by GRIP.
+
+    The front end converts each frame once, to HSV, and takes the adaptive
+    threshold from its V channel (thresholdChannel='gray' keeps the
+    original grayscale input at the cost of a second conversion). All
+    intermediate images live in buffers allocated on the first frame of a
+    resolution, and findContours works on the threshold buffer directly.
+
+    blobBackend 'components' filters the blobs on connected component
+    stats and only traces the contours of the ones that are kept (see blobs).
     """
     
-    def __init__(self):
+    def __init__(self, thresholdChannel='value', blobBackend='contours'):
         """initializes all values to presets or None if need to be set
         """
+        if (thresholdChannel not in ('value', 'gray')):
+            raise ValueError("Unknown threshold channel %s" % thresholdChannel)
+        if (blobBackend not in BACKENDS):
+            raise ValueError("Unknown blob backend %s" % blobBackend)
         self.f = 1.0
         self.hue = [0.0, 61.74061433447099]
         self.sat = [73.38129496402877, 255.0]
@@ -18,27 +35,59 @@ class FindBalls:
         self.starthsv = (self.hue[0], self.sat[0], self.val[0])
         self.endhsv   = (self.hue[1], self.sat[1], self.val[1])
 
+        self.thresholdChannel = thresholdChannel
+        self.blobBackend = blobBackend
+        self.shape = None       # resolution the buffers are built for
+        self.count = 0          # balls found in the last frame
+
+    def prepare(self, shape):
+        """Allocates the front end buffers for frames of shape"""
+        (h, w) = shape[:2]
+        self.shape = shape
+        self.hsv = np.empty((h, w, 3), dtype=np.uint8)
+        self.channel = np.empty((h, w), dtype=np.uint8)
+        self.blurred = np.empty((h, w), dtype=np.uint8)
+        self.threshmask = np.empty((h, w), dtype=np.uint8)
+        self.colormask = np.empty((h, w), dtype=np.uint8)
+
+    def frontEnd(self, source0):
+        """Adaptive threshold of V (or gray) masked by the HSV range, in
+        self.threshmask; the buffer is rewritten every frame, so callers
+        may modify it
+        """
+        if (self.shape != source0.shape):
+            self.prepare(source0.shape)
+        cv2.cvtColor(source0, cv2.COLOR_BGR2HSV, dst=self.hsv)
+        if (self.thresholdChannel == 'value'):
+            cv2.extractChannel(self.hsv, 2, dst=self.channel)
+        else:
+            cv2.cvtColor(source0, cv2.COLOR_BGR2GRAY, dst=self.channel)
+        cv2.GaussianBlur(self.channel, (9, 9), 0, dst=self.blurred)
+        cv2.adaptiveThreshold(self.blurred, 255,
+        cv2.ADAPTIVE_THRESH_MEAN_C, cv2.THRESH_BINARY, 11, 4, dst=self.threshmask)
+        cv2.inRange(self.hsv, self.starthsv, self.endhsv, dst=self.colormask)
+        cv2.bitwise_and(self.threshmask, self.colormask, dst=self.threshmask)
+        return self.threshmask
+
     def process(self, source0):
         """
         Runs the pipeline and sets all outputs to new values.
         """
-        imagebw = cv2.cvtColor(source0, cv2.COLOR_BGR2GRAY)
-        blurred = cv2.GaussianBlur(imagebw, (9, 9), 0)
-        thresh1 = cv2.adaptiveThreshold(blurred, 255,
-        cv2.ADAPTIVE_THRESH_MEAN_C, cv2.THRESH_BINARY, 11, 4)
-        imagehsv = cv2.cvtColor(source0, cv2.COLOR_BGR2HSV)
-        thresh2 = cv2.inRange(imagehsv, self.starthsv,  self.endhsv)
-        threshmask = cv2.bitwise_and(thresh1, thresh1, mask = thresh2)
-        (_, contours, _) = cv2.findContours(threshmask.copy(), cv2.RETR_EXTERNAL,cv2.CHAIN_APPROX_SIMPLE)
+        threshmask = self.frontEnd(source0)
+        if (self.blobBackend == 'components'):
+            blobs = findBlobs(threshmask, 'components')
+            contours_area = blobs.select(blobs.stats[:, AREA] > 35).contours()
+        else:
+            (_, contours, _) = cv2.findContours(threshmask, cv2.RETR_EXTERNAL,cv2.CHAIN_APPROX_SIMPLE)
         
-        contours_area = []
-
-        # calculate area and filter into new array
-        for con in contours:
-                area = cv2.contourArea(con)
-                if 35 < area:
-                        contours_area.append(con)
-        print(len(contours_area))      
+            contours_area = []
+
+            # calculate area and filter into new array
+            for con in contours:
+                    area = cv2.contourArea(con)
+                    if 35 < area:
+                            contours_area.append(con)
+        self.count = len(contours_area)
         balls = source0
 
         for con in contours_area:
@@ -53,4 +102,180 @@ class FindBalls:
                 box = np.int0(box)
                 cv2.drawContours(balls,[box],0,(0,0,255),2)
         
-        return balls
\ No newline at end of file
+        return balls
+
+
+class FindClusteredBalls:
+    """
+    Counts and locates balls even when they touch, after ball2.py
+
+    The thresholded balls are turned into a distance transform, whose
+    correlation with the distance transform of a disk peaks at every ball
+    center. The kernels, the template and its DFT are built once per
+    resolution and every buffer is reused between frames.
+
+    method picks the correlation: 'direct' (cv2.matchTemplate), 'fft'
+    (cached template DFT, normalized with box filters) or 'auto', which
+    times both on the first frame of a resolution and keeps the faster.
+    Windows without any variance (flat background) score 0 instead of the
+    rounding noise matchTemplate gives them, and only foreground pixels
+    can be peaks.
+    """
+
+    def __init__(self, name='ClusteredBalls', borderSize=25, gap=10,
+                 peakFraction=0.5, minPeakArea=12, method='auto'):
+        """initializes all values to presets or None if need to be set
+        """
+        if (method not in ('auto', 'fft', 'direct')):
+            raise ValueError("Unknown correlation method %s" % method)
+        self.name = name
+        self.hue = [0.0, 61.74061433447099]
+        self.sat = [73.38129496402877, 255.0]
+        self.val = [215.55755395683454, 255.0]
+        self.starthsv = (self.hue[0], self.sat[0], self.val[0])
+        self.endhsv   = (self.hue[1], self.sat[1], self.val[1])
+
+        self.borderSize = borderSize
+        self.gap = gap
+        self.peakFraction = peakFraction
+        self.minPeakArea = minPeakArea
+        self.method = method
+
+        self.closeKernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (5, 5))
+        disk = cv2.getStructuringElement(cv2.MORPH_ELLIPSE,
+                                         (2*(borderSize-gap)+1, 2*(borderSize-gap)+1))
+        disk = cv2.copyMakeBorder(disk, gap, gap, gap, gap,
+                                  cv2.BORDER_CONSTANT | cv2.BORDER_ISOLATED, 0)
+        self.template = cv2.distanceTransform(disk, cv2.DIST_L2, cv2.DIST_MASK_PRECISE)
+        zeroMean = self.template.astype(np.float64) - self.template.mean()
+        self.templateNorm = np.sqrt((zeroMean**2).sum())
+        self.zeroMeanTemplate = zeroMean.astype(np.float32)
+
+        self.shape = None       # resolution the buffers below are built for
+        self.balls = np.empty((0, 3), dtype=np.float32)    # x, y, radius
+
+    def prepare(self, shape):
+        """Builds the buffers (and the template DFT) for frames of shape"""
+        (h, w) = shape[:2]
+        b = self.borderSize
+        m = self.template.shape[0]
+        self.shape = shape
+        self.hsv = np.empty((h, w, 3), dtype=np.uint8)
+        self.mask = np.empty((h, w), dtype=np.uint8)
+        self.morph = np.empty((h, w), dtype=np.uint8)
+        self.peaks = np.empty((h, w), dtype=np.uint8)
+        self.score = np.empty((h, w), dtype=np.float32)
+
+        # the bordered distance transform lives at the top left of a buffer
+        # padded to a fast DFT size; the padding stays zero
+        self.dftSize = (cv2.getOptimalDFTSize(h + 2*b), cv2.getOptimalDFTSize(w + 2*b))
+        self.padded = np.zeros(self.dftSize, dtype=np.float32)
+        self.dist = self.padded[b:b+h, b:b+w]
+        self.bordered = self.padded[:h+2*b, :w+2*b]
+
+        templ = np.zeros(self.dftSize, dtype=np.float32)
+        templ[:m, :m] = self.zeroMeanTemplate
+        self.templateDFT = cv2.dft(templ)
+        self.spectrum = np.empty(self.dftSize, dtype=np.float32)
+        self.correlation = np.empty(self.dftSize, dtype=np.float32)
+        self.sums = np.empty(self.bordered.shape, dtype=np.float64)
+        self.squares = np.empty(self.bordered.shape, dtype=np.float64)
+        self.denominator = np.empty((h, w), dtype=np.float32)
+
+        self.useFFT = (self.method == 'fft')
+        if (self.method == 'auto'):
+            self.useFFT = None  # decided on the first frame
+
+    def correlateDirect(self):
+        return cv2.matchTemplate(self.bordered, self.template, cv2.TM_CCOEFF_NORMED, result=self.score)
+
+    def correlateFFT(self):
+        """TM_CCOEFF_NORMED through the cached template DFT; the template
+        has zero mean so the window means drop out of the numerator, and
+        the window variances come from box filters
+        """
+        (h, w) = self.score.shape
+        m = self.template.shape[0]
+        cv2.dft(self.padded, dst=self.spectrum)
+        cv2.mulSpectrums(self.spectrum, self.templateDFT, 0, self.spectrum, conjB=True)
+        cv2.idft(self.spectrum, dst=self.correlation, flags=cv2.DFT_SCALE | cv2.DFT_REAL_OUTPUT)
+        numerator = self.correlation[:h, :w]
+
+        # window sums and sums of squares (centered box filters over the
+        # bordered image, so the window at x, y is centered at x+b, y+b)
+        b = self.borderSize
+        cv2.boxFilter(self.bordered, cv2.CV_64F, (m, m), dst=self.sums, normalize=False,
+                      borderType=cv2.BORDER_CONSTANT)
+        cv2.sqrBoxFilter(self.bordered, cv2.CV_64F, (m, m), dst=self.squares, normalize=False,
+                         borderType=cv2.BORDER_CONSTANT)
+        cv2.multiply(self.sums, self.sums, dst=self.sums, scale=1.0 / (m * m))
+        cv2.subtract(self.squares, self.sums, dst=self.squares)
+        cv2.max(self.squares, 0.0, dst=self.squares)
+        cv2.sqrt(self.squares, dst=self.squares)
+        np.multiply(self.squares[b:b+h, b:b+w], self.templateNorm, out=self.denominator, casting='unsafe')
+
+        self.score[...] = 0.0
+        np.divide(numerator, self.denominator, out=self.score,
+                  where=(self.denominator > 1e-3 * self.templateNorm))
+        return np.clip(self.score, -1.0, 1.0, out=self.score)
+
+    def correlate(self):
+        if (self.useFFT is None):
+            # best of two runs each, the first ones pay for cold caches
+            direct = fft = float('inf')
+            for _ in range(2):
+                start = time.time()
+                self.correlateDirect()
+                direct = min(direct, time.time() - start)
+                start = time.time()
+                self.correlateFFT()
+                fft = min(fft, time.time() - start)
+            self.useFFT = (fft < direct)
+            return self.score
+        if (self.useFFT == True):
+            return self.correlateFFT()
+        return self.correlateDirect()
+
+    def findPeaks(self, score):
+        """Ball per connected peak region: the foreground pixel with the
+        largest distance in it is the center, that distance the radius
+        """
+        # the closed mask is exactly where the distance is above zero
+        foreground = self.morph
+        if (cv2.countNonZero(foreground) == 0):
+            return np.empty((0, 3), dtype=np.float32)
+        _, maxScore, _, _ = cv2.minMaxLoc(score, mask=foreground)
+        cv2.compare(score, self.peakFraction * maxScore, cv2.CMP_GT, dst=self.peaks)
+        cv2.bitwise_and(self.peaks, foreground, dst=self.peaks)
+        _, labels, stats, _ = cv2.connectedComponentsWithStats(self.peaks, connectivity=8)
+
+        ys, xs = np.nonzero(self.peaks)
+        if (len(ys) == 0):
+            return np.empty((0, 3), dtype=np.float32)
+        labelOf = labels[ys, xs]
+        distOf = self.dist[ys, xs]
+        # sort by label then distance; the last entry of a label is its max
+        order = np.lexsort((distOf, labelOf))
+        last = np.append(np.flatnonzero(np.diff(labelOf[order])), len(order) - 1)
+        best = order[last]
+        keep = stats[labelOf[best], cv2.CC_STAT_AREA] > self.minPeakArea
+        best = best[keep]
+        return np.column_stack((xs[best], ys[best], distOf[best])).astype(np.float32)
+
+    def process(self, source0):
+        """
+        Runs the pipeline and sets all outputs to new values.
+        """
+        if (self.shape != source0.shape):
+            self.prepare(source0.shape)
+        cv2.cvtColor(source0, cv2.COLOR_BGR2HSV, dst=self.hsv)
+        cv2.inRange(self.hsv, self.starthsv, self.endhsv, dst=self.mask)
+        cv2.morphologyEx(self.mask, cv2.MORPH_CLOSE, self.closeKernel, dst=self.morph)
+        self.dist[...] = cv2.distanceTransform(self.morph, cv2.DIST_L2, cv2.DIST_MASK_PRECISE)
+
+        self.balls = self.findPeaks(self.correlate())
+
+        balls = source0
+        for (x, y, radius) in self.balls:
+            cv2.circle(balls, (int(x), int(y)), int(radius), (255, 0, 0), 2)
+        return balls
@@ -1,6 +1,7 @@
 import cv2
 import numpy as np
 import math
+from resizer import interpolationFor
 from targetdata import TargetData
 
 class GearLift:
@@ -16,7 +17,7 @@ class GearLift:
         
         self.__resize_image_width = 320.0
         self.__resize_image_height = 240.0
-        self.__resize_image_interpolation = cv2.INTER_CUBIC
+        self.__resize_image_interpolation = None    # by resizer.interpolationFor
 
         self.resize_image_output = None
 
@@ -112,17 +113,23 @@ class GearLift:
         return (self.find_contours_output, self.filter_contours_output)
 
     @staticmethod
-    def __resize_image(input, width, height, interpolation):
+    def __resize_image(input, width, height, interpolation, resizer=None):
         """Scales and image to an exact size.
         Args:
             input: A numpy.ndarray.
             Width: The desired width in pixels.
             Height: The desired height in pixels.
-            interpolation: Opencv enum for the type fo interpolation.
+            interpolation: Opencv enum for the type fo interpolation, or None
+                for resizer.interpolationFor('process', ...) (INTER_AREA to shrink).
+            resizer: A resizer.Resizer to resize into its reused buffers, or None.
         Returns:
             A numpy.ndarray of the new size.
         """
-        return cv2.resize(input, ((int)(width), (int)(height)), 0, 0, interpolation)
+        if (interpolation is None):
+            interpolation = interpolationFor('process', (input.shape[1], input.shape[0]), (width, height))
+        if (resizer is not None):
+            return resizer.resize(input, width, height, interpolation)
+        return cv2.resize(input, ((int)(width), (int)(height)), interpolation=interpolation)
 
     @staticmethod
     def __hsl_threshold(input, hue, sat, lum):
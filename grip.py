@@ -3,6 +3,8 @@ import numpy
 import math
 from enum import Enum
 
+from resizer import Resizer, interpolationFor
+
 class GripPipeline:
     """
     An OpenCV pipeline generated by GRIP.
@@ -14,7 +16,8 @@ class GripPipeline:
 
         self.__resize_image_width = 640.0
         self.__resize_image_height = 480.0
-        self.__resize_image_interpolation = cv2.INTER_AREA
+        self.__resize_image_interpolation = None    # by resizer.interpolationFor
+        self.__resize_image_resizer = Resizer()
 
         self.resize_image_output = None
 
@@ -38,7 +41,7 @@ class GripPipeline:
         """
         # Step Resize_Image0:
         self.__resize_image_input = source0
-        (self.resize_image_output) = self.__resize_image(self.__resize_image_input, self.__resize_image_width, self.__resize_image_height, self.__resize_image_interpolation)
+        (self.resize_image_output) = self.__resize_image(self.__resize_image_input, self.__resize_image_width, self.__resize_image_height, self.__resize_image_interpolation, self.__resize_image_resizer)
 
         # Step Blur0:
         self.__blur_input = self.resize_image_output
@@ -50,17 +53,23 @@ class GripPipeline:
 
 
     @staticmethod
-    def __resize_image(input, width, height, interpolation):
+    def __resize_image(input, width, height, interpolation, resizer=None):
         """Scales and image to an exact size.
         Args:
             input: A numpy.ndarray.
             Width: The desired width in pixels.
             Height: The desired height in pixels.
-            interpolation: Opencv enum for the type fo interpolation.
+            interpolation: Opencv enum for the type fo interpolation, or None
+                for resizer.interpolationFor('process', ...) (INTER_AREA to shrink).
+            resizer: A resizer.Resizer to resize into its reused buffers, or None.
         Returns:
             A numpy.ndarray of the new size.
         """
-        return cv2.resize(input, ((int)(width), (int)(height)), 0, 0, interpolation)
+        if (interpolation is None):
+            interpolation = interpolationFor('process', (input.shape[1], input.shape[0]), (width, height))
+        if (resizer is not None):
+            return resizer.resize(input, width, height, interpolation)
+        return cv2.resize(input, ((int)(width), (int)(height)), interpolation=interpolation)
 
     @staticmethod
     def __blur(src, type, radius):
@@ -0,0 +1,132 @@
+'''
+homographyverifier
+
+Time bounded homography verification for the feature matching pipelines.
+
+cv2.findHomography(..., cv2.RANSAC, 5.0) runs with the default 2000 iteration
+cap and no notion of time, so a bad frame can cost far more than a capture
+period. The verifier instead
+
+    1. tries the previous frame's homography first and accepts it outright
+       when enough of the new matches agree with it,
+    2. otherwise runs PROSAC (cv2.RHO) over matches sorted best first, which
+       samples good matches early instead of uniformly,
+    3. caps the iterations from the time left in the frame budget, using a
+       running estimate of the cost of one iteration, and
+    4. gives up (returns no homography) once the budget is spent.
+'''
+import math
+import time
+
+import cv2
+import numpy as np
+
+# PROSAC-based estimator (OpenCV 3.0+); plain RANSAC on sorted points otherwise
+PROSAC = getattr(cv2, 'RHO', cv2.RANSAC)
+
+
+class HomographyVerifier:
+    """
+    Per-frame budgeted replacement for cv2.findHomography(src, dst, cv2.RANSAC, 5.0)
+    """
+
+    def __init__(self, budget=1.0/30.0, threshold=5.0, maxIters=2000, confidence=0.995,
+                 acceptRatio=0.8, minIters=10):
+        """initializes all values to presets or None if need to be set
+
+        budget is in seconds per frame and normally one capture period
+        """
+        self.budget = budget
+        self.threshold = threshold
+        self.maxIters = maxIters
+        self.minIters = minIters
+        self.confidence = confidence
+        self.acceptRatio = acceptRatio
+
+        self.deadline = None
+        self.previous = {}          # last accepted homography per key
+        self.iterationCost = 0.0    # running estimate in seconds
+
+        # Statistics
+        self.reused = 0
+        self.estimated = 0
+        self.overBudget = 0
+
+    def startFrame(self):
+        """Starts the budget for a new frame
+        """
+        self.deadline = time.time() + self.budget
+        return self
+
+    def remaining(self):
+        if (self.deadline is None):
+            return self.budget
+        return self.deadline - time.time()
+
+    def expectedIterations(self, inlierRatio):
+        """Standard RANSAC iteration count for a 4 point model
+        """
+        w4 = inlierRatio ** 4
+        if (w4 <= 0.0):
+            return self.maxIters
+        if (w4 >= 1.0):
+            return 1
+        return int(math.ceil(math.log(1.0 - self.confidence) / math.log(1.0 - w4)))
+
+    def iterationCap(self):
+        """Iterations that still fit in this frame
+        """
+        if (self.iterationCost <= 0.0):
+            return self.maxIters
+        cap = int(self.remaining() / self.iterationCost)
+        return max(self.minIters, min(self.maxIters, cap))
+
+    def verify(self, src_pts, dst_pts, key=None):
+        """Estimates the homography from src_pts to dst_pts (Nx1x2 float32,
+        sorted best match first)
+
+        Returns (M, mask) like cv2.findHomography; both are None when there
+        is no answer within the budget
+        """
+        count = len(src_pts)
+        if (count < 4):
+            return None, None
+
+        # First hypothesis: the previous frame's homography
+        M = self.previous.get(key)
+        if (M is not None):
+            projected = cv2.perspectiveTransform(src_pts, M)
+            error = np.linalg.norm((projected - dst_pts).reshape(-1,2), axis=1)
+            mask = (error < self.threshold)
+            if (mask.sum() >= self.acceptRatio * count):
+                self.reused += 1
+                mask = mask.astype(np.uint8).reshape(-1,1)
+                return M, mask
+
+        if (self.remaining() <= 0.0):
+            self.overBudget += 1
+            return None, None
+
+        maxIters = self.iterationCap()
+        start = time.time()
+        M, mask = cv2.findHomography(src_pts, dst_pts, PROSAC, self.threshold,
+                                     maxIters=maxIters, confidence=self.confidence)
+        elapsed = time.time() - start
+        self.estimated += 1
+
+        # Update the per-iteration cost from the iterations we expect were used
+        if (mask is not None):
+            used = min(maxIters, self.expectedIterations(float(mask.sum()) / count))
+        else:
+            used = maxIters
+        cost = elapsed / max(1, used)
+        if (self.iterationCost == 0.0):
+            self.iterationCost = cost
+        else:
+            self.iterationCost = 0.9 * self.iterationCost + 0.1 * cost
+
+        if (M is None):
+            self.previous.pop(key, None)
+        else:
+            self.previous[key] = M
+        return M, mask
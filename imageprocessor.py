@@ -1,26 +1,25 @@
 
-from threading import Lock
 from threading import Thread
-from threading import Condition
 
 from framerate import FrameRate
 from frameduration import FrameDuration
+from cubbyhole import BroadcastSlot
 
 class ImageProcessor:
     def __init__(self,stream,ip):
         print("Creating ImageProcessor for " + stream.name)
-        self._lock = Lock()
-        self._condition = Condition()
+        self.slot = BroadcastSlot()
         self.fps = FrameRate()
         self.duration = FrameDuration()
         self.stream = stream
         self.ip = ip
 
-        (self._frame, self.count, self.isNew) = self.stream.read()
+        (self._frame, self.inCount, self.isNew) = self.stream.read()
 
         if (self.isNew == True):
             self.count = 1
             self.frame = self._frame
+            self.slot.put(self.frame)
         else:
             self.frame = None
             self.count = 0
@@ -45,6 +44,7 @@ class ImageProcessor:
         self.stopped = False
         self.fps.start()
         
+        inCount = self.inCount
         while True:
             # if the thread indicator variable is set, stop the thread
             if (self._stop == True):
@@ -54,7 +54,7 @@ class ImageProcessor:
 
             # otherwise, read the next frame from the stream
             # grab the frame from the threaded video stream
-            (self._frame, count, isNew) = self.stream.read()
+            (self._frame, inCount, isNew) = self.stream.read(inCount)
             self.duration.start()
             self.fps.update()
 
@@ -65,39 +65,29 @@ class ImageProcessor:
                 # Now that image processing is complete, place results
                 # into an outgoing buffer to be grabbed at the convenience
                 # of the reader
-                self._condition.acquire()
-                self._lock.acquire()
                 self.count = self.count + 1
                 self.isNew = isNew
                 self.frame = self._frame
-                self._lock.release()
-                self._condition.notifyAll()
-                self._condition.release()
+                self.slot.put(self.frame)
 
             self.duration.update()
                 
         print("ImageProcessor for " + self.stream.name + " STOPPING")
 
-    def read(self):
-        # return the frame most recently processed if the frame
-        # is not being updated at this exact moment
-        self._condition.acquire()
-        self._condition.wait()
-        self._condition.release()
-        if (self._lock.acquire() == True):
-            self.outFrame = self.frame
-            self.outCount = self.count
-            self._lock.release()
-            return (self.outFrame, self.outCount, True)
-        else:
-            return (self.outFrame, self.outCount, False)
+    def read(self, after=None):
+        # wait for a frame newer than count after (by default newer than the
+        # current one) and return (frame, count, isNew); isNew is False only
+        # once stopped. Passing the count of the last frame read means a
+        # frame published while the caller was busy is returned right away
+        if (after is None):
+            after = self.slot.seq
+        (count, frame) = self.slot.get(after)
+        return (frame, count, count != after)
           
     def stop(self):
         # indicate that the thread should be stopped
         self._stop = True
-        self._condition.acquire()
-        self._condition.notifyAll()
-        self._condition.release()
+        self.slot.close()
 
     def isStopped(self):
         return self.stopped
@@ -42,6 +42,7 @@ SOFTWARE.
 """
 
 import cv2
+import numpy
 import time
 import logging      # Needed if we want to see debug messages from NetworkTables
 import platform
@@ -50,17 +51,18 @@ import platform
 from networktables import NetworkTables
 
 from camera import Camera         # Camera capture 
-from processor import Processor   # Image processing 
+from runtime import Runtime, CaptureStage, ProcessStage, OutputStage   # Image processing 
 from server import Server         # Web server
 from framerate import FrameRate
 from bitrate import BitRate
-from cubbyhole import Cubbyhole
+from cubbyhole import BroadcastSlot
 
 # Instances of Manual or GRIP created pipelines (they usually require some manual manipulation
 # but basically we would pass one or more of these into one or more image processors (threads)
 # to have their respective process(frame) functions called.
 from nada import Nada
 from faces import Faces
+from cascaderunner import plausibleSize
 from gearlift import GearLift
 
 
@@ -117,22 +119,27 @@ print("Cameras are online!")
 
 
 # OpenCV pipelines for Front Processor
-frontPipes = {'faces'       : Faces('Faces'),
+# Faces 0.16 m wide, 0.3 m to 3 m from a 60 degree camera at 320 px wide
+minFace, maxFace = plausibleSize(0.16, 60.0, 320, 0.3, 3.0)
+
+frontPipes = {'faces'       : Faces('Faces', detectEvery=5, downscale=0.5,
+                                    minFace=minFace, maxFace=maxFace, workers=2),
               'redBoiler'   : Nada('RedBoiler'),
               'blueBoiler'  : Nada('BlueBoiler'),
               'gearLift'    : GearLift('GearLift', bvTable)
               }
 
-frontProcessor = Processor("frontProcessor", frontCam, frontPipes['faces']).start()
+# Each runtime is capture -> processor -> output; the output is what the
+# sink below reads
+frontProcessor = Runtime(CaptureStage(frontCam, name="frontCam"),
+                         ProcessStage(frontPipes['faces'], name="frontProcessor"),
+                         OutputStage(name="frontOutput")).start()
 # This is just an example of a 2nd Processor
 # Note that it's OK to use the same Camera (frontCam in this case) to feed multiple Processors
-frontProc2 = Processor( "frontProc2", frontCam, frontPipes['gearLift']).start()
+frontProc2 = Runtime(CaptureStage(frontCam, name="frontCam"),
+                     ProcessStage(frontPipes['gearLift'], name="frontProc2"),
+                     OutputStage(name="front2Output")).start()
 
-while not frontProcessor.isRunning():
-    time.sleep(0.001)
-while not frontProc2.isRunning():
-    time.sleep(0.001)
-    
 print("Processors are online!")
 
 
@@ -150,7 +157,7 @@ print("Processors are online!")
 #cmd = ['sudo iptables -t nat -A PREROUTING -i wlan0 -p tcp --dport 80 -j REDIRECT --to-port 8080']
 #call(cmd,shell=True)
 
-# Dict maps network table entry "CurrentCam" to Processor instance
+# Dict maps network table entry "CurrentCam" to Runtime instance
 processors = {'frontCam' : frontProcessor, 'front2' : frontProc2}
 
 
@@ -159,7 +166,9 @@ class ImgSink:
     def __init__(self):
         self.fps = FrameRate()
         self.bitrate = BitRate()
-        self.cubby = Cubbyhole()
+        self.slot = BroadcastSlot()
+        self.procSeq = {}       # seq of the last frame shown, per runtime
+        self.img = None         # own copy of it, to draw on
 
     # Gets frames from selected processor, 
     # displays vid in local window,
@@ -167,14 +176,24 @@ class ImgSink:
     # Called from main thread - note, imshow can only be called from main thread or big crash!
     def show(self):
         
-        theProcessor = processors[currentCam.value]                                   
-        img = theProcessor.read()
+        (capture, theProcessor, output) = processors[currentCam.value].stages
+        (seq, frame) = output.read(self.procSeq.get(output.name, 0))
+        self.procSeq[output.name] = seq
             
         self.fps.start()
 
+        # The processor reuses its images; draw on, encode and show a copy
+        # so a stall in imshow/waitKey cannot see it overwritten
+        shared = frame.image
+        if self.img is None or self.img.shape != shared.shape:
+            self.img = numpy.empty_like(shared)
+        numpy.copyto(self.img, shared)
+        img = self.img
+
         # Write some useful info on the frame
-        camFps, camUtil = theProcessor.camera.fps.get()
-        procFps, procUtil = theProcessor.fps.get()
+        camFps, camUtil = capture.source.fps.get()
+        procStats = theProcessor.stats()
+        procFps, procUtil = procStats['fps'], procStats['utilization']
         srvFps, srvUtil = self.fps.get()
         srvBitrate = self.bitrate.get()
 
@@ -184,10 +203,10 @@ class ImgSink:
         cv2.putText(img, currentCam.value, (0, 80), cv2.FONT_HERSHEY_PLAIN, 1, (0, 255, 0), 1)
         cv2.putText(img, theProcessor.pipeline.name, (0, 100), cv2.FONT_HERSHEY_PLAIN, 1, (0, 255, 0), 1)
         
-        # Compress image to jpeg and stash in cubbyhole for webserver to grab
+        # Compress image to jpeg and publish it to every web client
         _, jpg = cv2.imencode(".jpg", img, (cv2.IMWRITE_JPEG_QUALITY, 80))
-        buf = bytearray(jpg)
-        self.cubby.put(buf)
+        buf = jpg.tobytes()
+        self.slot.put(buf)
         
         self.bitrate.update(len(buf))      
         self.fps.stop()
@@ -197,9 +216,10 @@ class ImgSink:
         key = cv2.waitKey(1)
         return key
     
-    # Web Server calls this to get jpeg to send
-    def get(self):
-        return self.cubby.get()
+    # Web Server calls this to get the next jpeg to send: (seq, buf) of one
+    # newer than seq after, so every client gets every frame it can keep up with
+    def get(self, after=0):
+        return self.slot.get(after)
                 
         
 # Start web server
@@ -229,7 +249,7 @@ while True:
     elif frontCamMode.value == 'blueBoiler' or frontCamMode.value == 'redBoiler':
         frontCam.setExposure(FRONT_CAM_NORMAL_EXPOSURE)
 
-    frontProcessor.setPipeline( frontPipes[frontCamMode.value])
+    frontProcessor['frontProcessor'].setPipeline( frontPipes[frontCamMode.value])
     
     key = imgSink.show()
     
@@ -239,6 +259,8 @@ while True:
         
 
 # do a bit of cleanup
+frontProcessor.stop()
+frontProc2.stop()
 cv2.destroyAllWindows()
 
 print("Goodbye!")
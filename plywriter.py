@@ -0,0 +1,150 @@
+'''
+plywriter
+
+Binary little-endian PLY point cloud export.
+
+Points (float32 x, y, z) and colors (uchar red, green, blue) are copied
+straight into a packed structured array that has exactly the PLY vertex
+layout and written out as raw bytes, so there is no float conversion of the
+colors, no hstack of points and colors and no text formatting.
+
+PlyWriter streams: every write() appends a chunk of vertices and the vertex
+count in the header is patched in when the file is closed, so a capture can
+keep logging clouds at frame rate without holding them in memory.
+'''
+from __future__ import print_function
+import numpy as np
+
+VERTEX_DTYPE = np.dtype([('xyz', '<f4', (3,)), ('rgb', 'u1', (3,))])
+
+COUNT_WIDTH = 12        # digits reserved for the vertex count
+
+ply_header = '''ply
+format binary_little_endian 1.0
+element vertex %(vert_num)s
+property float x
+property float y
+property float z
+property uchar red
+property uchar green
+property uchar blue
+end_header
+'''
+
+
+def header(count):
+    """PLY header for count vertices, the count zero padded to a fixed
+    width so that it can be rewritten in place
+    """
+    return (ply_header % dict(vert_num=str(count).zfill(COUNT_WIDTH))).encode('ascii')
+
+
+class PlyWriter:
+    """
+    Streams vertices to a binary PLY file
+
+    with PlyWriter('session.ply') as ply:
+        ply.write(points[mask], colors[mask])   # as often as needed
+    """
+
+    def __init__(self, fn, chunkSize=1 << 18):
+        """initializes all values to presets or None if need to be set
+
+        chunkSize bounds the vertex buffer: larger writes are split into
+        chunks of that many vertices
+        """
+        self.fn = fn
+        self.chunkSize = chunkSize
+        self.count = 0
+        self._buffer = None     # reused structured vertex buffer
+        self.f = open(fn, 'wb')
+        self.f.write(header(0))
+
+    def write(self, verts, colors):
+        """Appends verts (Nx3, any float type) with colors (Nx3 uchar)"""
+        verts = verts.reshape(-1, 3)
+        colors = colors.reshape(-1, 3)
+        if (len(verts) != len(colors)):
+            raise ValueError("%d points but %d colors" % (len(verts), len(colors)))
+
+        for start in range(0, len(verts), self.chunkSize):
+            stop = min(start + self.chunkSize, len(verts))
+            n = stop - start
+            if ((self._buffer is None) or (len(self._buffer) < n)):
+                self._buffer = np.empty(min(len(verts), self.chunkSize), dtype=VERTEX_DTYPE)
+            chunk = self._buffer[:n]
+            chunk['xyz'] = verts[start:stop]
+            chunk['rgb'] = colors[start:stop]
+            self.f.write(chunk.tobytes())
+        self.count += len(verts)
+
+    def flush(self):
+        """Makes the file valid as it stands (header count and data on disk)
+        without closing it
+        """
+        end = self.f.tell()
+        self.f.seek(0)
+        self.f.write(header(self.count))
+        self.f.seek(end)
+        self.f.flush()
+
+    def close(self):
+        if (self.f is not None):
+            self.flush()
+            self.f.close()
+            self.f = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def write_ply(fn, verts, colors):
+    """Writes one point cloud to fn"""
+    with PlyWriter(fn) as ply:
+        ply.write(verts, colors)
+
+
+def read_ply(fn):
+    """Reads a file written by PlyWriter back as (verts, colors)"""
+    with open(fn, 'rb') as f:
+        line = b''
+        count = 0
+        while (line != b'end_header\n'):
+            line = f.readline()
+            if (line.startswith(b'element vertex')):
+                count = int(line.split()[2])
+        data = np.fromfile(f, dtype=VERTEX_DTYPE, count=count)
+    return data['xyz'], data['rgb']
+
+
+def bench(n=1000000):
+    """Times the old savetxt ASCII writer against write_ply"""
+    import os
+    import tempfile
+    import time
+
+    verts = np.random.rand(n, 3).astype(np.float32)
+    colors = np.random.randint(0, 256, (n, 3)).astype(np.uint8)
+    path = os.path.join(tempfile.mkdtemp(), 'bench.ply')
+
+    start = time.time()
+    stacked = np.hstack([verts, colors])
+    with open(path, 'wb') as f:
+        f.write(('ply\nformat ascii 1.0\nelement vertex %d\n' % n).encode('utf-8'))
+        np.savetxt(f, stacked, fmt='%f %f %f %d %d %d ')
+    print('ascii  %d points: %.3fs, %d bytes' % (n, time.time() - start, os.path.getsize(path)))
+
+    start = time.time()
+    write_ply(path, verts, colors)
+    print('binary %d points: %.3fs, %d bytes' % (n, time.time() - start, os.path.getsize(path)))
+
+    readVerts, readColors = read_ply(path)
+    print('round trip ok: %s' % (np.array_equal(readVerts, verts) and np.array_equal(readColors, colors)))
+    os.remove(path)
+
+
+if __name__ == '__main__':
+    bench()
@@ -0,0 +1,108 @@
+'''
+resizer
+
+Resizing into reused output buffers
+
+cv2.resize(src, size) allocates a new output image on every call. A Resizer
+owns two output images and alternates between them through dst=, so after
+the first two frames nothing is allocated, and the image handed out for the
+previous frame stays intact while the next one is written (something may
+still be drawing on or showing it).
+
+interpolationFor picks the interpolation by what the image is for:
+
+    - 'display': INTER_AREA to shrink, INTER_NEAREST to enlarge
+    - 'process': INTER_AREA to shrink, INTER_LINEAR to enlarge
+    - 'cubic':   INTER_CUBIC, only for a pipeline that needs it
+
+python resizer.py compares the GRIP style resize (new image, cubic) with a
+Resizer for each purpose.
+'''
+import cv2
+import numpy as np
+
+PURPOSES = ('display', 'process', 'cubic')
+
+
+def interpolationFor(purpose, fromSize, toSize):
+    """Interpolation for resizing an image of fromSize to toSize
+    (both (width, height)) for purpose
+    """
+    if (purpose == 'cubic'):
+        return cv2.INTER_CUBIC
+    if (purpose not in PURPOSES):
+        raise ValueError("Unknown resize purpose %s" % purpose)
+    if ((toSize[0] <= fromSize[0]) and (toSize[1] <= fromSize[1])):
+        return cv2.INTER_AREA
+    return cv2.INTER_NEAREST if purpose == 'display' else cv2.INTER_LINEAR
+
+
+class Resizer:
+    """
+    Resizes into two output images that it owns, in turn
+    """
+
+    def __init__(self, purpose='process', buffers=2):
+        """initializes all values to presets or None if need to be set
+
+        purpose picks the interpolation when resize() is not given one
+        """
+        if (purpose not in PURPOSES):
+            raise ValueError("Unknown resize purpose %s" % purpose)
+        self.purpose = purpose
+        self._outputs = [None] * buffers
+        self._next = 0
+        self.allocated = 0      # output images created so far
+
+    def output(self, shape, dtype):
+        """The next output image, (re)allocated only if shape or dtype changed"""
+        out = self._outputs[self._next]
+        if ((out is None) or (out.shape != shape) or (out.dtype != dtype)):
+            out = np.empty(shape, dtype=dtype)
+            self._outputs[self._next] = out
+            self.allocated += 1
+        self._next = (self._next + 1) % len(self._outputs)
+        return out
+
+    def resize(self, input, width, height, interpolation=None):
+        """input scaled to exactly width x height, in the next output image"""
+        size = ((int)(width), (int)(height))
+        if (interpolation is None):
+            interpolation = interpolationFor(self.purpose, (input.shape[1], input.shape[0]), size)
+        out = self.output((size[1], size[0]) + input.shape[2:], input.dtype)
+        cv2.resize(input, size, dst=out, interpolation=interpolation)
+        return out
+
+
+def bench(inSize=(640, 480), outSize=(320, 240), frames=500):
+    """Times and counts output allocations per resize variant"""
+    import time
+    frame = np.random.randint(0, 256, (inSize[1], inSize[0], 3)).astype(np.uint8)
+
+    start = time.time()
+    for _ in range(frames):
+        cv2.resize(frame, outSize, interpolation=cv2.INTER_CUBIC)
+    print('%-24s %7.3f ms  %d allocations' % ('new image, cubic', 1000.0 * (time.time() - start) / frames, frames))
+
+    for purpose in ('cubic', 'process', 'display'):
+        resizer = Resizer(purpose)
+        start = time.time()
+        for _ in range(frames):
+            resizer.resize(frame, outSize[0], outSize[1])
+        print('%-24s %7.3f ms  %d allocations' % ('Resizer ' + purpose, 1000.0 * (time.time() - start) / frames, resizer.allocated))
+
+    # enlarging for display
+    resizer = Resizer('display')
+    big = (inSize[0] * 2, inSize[1] * 2)
+    start = time.time()
+    for _ in range(frames):
+        cv2.resize(frame, big, interpolation=cv2.INTER_CUBIC)
+    print('%-24s %7.3f ms' % ('enlarge, new cubic', 1000.0 * (time.time() - start) / frames))
+    start = time.time()
+    for _ in range(frames):
+        resizer.resize(frame, big[0], big[1])
+    print('%-24s %7.3f ms  %d allocations' % ('enlarge, Resizer display', 1000.0 * (time.time() - start) / frames, resizer.allocated))
+
+
+if __name__ == '__main__':
+    bench()
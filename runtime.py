@@ -0,0 +1,600 @@
+'''
+runtime
+
+One capture -> process -> output brigade for every pipeline
+
+The entry scripts each grew their own thread classes for this (Bucket*,
+Camera/Processor/Server, Cv2Capture/AngryProcesses/CSDisplay), every set
+with its own locking, statistics and way of stopping. A Runtime is a chain
+of Stages instead:
+
+    - a Stage runs handle(frame) on one or more threads and passes what it
+      returns to the next stage
+    - stages are joined by bounded queues; when a queue is full the oldest
+      frame in it is dropped (policy 'drop', the default: the newest frame
+      always wins) or the stage in front waits for room (policy 'block',
+      backpressure all the way back to the capture)
+    - every frame carries the sequence number and time of its capture, and
+      a stage never passes on a frame older than one it already passed on
+      (which several workers would otherwise do)
+    - every stage counts what came in, went out, was dropped, came stale or
+      failed, the time it was busy and the capture-to-output latency, and
+      Runtime.report() prints or publishes them all
+
+CaptureStage takes frames from any source the scripts have: one with a
+BroadcastSlot (Camera, BucketCapture), one with new_frame/read_stamped
+(Cv2Capture and the other 2019 sources) or a cv2.VideoCapture. ProcessStage
+hosts any pipeline object, calling FindTarget(image) if it has one and
+process(image) otherwise, on the workers of the 2019 ProcessorPool (frames
+to idle workers, results in frame order, stale frames expired); given a
+class (or any factory) instead of an object it runs one pipeline per
+worker, and can have a PoolSizer size the pool at run time. Frames are
+shared between stages, not copied, except once for pipelines that draw on
+their input. OutputStage hands frames to any number of readers (a server,
+a display) through a BroadcastSlot. A threadSetup callable given to the
+Runtime runs on every stage thread with the stage's role ('capture',
+'processing' or 'streaming'), which is where a scheduling policy such as
+the 2019 pipeline's apply_policy plugs in.
+
+main.py, facedetector.py and the 2019 launcher (BucketVision_AngryEyes_2019.py)
+run on it; NetworkTables, cscore and the camera and source objects are set
+up by the scripts themselves.
+
+python runtime.py -s video.avi -p smokestack.SmokeStack -w 2 runs a
+pipeline over a camera or video file and prints the statistics every second
+(-a lets the pool size itself).
+'''
+
+import os
+import sys
+import time
+import traceback
+from collections import deque
+from threading import Thread, Condition, Lock
+
+import numpy
+
+from cubbyhole import BroadcastSlot
+
+# The worker pool and its sizer are the 2019 pipeline's; appended, so the
+# 2019 copies of modules that also exist up here do not shadow these ones
+POOL_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '2019 Pipeline')
+if (POOL_DIR not in sys.path):
+    sys.path.append(POOL_DIR)
+
+from processorpool import ProcessorPool
+from poolsizer import PoolSizer
+
+POLICIES = ('drop', 'block')
+
+
+class Frame:
+    """One captured image on its way through the stages"""
+    __slots__ = ('seq', 'time', 'image', 'results')
+
+    def __init__(self, seq, image, captureTime=None):
+        self.seq = seq
+        self.time = time.time() if captureTime is None else captureTime
+        self.image = image
+        self.results = None
+
+
+class StageQueue:
+    """
+    Bounded FIFO between two stages
+    """
+
+    def __init__(self, depth=2, policy='drop'):
+        """initializes all values to presets or None if need to be set"""
+        if (policy not in POLICIES):
+            raise ValueError("Unknown queue policy %s" % policy)
+        self.depth = depth
+        self.policy = policy
+        self.cond = Condition()
+        self.items = deque()
+        self.closed = False
+        self.dropped = 0        # frames pushed out by newer ones ('drop')
+        self.blocked = 0.0      # seconds put() waited for room ('block')
+
+    def __len__(self):
+        return len(self.items)
+
+    def put(self, frame):
+        """Queues frame; False if the queue was closed first"""
+        with self.cond:
+            if (self.policy == 'block'):
+                start = time.time()
+                while ((len(self.items) >= self.depth) and not self.closed):
+                    self.cond.wait(0.1)
+                self.blocked += time.time() - start
+            elif (len(self.items) >= self.depth):
+                self.items.popleft()
+                self.dropped += 1
+            if self.closed:
+                return False
+            self.items.append(frame)
+            self.cond.notify_all()
+            return True
+
+    def get(self, timeout=None):
+        """Oldest queued frame, or None after timeout seconds or once closed"""
+        with self.cond:
+            if ((len(self.items) == 0) and not self.closed):
+                self.cond.wait(timeout)
+            if ((len(self.items) == 0) or self.closed):
+                return None
+            frame = self.items.popleft()
+            self.cond.notify_all()
+            return frame
+
+    def close(self):
+        with self.cond:
+            self.closed = True
+            self.items.clear()
+            self.cond.notify_all()
+
+
+class Stage:
+    """
+    A step of the brigade: handle(frame) on workers threads
+
+    Subclasses override handle(), returning the frame (or another one) to
+    pass on, or None to pass nothing on. A stage without an input queue
+    (a CaptureStage) calls handle(None) in a loop instead.
+    """
+
+    role = 'other'
+
+    def __init__(self, name, workers=1, depth=2, policy='drop'):
+        """initializes all values to presets or None if need to be set
+
+        depth and policy are those of the queue in front of this stage
+        """
+        self.name = name
+        self.workers = workers
+        self.input = StageQueue(depth, policy)
+        self.next = None
+        self.threadSetup = None
+
+        self.lock = Lock()
+        self.lastSeq = -1
+        self.threads = []
+        self.stopped = True
+
+        # Statistics
+        self.received = 0
+        self.passed = 0
+        self.stale = 0
+        self.failed = 0
+        self.busy = 0.0
+        self.latency = 0.0
+        self.startTime = None
+
+    def connect(self, stage):
+        """Sends what this stage passes on to stage; returns stage"""
+        self.next = stage
+        return stage
+
+    def handle(self, frame):
+        return frame
+
+    def emit(self, frame):
+        """Passes frame on unless a newer one already went"""
+        with self.lock:
+            if (frame.seq <= self.lastSeq):
+                self.stale += 1
+                return
+            self.lastSeq = frame.seq
+            self.passed += 1
+            self.latency = time.time() - frame.time
+        if (self.next is not None):
+            self.next.input.put(frame)
+
+    def step(self, frame):
+        """handle()s one frame, timing it and counting what came of it"""
+        start = time.time()
+        try:
+            out = self.handle(frame)
+        except Exception:
+            traceback.print_exc()
+            with self.lock:
+                self.failed += 1
+            return
+        finally:
+            with self.lock:
+                self.busy += time.time() - start
+        if (out is not None):
+            self.emit(out)
+
+    def run(self, index):
+        if (self.threadSetup is not None):
+            self.threadSetup(self.role)
+        while not self.stopped:
+            frame = self.input.get(0.1)
+            if (frame is None):
+                continue
+            with self.lock:
+                self.received += 1
+            self.step(frame)
+
+    def start(self):
+        self.stopped = False
+        self.startTime = time.time()
+        for i in range(self.workers):
+            t = Thread(target=self.run, args=(i,), name="%s-%d" % (self.name, i))
+            t.daemon = True
+            self.threads.append(t)
+            t.start()
+        return self
+
+    def stop(self):
+        self.stopped = True
+        self.input.close()
+
+    def join(self, timeout=None):
+        for t in self.threads:
+            t.join(timeout)
+
+    def stats(self):
+        elapsed = max(time.time() - self.startTime, 1e-6) if self.startTime is not None else 0.0
+        with self.lock:
+            return {
+                'received': self.received,
+                'passed': self.passed,
+                'dropped': self.input.dropped,
+                'stale': self.stale,
+                'failed': self.failed,
+                'queued': len(self.input),
+                'blocked': self.input.blocked,
+                'fps': self.passed / elapsed if elapsed > 0 else 0.0,
+                'utilization': self.busy / (elapsed * max(self.workers, 1)) if elapsed > 0 else 0.0,
+                'latency': self.latency
+            }
+
+
+class CaptureStage(Stage):
+    """
+    Numbers and stamps the frames of a source
+    """
+
+    role = 'capture'
+
+    def __init__(self, source, name='Capture'):
+        """initializes all values to presets or None if need to be set
+
+        source is anything with a BroadcastSlot as slot, with new_frame and
+        read_stamped (or frame), or with read() -> (grabbed, image)
+        """
+        Stage.__init__(self, name)
+        self.source = source
+        self.seq = 0
+        self.sourceSeq = 0
+        self.lost = 0       # read() calls that grabbed nothing
+
+    def grab(self):
+        """(image, capture time) of the next frame, (None, None) if none came"""
+        source = self.source
+        slot = getattr(source, 'slot', None)
+        if isinstance(slot, BroadcastSlot):
+            seq, image = slot.get(self.sourceSeq, 0.1)
+            if (seq == self.sourceSeq):
+                return (None, None)
+            self.sourceSeq = seq
+            return (image, None)
+        if hasattr(source, 'new_frame'):
+            if not source.new_frame:
+                time.sleep(0.001)
+                return (None, None)
+            if hasattr(source, 'read_stamped'):
+                image, stamp = source.read_stamped()
+                # stamps are time.monotonic(); frames carry wall time
+                if (stamp is not None):
+                    return (image, time.time() - (time.monotonic() - stamp))
+                return (image, None)
+            return (source.frame, None)
+        (grabbed, image) = source.read()
+        if not grabbed:
+            self.lost += 1
+            time.sleep(0.01)
+            return (None, None)
+        return (image, None)
+
+    def handle(self, frame):
+        image, captureTime = self.grab()
+        if (image is None):
+            return None
+        self.seq += 1
+        with self.lock:
+            self.received += 1
+        return Frame(self.seq, image, captureTime)
+
+    def run(self, index):
+        if (self.threadSetup is not None):
+            self.threadSetup(self.role)
+        while not self.stopped:
+            self.step(None)
+
+    def stats(self):
+        stats = Stage.stats(self)
+        # its busy time is mostly waiting for the camera
+        del stats['utilization']
+        stats['lost'] = self.lost
+        stats['dropped'] = getattr(self.source, 'dropped', 0)
+        return stats
+
+
+class ProcessStage(Stage):
+    """
+    Runs a pipeline (FindTarget() or process()) on every frame it can
+
+    The frames are handed to the workers of a ProcessorPool (2019
+    Pipeline/processorpool.py): each frame to one idle worker, results
+    passed on in frame order through the pool's reorder buffer, and a frame
+    older than maxAge seconds when a worker frees up expired instead of
+    processed. With adaptive a PoolSizer grows and shrinks the pool between
+    minWorkers and maxWorkers to what the frames cost.
+    """
+
+    role = 'processing'
+
+    def __init__(self, pipeline, name=None, workers=1, depth=2, policy='drop', copy=True,
+                 call=None, maxAge=None, adaptive=False, minWorkers=1, maxWorkers=None,
+                 networkTable=None):
+        """initializes all values to presets or None if need to be set
+
+        pipeline is a pipeline object, or a class or factory that makes one
+        per worker (a pipeline keeps state between frames, so workers
+        cannot share one); more than one worker, or adaptive, needs the
+        latter. call(pipeline, image), if given, is run instead of
+        FindTarget()/process(). copy gives the pipeline its own copy of
+        each image to draw on; without it the pipeline must not change the
+        image. networkTable, if given, gets the PoolSizer's numbers.
+        """
+        # a class, or any callable that is not itself a pipeline, is a factory
+        factory = isinstance(pipeline, type) or (callable(pipeline) and not self.isPipeline(pipeline))
+        if (((workers > 1) or adaptive) and not factory):
+            raise ValueError("%d workers need a pipeline class or factory, one pipeline each" % workers)
+        Stage.__init__(self, name, workers, depth, policy)
+        self.copy = copy
+        self.callPipeline = call if call is not None else self.call
+        self.buffers = {}       # id(pipeline) -> [reused images, next one]
+
+        # a single pipeline is kept here, where setPipeline() can swap it,
+        # and its worker is handed None for it
+        self.pipeline = None if factory else pipeline
+        self.pool = ProcessorPool(self, num_workers=workers, max_age=maxAge,
+                                  pipeline=pipeline if factory else (lambda: None),
+                                  process=self.processFrame, callback=self.published,
+                                  thread_setup=self.setupThread)
+        self.sizer = None
+        if adaptive:
+            self.sizer = PoolSizer(self.pool, network_table=networkTable,
+                                   min_workers=minWorkers, max_workers=maxWorkers)
+
+        for p in self.pipelines:
+            if not self.isPipeline(p):
+                raise ValueError("%r has neither FindTarget() nor process()" % (p,))
+        if (self.name is None):
+            first = self.pipelines[0] if (len(self.pipelines) > 0) else pipeline
+            self.name = getattr(first, 'name', getattr(first, '__name__', type(first).__name__))
+
+    @property
+    def pipelines(self):
+        if (self.pipeline is not None):
+            return [self.pipeline]
+        return [worker.processor for worker in list(self.pool.workers)]
+
+    def setPipeline(self, pipeline):
+        """Runs pipeline instead from the next frame on (single pipeline only)"""
+        if (self.pipeline is None):
+            raise ValueError("%s has a pipeline per worker" % self.name)
+        if not self.isPipeline(pipeline):
+            raise ValueError("%r has neither FindTarget() nor process()" % (pipeline,))
+        self.pipeline = pipeline
+
+    @staticmethod
+    def isPipeline(obj):
+        return hasattr(obj, 'FindTarget') or hasattr(obj, 'process')
+
+    @staticmethod
+    def call(pipeline, image):
+        if hasattr(pipeline, 'FindTarget'):
+            return pipeline.FindTarget(image)
+        return pipeline.process(image)
+
+    # The pool takes its frames from the input queue as from any source
+    @property
+    def new_frame(self):
+        return len(self.input) > 0
+
+    def read_stamped(self):
+        frame = self.input.get(0)
+        if (frame is None):
+            return (None, None)
+        with self.lock:
+            self.received += 1
+        # the pool stamps with time.monotonic(); frames carry wall time
+        return (frame, time.monotonic() - (time.time() - frame.time))
+
+    @property
+    def dropped(self):
+        return self.input.dropped
+
+    def setupThread(self, role):
+        if (self.threadSetup is not None):
+            self.threadSetup(role)
+
+    def ownCopy(self, pipeline, image):
+        """image copied into one of the pipeline's reused images; there are
+        enough of them for every frame that can be downstream at once (the
+        next queue full, one being handled and one published). With more
+        than one worker a finished frame can wait in the reorder buffer
+        while its worker moves on, for as many frames as it finishes in the
+        meantime, so pooled workers get a new copy instead."""
+        if ((len(self.pool.workers) > 1) or (self.sizer is not None)):
+            return image.copy()
+        count = (self.next.input.depth if self.next is not None else 0) + 3
+        (buffers, i) = self.buffers.setdefault(id(pipeline), [[None] * count, 0])
+        self.buffers[id(pipeline)][1] = (i + 1) % count
+        out = buffers[i]
+        if ((out is None) or (out.shape != image.shape) or (out.dtype != image.dtype)):
+            out = numpy.empty_like(image)
+            buffers[i] = out
+        numpy.copyto(out, image)
+        return out
+
+    def processFrame(self, pipeline, frame):
+        """Runs on a pool worker with its pipeline (None: the stage's own)"""
+        if (pipeline is None):
+            pipeline = self.pipeline
+        image = self.ownCopy(pipeline, frame.image) if self.copy else frame.image
+        out = Frame(frame.seq, image, frame.time)
+        out.results = self.callPipeline(pipeline, image)
+        return out
+
+    def published(self, seq, frame, out, latency):
+        """Pool callback: out is what processFrame() made of frame"""
+        self.emit(out)
+
+    def start(self):
+        self.stopped = False
+        self.startTime = time.time()
+        self.pool.start()
+        if (self.sizer is not None):
+            self.sizer.start()
+        return self
+
+    def stop(self):
+        Stage.stop(self)
+        if (self.sizer is not None):
+            self.sizer.stop()
+        self.pool.stop()
+
+    def join(self, timeout=None):
+        threads = [self.pool] + list(self.pool.workers)
+        if (self.sizer is not None):
+            threads.append(self.sizer)
+        for t in threads:
+            if (t.ident is not None):
+                t.join(timeout)
+
+    def stats(self):
+        stats = Stage.stats(self)
+        pool = self.pool.stats()
+        elapsed = max(time.time() - self.startTime, 1e-6) if self.startTime is not None else 0.0
+        stats['utilization'] = self.pool.busy_time / (elapsed * max(pool['workers'], 1)) if elapsed > 0 else 0.0
+        stats['failed'] = pool['failed']
+        stats['stale'] += pool['stale']
+        for key in ('workers', 'skipped', 'expired', 'superseded'):
+            stats[key] = pool[key]
+        return stats
+
+
+class OutputStage(Stage):
+    """
+    Hands frames to any number of readers through a BroadcastSlot
+
+    callback, if given, is called with every frame first (to publish
+    results to NetworkTables, say). Readers keep the seq they last saw:
+    (seq, frame) = stage.read(seq)
+    """
+
+    role = 'streaming'
+
+    def __init__(self, name='Output', callback=None, depth=1, policy='drop'):
+        """initializes all values to presets or None if need to be set"""
+        Stage.__init__(self, name, 1, depth, policy)
+        self.callback = callback
+        self.slot = BroadcastSlot()
+
+    def handle(self, frame):
+        if (self.callback is not None):
+            self.callback(frame)
+        self.slot.put(frame)
+        return frame
+
+    def read(self, after=0, timeout=None):
+        return self.slot.get(after, timeout)
+
+    def stop(self):
+        Stage.stop(self)
+        self.slot.close()
+
+
+class Runtime:
+    """
+    Stages chained in the order given, started and stopped together
+    """
+
+    def __init__(self, *stages, **options):
+        """initializes all values to presets or None if need to be set
+
+        options: threadSetup, called with the role of every stage thread
+        as it starts
+        """
+        self.stages = list(stages)
+        threadSetup = options.get('threadSetup')
+        for i, stage in enumerate(self.stages):
+            stage.threadSetup = threadSetup
+            if (i + 1 < len(self.stages)):
+                stage.connect(self.stages[i + 1])
+
+    def __getitem__(self, name):
+        for stage in self.stages:
+            if (stage.name == name):
+                return stage
+        raise KeyError(name)
+
+    def start(self):
+        # outputs first, so nothing is passed to a stage not yet running
+        for stage in reversed(self.stages):
+            stage.start()
+        return self
+
+    def stop(self, timeout=1.0):
+        for stage in self.stages:
+            stage.stop()
+        for stage in self.stages:
+            stage.join(timeout)
+
+    def stats(self):
+        return [(stage.name, stage.stats()) for stage in self.stages]
+
+    def report(self, table=None):
+        """Prints the statistics of every stage, or puts them to table
+        as <stage><Stat> (e.g. SmokeStackFps)"""
+        for (name, stats) in self.stats():
+            if (table is not None):
+                for key, value in stats.items():
+                    table.putNumber(name + key.capitalize(), value)
+            else:
+                print("%-12s %s" % (name, "  ".join("%s %.3g" % (key, value) for key, value in stats.items())))
+
+
+if __name__ == '__main__':
+    import argparse
+    import importlib
+    import cv2
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-s', '--source', default='0', help='camera index or video file')
+    parser.add_argument('-p', '--pipeline', default='nada.Nada', help='module.Class of the pipeline')
+    parser.add_argument('-w', '--workers', type=int, default=1, help='pipeline workers')
+    parser.add_argument('-a', '--adaptive', action='store_true', help='grow and shrink the workers at run time')
+    parser.add_argument('-t', '--seconds', type=float, default=10.0, help='how long to run')
+    args = parser.parse_args()
+
+    moduleName, className = args.pipeline.rsplit('.', 1)
+    pipelineClass = getattr(importlib.import_module(moduleName), className)
+    stream = cv2.VideoCapture(int(args.source) if args.source.isdigit() else args.source)
+
+    runtime = Runtime(CaptureStage(stream),
+                      ProcessStage(pipelineClass, workers=args.workers, adaptive=args.adaptive),
+                      OutputStage())
+    runtime.start()
+    end = time.time() + args.seconds
+    while time.time() < end:
+        time.sleep(1.0)
+        runtime.report()
+        print('')
+    runtime.stop()
@@ -52,9 +52,12 @@ class HTTPHandler(BaseHTTPRequestHandler):
             self.send_header('Content-type', 'multipart/x-mixed-replace; boundary=--jpgboundary')
             self.end_headers()
             
+            # Each connection follows the source on its own, from the last
+            # frame it sent
+            seq = 0
             while True:
                 
-                buf = self.jpgSource.get()
+                (seq, buf) = self.jpgSource.get(seq)
                                               
                 self.wfile.write("--jpgboundary\r\n")
                 self.send_header('Content-type', 'image/jpeg')
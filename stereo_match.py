@@ -2,7 +2,7 @@
 
 '''
 Simple example of stereo image matching and point cloud generation.
-Resulting .ply file cam be easily viewed using MeshLab ( http://meshlab.sourceforge.net/ )
+Resulting binary .ply file (see plywriter) can be easily viewed using MeshLab ( http://meshlab.sourceforge.net/ )
 '''
 
 # Python 2/3 compatibility
@@ -12,25 +12,7 @@ import numpy as np
 import cv2 as cv
 import time
 
-ply_header = '''ply
-format ascii 1.0
-element vertex %(vert_num)d
-property float x
-property float y
-property float z
-property uchar red
-property uchar green
-property uchar blue
-end_header
-'''
-
-def write_ply(fn, verts, colors):
-    verts = verts.reshape(-1, 3)
-    colors = colors.reshape(-1, 3)
-    verts = np.hstack([verts, colors])
-    with open(fn, 'wb') as f:
-        f.write((ply_header % dict(vert_num=len(verts))).encode('utf-8'))
-        np.savetxt(f, verts, fmt='%f %f %f %d %d %d ')
+from plywriter import write_ply
 
 
 if __name__ == '__main__':
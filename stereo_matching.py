@@ -5,15 +5,25 @@ import matplotlib.cm as cm
 import numpy as np
 import sys, os, time, pickle
 
+from boxstats import masked_box_stats
+
 DATA = './data/'
 # window size
 N = 4
 DMAX = 8
+# cost volume tiles are kept under this many bytes
+MAX_VOLUME_BYTES = 64*1024*1024
 
 # calculate means of windows of size n and take average, then normalize
 # use means to calculate and save variances for later use
 # returns normalized image and variances
 def pre_proc(im):
+    # integral image box sums, same result as pre_proc_reference
+    (means, variances) = masked_box_stats(im, N)
+    return (im-means,variances)
+
+# original sliding window version of pre_proc, kept for the benchmark
+def pre_proc_reference(im):
     means = np.zeros(im.shape)
     variances = np.zeros(im.shape)
     for i in range(im.shape[0]):
@@ -51,7 +61,93 @@ def pre_proc(im):
 
     return (im-means,variances)
 
+# same result as match_reference, computed a tile of rows at a time from an
+# H x W x DMAX absolute difference cost volume
+# (matches must come in as all -1, as main makes it)
 def match(left, right, matches, vars):
+    disparity = np.zeros(left.shape)
+    height = left.shape[0]
+    width = left.shape[1]-DMAX
+    if width <= 0:
+        return (matches, disparity)
+
+    tile = max(1, int(MAX_VOLUME_BYTES // (width*DMAX*8)))
+    for r0 in range(0, height, tile):
+        r1 = min(height, r0+tile)
+        match_tile(left, right, matches, vars, disparity, r0, r1)
+
+    return (matches, disparity)
+
+def match_tile(left, right, matches, vars, disparity, r0, r1):
+    width = left.shape[1]-DMAX
+    rows = r1-r0
+    l = left[r0:r1,:width]
+
+    # cost volume, NaN scores never win (same as the < comparisons below)
+    volume = np.empty((rows, width, DMAX))
+    for d in range(DMAX):
+        volume[:,:,d] = np.abs(right[r0:r1,d:d+width] - l)
+    volume[np.isnan(volume)] = np.inf
+
+    # best is the first minimum
+    dbest = np.argmin(volume, axis=2)
+    best = np.take_along_axis(volume, dbest[:,:,None], axis=2)[:,:,0]
+
+    # replay the 4 entry sorted mins table of match_reference for every
+    # pixel at once: a score below the 4th goes in at the first larger
+    # entry, that entry moves to the 4th slot, then the table is re-sorted
+    mins_d = np.zeros((rows, width, 4))
+    mins_s = np.full((rows, width, 4), np.inf)
+    slots = np.arange(4)
+    for d in range(DMAX):
+        score = volume[:,:,d]
+        insert = score < mins_s[:,:,3]
+        if not insert.any():
+            continue
+        i = np.argmax(score[:,:,None] < mins_s, axis=2)
+        displaced_d = np.take_along_axis(mins_d, i[:,:,None], axis=2)
+        displaced_s = np.take_along_axis(mins_s, i[:,:,None], axis=2)
+        at_i = (slots == i[:,:,None]) & insert[:,:,None]
+        at_3 = (slots == 3) & insert[:,:,None] & (i[:,:,None] != 3)
+        mins_d = np.where(at_i, d, np.where(at_3, displaced_d, mins_d))
+        mins_s = np.where(at_i, score[:,:,None], np.where(at_3, displaced_s, mins_s))
+        order = np.argsort(mins_s, axis=2, kind='stable')
+        mins_d = np.take_along_axis(mins_d, order, axis=2)
+        mins_s = np.take_along_axis(mins_s, order, axis=2)
+
+    # ambiguity test
+    dd = np.sum(np.abs(mins_d[:,:,1:4] - mins_d[:,:,0:1]), axis=2)
+    # with fewer than 4 disparities (or no finite score) unfilled entries
+    # are inf and inf - inf is NaN; a NaN ratio is never ambiguous, as in
+    # match_reference, and such pixels keep their integer disparity
+    with np.errstate(divide='ignore', invalid='ignore'):
+        de = np.sum(mins_s[:,:,1:4] - mins_s[:,:,0:1], axis=2)
+        ratio = np.where(mins_s[:,:,0] == 0, np.inf, de/mins_s[:,:,0])
+    ambiguous = (dd > 8) & (ratio < 5)
+
+    processed = vars[r0:r1,:width] > 1250
+    candidate = processed & ~ambiguous & (best < np.inf)
+
+    # uniqueness: of the pixels in a row that pick the same R pixel only the
+    # lowest score survives, ties going to the rightmost (the survivor of
+    # match_reference's rescans of all previous columns)
+    r, c = np.nonzero(candidate)
+    target = c + dbest[r,c]
+    order = np.lexsort((-c, best[r,c], target, r))
+    r, c, target = r[order], c[order], target[order]
+    first = np.ones(len(r), dtype=bool)
+    first[1:] = (r[1:] != r[:-1]) | (target[1:] != target[:-1])
+
+    # processed pixels that are not winners end up unmatched
+    pr, pc = np.nonzero(processed)
+    matches[r0+pr,pc] = -1
+    wr, wc, wt = r[first], c[first], target[first]
+    matches[r0+wr,wc,0] = r0+wr
+    matches[r0+wr,wc,1] = wt
+    disparity[r0+wr,wc] = wt - wc
+
+# original per pixel version of match, kept for the benchmark
+def match_reference(left, right, matches, vars):
     disparity = np.zeros(left.shape)
     def score_fcn(l,r):
         return np.abs(r - l)
@@ -106,7 +202,59 @@ def match(left, right, matches, vars):
 
     return (matches, disparity)
 
+# time pre_proc against pre_proc_reference on the bundled leftPic/rightPic
+# the reference takes minutes on the full images, so it only gets the top rows
+def bench(rows=48):
+    for name in ('leftPic.jpg', 'rightPic.jpg'):
+        im = np.array(Image.open(name).convert('L'))
+
+        start = time.time()
+        (norm, variances) = pre_proc(im)
+        fast = time.time() - start
+
+        strip = im[:rows]
+        start = time.time()
+        (ref_norm, ref_variances) = pre_proc_reference(strip)
+        slow = time.time() - start
+
+        # rows within N of the strip edge see different windows in the strip
+        (norm_strip, variances_strip) = pre_proc(strip)
+        same = (np.allclose(norm_strip, ref_norm, equal_nan=True) and
+                np.allclose(variances_strip, ref_variances, equal_nan=True))
+
+        print("%s %dx%d: integral %.3fs full image, reference %.3fs for %d rows "
+              "(~%.0fs full image), match=%s" %
+              (name, im.shape[1], im.shape[0], fast, slow, rows,
+               slow * im.shape[0] / rows, same))
+
+    im0 = np.array(Image.open('leftPic.jpg').convert('L'))
+    im1 = np.array(Image.open('rightPic.jpg').convert('L'))
+    height = min(im0.shape[0], im1.shape[0])
+    width = min(im0.shape[1], im1.shape[1])
+    (im0, im0vars) = pre_proc(im0[:height,:width])
+    (im1, im1vars) = pre_proc(im1[:height,:width])
+
+    start = time.time()
+    matches = np.negative(np.ones((height,width,2), dtype=int))
+    (matches, disparity) = match(im0, im1, matches, im0vars)
+    fast = time.time() - start
+
+    start = time.time()
+    ref_matches = np.negative(np.ones((rows,width,2), dtype=int))
+    (ref_matches, ref_disparity) = match_reference(im0[:rows], im1[:rows], ref_matches, im0vars[:rows])
+    slow = time.time() - start
+
+    same = (np.array_equal(matches[:rows], ref_matches) and
+            np.array_equal(disparity[:rows], ref_disparity))
+    print("match %dx%d: cost volume %.3fs full image, reference %.3fs for %d rows "
+          "(~%.0fs full image), match=%s" %
+          (width, height, fast, slow, rows, slow * height / rows, same))
+
 def main(cmd):
+    if cmd == 'bench':
+        bench()
+        return
+
     # load and normalize ims
     if cmd == 'map':
         im0 = np.array(Image.open(DATA+'map/im0.pgm').convert('L'))
@@ -145,7 +293,7 @@ def main(cmd):
     # match im0 to im1
     # make array to hold matches with all entries = -1
     # (since this will be array of coordinates, val of -1 means uninitialized)
-    matches = np.negative(np.ones((im0.shape[0],im0.shape[1],2), dtype=np.int))
+    matches = np.negative(np.ones((im0.shape[0],im0.shape[1],2), dtype=int))
     (matches,disparity) = match(im0, im1, matches, im0vars)
     matching_done = time.time()
     print("Matching took:", matching_done - norm_done)
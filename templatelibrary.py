@@ -0,0 +1,192 @@
+'''
+templatelibrary
+
+An indexed library of labelled reference images (e.g., redBoiler/redBoiler8ftLeft.jpg)
+searched with a single FLANN index.
+
+Every reference is described once, all descriptors are stacked into one
+index, and each descriptor remembers which reference it came from. A frame
+is matched once, the matches vote for references, and the references are
+verified with a homography in vote order until one is accepted (early exit).
+The winner gives both the homography and the nearest-distance label, so the
+distance estimate costs little more than a single training image match.
+
+The verifier's budget (one capture period) starts when find() gets the
+frame, so detection and matching come out of it too; detectSize and
+maxFeatures keep them to a fraction of the period.
+'''
+import os
+import re
+
+import cv2
+import numpy as np
+
+from featurematcher import FeatureMatcher, isFresh
+from homographyverifier import HomographyVerifier
+
+# redBoiler8ftLeft.jpg -> (8, 'Left')
+LABEL_PATTERN = re.compile(r'(\d+)ft(Left|Mid|Right)', re.IGNORECASE)
+
+FEET_TO_METERS = 0.3048
+
+
+class TemplateLibrary(FeatureMatcher):
+    """
+    FeatureMatcher over many labelled references instead of one training image
+    """
+
+    def __init__(self, detector='surf', ratio=0.7, checks=50, cacheDir=None,
+                 minMatchCount=10, minInliers=8, detectSize=None, maxFeatures=None):
+        """initializes all values to presets or None if need to be set
+        """
+        FeatureMatcher.__init__(self, detector, ratio, checks, cacheDir, detectSize, maxFeatures)
+        self.MIN_MATCH_COUNT = minMatchCount
+        self.MIN_INLIERS = minInliers
+
+        self.names = []             # reference file names (no directory)
+        self.distances = None       # label distance in feet, per reference
+        self.sides = []             # 'Left', 'Mid' or 'Right', per reference
+        self.shapes = None          # (h, w) per reference
+        self.templateIds = None     # reference index per stacked descriptor
+
+        # Shared budget for all references tried on one frame
+        self.verifier = HomographyVerifier()
+
+    def train(self, directory):
+        """Loads (or computes and persists) every labelled reference in directory
+        """
+        images = sorted(f for f in os.listdir(directory) if LABEL_PATTERN.search(f) and f.endswith('.jpg'))
+        paths = [os.path.join(directory, f) for f in images]
+        if (len(paths) == 0):
+            raise IOError("No labelled reference images in " + directory)
+
+        libraryName = os.path.join(directory, os.path.basename(os.path.normpath(directory)) + "Library")
+        featurePath = self.cachePath(libraryName, ".npz")
+        indexPath = self.cachePath(libraryName, ".flann")
+
+        # Only the reference files count: the directory itself changes
+        # whenever the index is saved into it. A reference added or removed
+        # shows in the list of file names the cache was built from.
+        data = np.load(featurePath) if isFresh(featurePath, paths) else None
+        if ((data is not None) and ('sources' in data.files) and
+                ([str(n) for n in data['sources']] == images)):
+            self.keypoints = data['keypoints']
+            self.descriptors = data['descriptors']
+            self.templateIds = data['templateIds']
+            self.shapes = data['shapes']
+            self.names = [str(n) for n in data['names']]
+        else:
+            keypoints = []
+            descriptors = []
+            templateIds = []
+            shapes = []
+            self.names = []
+            for path in paths:
+                image = cv2.imread(path, cv2.IMREAD_GRAYSCALE)
+                if (image is None):
+                    print("Skipping unreadable reference " + path)
+                    continue
+                kp, des = self.detect(image)
+                if ((des is None) or (len(des) == 0)):
+                    continue
+                keypoints.append(kp)
+                descriptors.append(des)
+                templateIds.append(np.full(len(kp), len(self.names), dtype=np.int32))
+                shapes.append(image.shape[0:2])
+                self.names.append(os.path.basename(path))
+
+            if (len(keypoints) == 0):
+                raise ValueError("No readable reference with " + self.detectorName + " features in " + directory)
+            self.keypoints = np.vstack(keypoints)
+            self.descriptors = np.vstack(descriptors)
+            self.templateIds = np.concatenate(templateIds)
+            self.shapes = np.array(shapes, dtype=np.int32)
+            np.savez(featurePath,
+                     keypoints=self.keypoints,
+                     descriptors=self.descriptors,
+                     templateIds=self.templateIds,
+                     shapes=self.shapes,
+                     names=np.array(self.names),
+                     sources=np.array(images))
+
+        labels = [LABEL_PATTERN.search(n).groups() for n in self.names]
+        self.distances = np.array([float(d) for (d, s) in labels])
+        self.sides = [s.capitalize() for (d, s) in labels]
+
+        self.loadIndex(indexPath, featurePath)
+        return self
+
+    def label(self, template):
+        """Returns the human readable label of a reference, e.g. '8ft Left'
+        """
+        return "{:g}ft {}".format(self.distances[template], self.sides[template])
+
+    def find(self, image):
+        """Matches a grayscale frame against the whole library
+
+        Returns (template, M, mask, goodCount) for the first reference (in
+        vote order) whose homography has at least MIN_INLIERS inliers, or None
+        if there is none within the verifier's budget, which starts here and
+        so covers detection and matching as well
+        """
+        self.verifier.startFrame()
+
+        # match() directly, for the training indices that say which
+        # reference each match belongs to
+        kp2, des2 = self.detectFrame(image)
+        trainIdx, queryIdx, distance = self.match(des2)
+        if (len(distance) <= self.MIN_MATCH_COUNT):
+            return None
+        src_pts = self.keypoints[trainIdx, 0:2].reshape(-1,1,2)
+        dst_pts = kp2[queryIdx, 0:2].reshape(-1,1,2)
+
+        # Matches come back sorted by distance, so each per-reference subset
+        # below stays in best-first order
+        matchIds = self.templateIds[trainIdx]
+        votes = np.bincount(matchIds, minlength=len(self.names))
+        for template in np.argsort(-votes, kind='mergesort'):
+            goodCount = votes[template]
+            if (goodCount <= self.MIN_MATCH_COUNT):
+                break   # votes are sorted, nobody after this can qualify
+            subset = (matchIds == template)
+            M, mask = self.verifier.verify(src_pts[subset], dst_pts[subset], key=template)
+            if ((M is not None) and (mask is not None) and (mask.sum() >= self.MIN_INLIERS)):
+                return (template, M, mask, goodCount)
+        return None
+
+
+def selfTest(directory='redBoiler', detector='sift', detectSize=240, maxFeatures=200):
+    """Runs a frame made from one of the references (shifted, scaled and
+    noisy) through find() with the verifier budget in force and checks that
+    the reference and a homography come back
+    """
+    import shutil
+    import tempfile
+    import time
+    cacheDir = tempfile.mkdtemp()
+    try:
+        library = TemplateLibrary(detector, cacheDir=cacheDir,
+                                  detectSize=detectSize, maxFeatures=maxFeatures).train(directory)
+        template = library.names.index(max(library.names))
+        reference = cv2.imread(os.path.join(directory, library.names[template]), cv2.IMREAD_GRAYSCALE)
+        (h, w) = reference.shape
+        warp = np.float32([[0.9, 0.02, 0.05 * w], [-0.02, 0.9, 0.04 * h]])
+        frame = cv2.warpAffine(reference, warp, (w, h), borderMode=cv2.BORDER_REPLICATE)
+        frame = cv2.add(frame, np.random.RandomState(0).randint(0, 8, frame.shape).astype(np.uint8))
+
+        library.find(frame)     # warms up the detector
+        library.verifier.previous.clear()
+        start = time.time()
+        found = library.find(frame)
+        print("find() took %.1f ms of a %.1f ms budget" % (1000.0 * (time.time() - start),
+                                                        1000.0 * library.verifier.budget))
+        assert found is not None, "no homography within the budget"
+        (match, M, mask, goodCount) = found
+        print("matched %s with %d of %d inliers" % (library.names[match], mask.sum(), goodCount))
+        assert M is not None
+    finally:
+        shutil.rmtree(cacheDir)
+
+
+if __name__ == '__main__':
+    selfTest()
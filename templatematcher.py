@@ -0,0 +1,255 @@
+'''
+templatematcher
+
+Multi-scale edge template matching as a live pipeline
+
+match.py resizes and edge detects the whole frame at each of 20 scales and
+correlates the same template with each of them. Here the frame is only
+halved with pyrDown into octaves, each edge detected once and only if some
+scale uses it, while the template edge map is cached per scale, already
+shrunk by what is left between the scale and the octave below it. No scale
+costs more than it did in match.py and a frame needs a few Canny passes
+instead of 20. Scales are searched coarse to fine:
+
+    - every coarseStep-th scale (and the last one) over the whole octave
+    - then the scales next to each of the refineCount best coarse ones,
+      inside a window around that candidate's location
+
+and the search stops as soon as a score reaches threshold. Scores are
+TM_CCOEFF_NORMED, so they compare across template sizes and threshold is a
+correlation (0..1). Edge correlation drops off within a few percent of
+scale, so coarse samples have to stay close (coarseStep 2) and more than
+one coarse peak has to be followed.
+
+python templatematcher.py compares the search with an exhaustive one (every
+scale, whole frame) on synthetic scenes.
+'''
+import math
+
+import cv2
+import numpy as np
+
+
+class TemplateMatcher:
+    """
+    An OpenCV pipeline that finds a template at an unknown scale
+    """
+
+    def __init__(self, name='Template', template=None, scales=None,
+                 coarseStep=2, refineCount=5, threshold=0.5, searchMargin=0.5,
+                 cannyLow=50, cannyHigh=200):
+        """initializes all values to presets or None if need to be set
+
+        template is a BGR or gray image (or a file name); scales are the
+        frame scales at which the template is searched for, as in match.py
+        (the template looks 1/scale times larger in the frame)
+        """
+        self.name = name
+        if (scales is None):
+            scales = np.linspace(0.2, 1.0, 20)
+        self.scales = sorted(scales, reverse=True)
+        # octave (frame halved that many times) each scale is matched on
+        self.octaves = [max(0, int(math.ceil(-math.log(s, 2) - 1e-9))) for s in self.scales]
+        self.coarseStep = coarseStep
+        self.refineCount = refineCount          # coarse candidates refined
+        self.threshold = threshold
+        self.searchMargin = searchMargin        # fraction of template size
+        self.cannyLow = cannyLow
+        self.cannyHigh = cannyHigh
+
+        self.templates = []     # edge map per scale
+        if (template is not None):
+            self.setTemplate(template)
+
+        self._pyramid = []      # reused per-frame buffers: gray per octave
+        self._edges = []        # edges per octave
+        self._edgesValid = []   # edges computed for the current frame
+        self._built = 0         # pyramid levels built for the current frame
+        self._results = []      # matchTemplate output per scale, full octave size
+
+        self.found = None       # (score, (x,y,w,h), scale) of the last frame
+        self.evaluated = 0      # scales searched for the last frame
+
+    def setTemplate(self, template):
+        """Builds the cached edge map of the template at every scale"""
+        if (isinstance(template, str)):
+            template = cv2.imread(template)
+        if (template.ndim == 3):
+            template = cv2.cvtColor(template, cv2.COLOR_BGR2GRAY)
+        (tH, tW) = template.shape[:2]
+
+        self.templates = []
+        for scale, octave in zip(self.scales, self.octaves):
+            shrink = (0.5 ** octave) / scale
+            size = (max(1, int(round(tW * shrink))), max(1, int(round(tH * shrink))))
+            resized = cv2.resize(template, size, interpolation=cv2.INTER_AREA)
+            self.templates.append(cv2.Canny(resized, self.cannyLow, self.cannyHigh))
+
+    def setFrame(self, frame):
+        """Gray frame pyramid into the reused buffers; edges follow lazily"""
+        levels = max(self.octaves) + 1
+        (height, width) = frame.shape[:2]
+        if ((len(self._pyramid) != levels) or (self._pyramid[0].shape != (height, width))):
+            self._pyramid = []
+            self._edges = []
+            for octave in range(levels):
+                self._pyramid.append(np.empty((height, width), dtype=np.uint8))
+                self._edges.append(np.empty((height, width), dtype=np.uint8))
+                (height, width) = ((height + 1) // 2, (width + 1) // 2)
+
+        if (frame.ndim == 3):
+            cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY, dst=self._pyramid[0])
+        else:
+            self._pyramid[0][...] = frame
+        self._built = 1
+        self._edgesValid = [False] * levels
+
+    def edges(self, octave):
+        """Edges of the current frame halved octave times"""
+        while (self._built <= octave):
+            cv2.pyrDown(self._pyramid[self._built - 1], dst=self._pyramid[self._built])
+            self._built += 1
+        if (self._edgesValid[octave] == False):
+            cv2.Canny(self._pyramid[octave], self.cannyLow, self.cannyHigh, edges=self._edges[octave])
+            self._edgesValid[octave] = True
+        return self._edges[octave]
+
+    def matchScale(self, index, window=None):
+        """Best (score, (x,y,w,h)) of scale index in full frame pixels,
+        optionally only inside window (x0,y0,x1,y1, full frame pixels);
+        None if the template does not fit
+        """
+        template = self.templates[index]
+        octave = self.octaves[index]
+        factor = 2 ** octave
+        edges = self.edges(octave)
+        (tH, tW) = template.shape
+        (x0, y0) = (0, 0)
+        if (window is not None):
+            (x0, y0, x1, y1) = [v // factor for v in window]
+            edges = edges[y0:y1, x0:x1]
+        (h, w) = edges.shape
+        if ((h < tH) or (w < tW)):
+            return None
+
+        # windows come in every size, so each scale has one flat buffer big
+        # enough for its whole octave and a window's result is a contiguous
+        # view at its start
+        (fullH, fullW) = self._edges[octave].shape
+        size = (fullH - tH + 1) * (fullW - tW + 1)
+        if (len(self._results) != len(self.templates)):
+            self._results = [None] * len(self.templates)
+        buffer = self._results[index]
+        if ((buffer is None) or (len(buffer) != size)):
+            buffer = np.empty(size, dtype=np.float32)
+            self._results[index] = buffer
+        result = buffer[:(h - tH + 1) * (w - tW + 1)].reshape(h - tH + 1, w - tW + 1)
+        cv2.matchTemplate(edges, template, cv2.TM_CCOEFF_NORMED, result=result)
+        (_, maxVal, _, maxLoc) = cv2.minMaxLoc(result)
+        self.evaluated += 1
+        return (maxVal, ((x0 + maxLoc[0]) * factor, (y0 + maxLoc[1]) * factor, tW * factor, tH * factor))
+
+    def search(self, frame):
+        """Coarse to fine search; sets and returns found"""
+        self.setFrame(frame)
+        (height, width) = frame.shape[:2]
+        self.evaluated = 0
+        count = len(self.templates)
+        scores = {}             # index -> (score, box) of every scale tried
+
+        # Coarse pass over the whole frame; the smallest scale is always
+        # sampled too, so the end of the range is reachable coarsely
+        coarse = list(range(0, count, self.coarseStep))
+        if ((count > 0) and (coarse[-1] != count - 1)):
+            coarse.append(count - 1)
+        for index in coarse:
+            match = self.matchScale(index)
+            if (match is not None):
+                scores[index] = match
+                if (match[0] >= self.threshold):
+                    return self.setFound(scores)
+
+        # Edge correlation falls off fast between scales, so the best coarse
+        # score can belong to a wrong scale and place: refine the neighbouring
+        # scales of the refineCount best coarse candidates, each inside a
+        # window around its own location
+        candidates = sorted(scores, key=lambda i: -scores[i][0])[:self.refineCount]
+        for center in candidates:
+            (x, y, w, h) = scores[center][1]
+            (mx, my) = (int(self.searchMargin * w), int(self.searchMargin * h))
+            first = max(0, center - self.coarseStep + 1)
+            last = min(count, center + self.coarseStep)
+            for index in sorted(range(first, last), key=lambda i: abs(i - center)):
+                if (index in scores):
+                    continue
+                grow = self.scales[center] / self.scales[index]
+                window = (max(0, x - mx), max(0, y - my),
+                          min(width, x + int(w * grow) + mx), min(height, y + int(h * grow) + my))
+                match = self.matchScale(index, window)
+                if (match is not None):
+                    scores[index] = match
+                    if (match[0] >= self.threshold):
+                        return self.setFound(scores)
+        return self.setFound(scores)
+
+    def setFound(self, scores):
+        """found from the best of the scores searched"""
+        self.found = None
+        if (len(scores) > 0):
+            index = max(scores, key=lambda i: scores[i][0])
+            self.found = (scores[index][0], scores[index][1], self.scales[index])
+        return self.found
+
+    def process(self, source0):
+        """
+        Runs the pipeline and sets all outputs to new values.
+        """
+        self.search(source0)
+        if (self.found is not None):
+            (score, (x, y, w, h), _) = self.found
+            color = (0, 255, 0) if score >= self.threshold else (0, 0, 255)
+            cv2.rectangle(source0, (x, y), (x + w, y + h), color, 2)
+        return source0
+
+
+def bench(frames=40):
+    """Pastes a random edge template at a random size into clutter and looks
+    for it with the default search and with an exhaustive one (every scale,
+    whole frame); counts the frames where only the exhaustive one lands on it
+    """
+    import time
+    misses = 0
+    exhaustiveMisses = 0
+    times = [0.0, 0.0]
+    evaluated = [0, 0]
+    for seed in range(frames):
+        rng = np.random.RandomState(seed)
+        template = np.zeros((150, 150), dtype=np.uint8)
+        for _ in range(12):
+            cv2.circle(template, tuple(int(v) for v in rng.randint(0, 150, 2)), int(rng.randint(5, 40)), 255, 2)
+        frame = (rng.rand(800, 900) * 60).astype(np.uint8)
+        for _ in range(25):
+            cv2.circle(frame, (int(rng.randint(0, 900)), int(rng.randint(0, 800))), int(rng.randint(5, 50)), int(rng.randint(100, 255)), 2)
+        size = int(rng.randint(160, 700))
+        (x0, y0) = (100, 42)
+        roi = frame[y0:y0+size, x0:x0+size]
+        np.maximum(roi, cv2.resize(template, (size, size)), out=roi)
+
+        hits = []
+        for i, matcher in enumerate((TemplateMatcher(template=template),
+                                     TemplateMatcher(template=template, coarseStep=1, threshold=2.0))):
+            start = time.time()
+            (score, (x, y, w, h), scale) = matcher.search(frame)
+            times[i] += time.time() - start
+            evaluated[i] += matcher.evaluated
+            hits.append((abs(x - x0) <= 0.1 * size) and (abs(w - size) <= 0.15 * size))
+        if (hits[1] and not hits[0]):
+            misses += 1
+            print('frame %d: template at %d px missed' % (seed, size))
+        elif (not hits[1]):
+            exhaustiveMisses += 1
+    print('default    %6.1f ms %5.1f scales per frame, %d of %d missed' % (1000.0 * times[0] / frames, float(evaluated[0]) / frames, misses, frames))
+    print('exhaustive %6.1f ms %5.1f scales per frame, %d of %d missed' % (1000.0 * times[1] / frames, float(evaluated[1]) / frames, exhaustiveMisses, frames))
+
+if __name__ == '__main__':
+    bench()